@@ -1,78 +1,244 @@
-import requests
-from requests.auth import HTTPBasicAuth
-import json
+"""
+Exportación masiva de documentos de Alfresco a JSON Lines (un documento por línea).
+
+Descubre los nodos página a página, descarga con un pool concurrente acotado (sesión
+HTTP compartida) y extrae el texto en procesos worker (motor de extracción). Cada
+documento se escribe en cuanto termina, así que la memoria no crece con el corpus.
+
+Uso:
+  python alfresco_AI.py -o export.jsonl                 # hijos de -root-
+  python alfresco_AI.py --folder <nodeId> --recursive -o export.jsonl.gz
+  python alfresco_AI.py -o export.jsonl --resume        # omite los nodeId ya exportados
+  python alfresco_AI.py -o -                            # a stdout
+"""
 import os
+import sys
+import gzip
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, Any, Iterator, Set, IO, Optional
+
+from dotenv import load_dotenv
+load_dotenv()
+
+from alfresco_http import get_client
+from list_docs import NODES_BASE, NODE_METADATA_INCLUDE, MAX_CHARS_DEFAULT, get_document_with_content, content_fetch_failed
+
+EXPORT_CONCURRENCY = int(os.getenv("EXPORT_CONCURRENCY", "8"))
+EXPORT_PAGE_SIZE = int(os.getenv("EXPORT_PAGE_SIZE", "100"))
+
+
+def iter_files(folder_id: str = "-root-", recursive: bool = False, page_size: int = EXPORT_PAGE_SIZE) -> Iterator[Dict[str, Any]]:
+    """Hijos (archivos) de una carpeta vía API de nodos, página a página."""
+    client = get_client()
+    pending = [folder_id]
+    while pending:
+        current = pending.pop()
+        skip = 0
+        while True:
+            r = client.get(
+                f"{NODES_BASE}/{current}/children",
+                endpoint="metadata",
+                params={"skipCount": skip, "maxItems": page_size, "include": NODE_METADATA_INCLUDE},
+            )
+            r.raise_for_status()
+            data = r.json().get("list", {})
+            for it in data.get("entries", []):
+                node = it["entry"]
+                if node.get("isFile"):
+                    yield node
+                elif recursive and node.get("isFolder"):
+                    pending.append(node["id"])
+            if not data.get("pagination", {}).get("hasMoreItems"):
+                break
+            skip += page_size
+
+
+def _open_text(path: str, mode: str) -> IO[str]:
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def load_exported_ids(path: str) -> Set[str]:
+    """
+    nodeIds ya exportados sin error en la salida. Si la última ejecución se cortó a mitad
+    de una línea (o de un miembro gzip), o quedaron registros con error (que se van a
+    reintentar) o repetidos, se reescriben solo los registros válidos.
+    """
+    done: Set[str] = set()
+    if not os.path.exists(path):
+        return done
+    valid = []
+    rewrite = False
+    try:
+        with _open_text(path, "r") as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    rewrite = True
+                    continue
+                # Los registros con error se reintentan al reanudar: se quitan para no duplicar el nodo
+                if "error" in rec or rec["nodeId"] in done:
+                    rewrite = True
+                    continue
+                done.add(rec["nodeId"])
+                valid.append(line if line.endswith("\n") else line + "\n")
+    except (EOFError, OSError):
+        rewrite = True
+    if rewrite:
+        tmp = path + ".tmp" + (".gz" if path.endswith(".gz") else "")
+        with _open_text(tmp, "w") as f:
+            f.writelines(valid)
+        os.replace(tmp, path)
+    return done
+
+
+class Progress:
+    def __init__(self, interval_s: float = 5.0, stream: IO[str] = sys.stderr):
+        self.interval_s = interval_s
+        self.stream = stream
+        self.t0 = time.perf_counter()
+        self._last = self.t0
+        self._lock = threading.Lock()
+        self.done = 0
+        self.errors = 0
+        self.skipped = 0
+        self.bytes = 0
 
-from PyPDF2 import PdfReader
-import docx2txt
-
-BASE_URL = "http://localhost:8080/alfresco/api/-default-/public/alfresco/versions/1"
-USERNAME = "admin"
-PASSWORD = "admin"
-DOWNLOAD_DIR = "downloads"
-os.makedirs(DOWNLOAD_DIR, exist_ok=True)
-
-def list_files():
-    url = f"{BASE_URL}/nodes/-root-/children"
-    response = requests.get(url, auth=HTTPBasicAuth(USERNAME, PASSWORD))
-    response.raise_for_status()
-    return response.json().get("list", {}).get("entries", [])
-
-def download_file(node_id, file_name):
-    url = f"{BASE_URL}/nodes/{node_id}/content?attachment=true"
-    response = requests.get(url, auth=HTTPBasicAuth(USERNAME, PASSWORD), stream=True)
-    response.raise_for_status()
-    file_path = os.path.join(DOWNLOAD_DIR, file_name)
-    with open(file_path, "wb") as f:
-        for chunk in response.iter_content(chunk_size=8192):
-            f.write(chunk)
-    return file_path
-
-def extract_text(file_path):
-    ext = os.path.splitext(file_path)[1].lower()
-    text = ""
+    def record(self, ok: bool, nbytes: int) -> None:
+        with self._lock:
+            self.done += 1
+            self.errors += 0 if ok else 1
+            self.bytes += nbytes
+            now = time.perf_counter()
+            if now - self._last >= self.interval_s:
+                self._last = now
+                self.report()
+
+    def skip(self) -> None:
+        with self._lock:
+            self.skipped += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        elapsed = time.perf_counter() - self.t0
+        return {
+            "exported": self.done,
+            "errors": self.errors,
+            "skipped": self.skipped,
+            "bytesDownloaded": self.bytes,
+            "seconds": round(elapsed, 2),
+            "docsPerSecond": round(self.done / elapsed, 2) if elapsed else 0.0,
+            "mbPerSecond": round(self.bytes / 1024 / 1024 / elapsed, 2) if elapsed else 0.0,
+        }
+
+    def report(self) -> None:
+        s = self.snapshot()
+        print(
+            f"[{s['seconds']:.0f}s] {s['exported']} exportados ({s['errors']} con error, {s['skipped']} omitidos) "
+            f"- {s['docsPerSecond']} docs/s, {s['mbPerSecond']} MB/s",
+            file=self.stream, flush=True,
+        )
+
+
+def _export_one(node: Dict[str, Any], max_chars: int) -> Dict[str, Any]:
     try:
-        if ext == ".pdf":
-            reader = PdfReader(file_path)
-            for page in reader.pages:
-                text += page.extract_text() + "\n"
-        elif ext in [".docx", ".doc"]:
-            text = docx2txt.process(file_path)
-        elif ext == ".txt":
-            with open(file_path, "r", encoding="utf-8") as f:
-                text = f.read()
-        else:
-            text = "[Formato no soportado]"
+        doc = get_document_with_content(node["id"], max_chars=max_chars, meta=node)
     except Exception as e:
-        text = f"[Error extrayendo texto: {e}]"
-    return text.strip()
+        return {"nodeId": node["id"], "nombre": node.get("name"), "texto": "", "error": f"Error descargando o procesando: {e}"}
+    rec = {
+        "nodeId": node["id"],
+        "nombre": node.get("name"),
+        "ruta": (node.get("path") or {}).get("name", ""),
+        "mimeType": doc.get("contentMimeDetected"),
+        "modifiedAt": node.get("modifiedAt"),
+        "texto": doc.get("contentText") or "",
+        "truncado": bool(doc.get("contentTextTruncated")),
+        "bytesLeidos": doc.get("contentBytesRead") or 0,
+    }
+    if doc.get("contentNote"):
+        rec["nota"] = doc["contentNote"]
+    # get_document_with_content no lanza si la descarga falla: lo indica en el documento
+    if content_fetch_failed(doc):
+        rec["error"] = doc.get("contentNote") or "Descarga o extracción incompleta"
+    return rec
+
+
+def export(nodes: Iterator[Dict[str, Any]], out: IO[str], concurrency: int = EXPORT_CONCURRENCY,
+           max_chars: int = MAX_CHARS_DEFAULT, skip_ids: Optional[Set[str]] = None,
+           progress: Optional[Progress] = None) -> Dict[str, Any]:
+    """
+    Descarga y extrae con un máximo de `concurrency` documentos en curso (y el doble en
+    ventana), escribiendo cada registro en `out` al terminar.
+    """
+    skip_ids = skip_ids or set()
+    progress = progress or Progress()
+    window = max(1, concurrency) * 2
+    in_flight = set()
+
+    def drain(block_until: int) -> None:
+        nonlocal in_flight
+        while len(in_flight) > block_until:
+            finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                rec = fut.result()
+                out.write(json.dumps(rec, ensure_ascii=False) + "\n")
+                progress.record("error" not in rec, rec.get("bytesLeidos", 0))
+            out.flush()
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        for node in nodes:
+            if node["id"] in skip_ids:
+                progress.skip()
+                continue
+            in_flight.add(pool.submit(_export_one, node, max_chars))
+            drain(window - 1)
+        drain(0)
+    return progress.snapshot()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exportación masiva de documentos de Alfresco a JSON Lines")
+    parser.add_argument("-o", "--output", default="export.jsonl", help="Archivo de salida (.jsonl o .jsonl.gz; '-' para stdout)")
+    parser.add_argument("--folder", default="-root-", help="nodeId de la carpeta inicial (por defecto -root-)")
+    parser.add_argument("--recursive", action="store_true", help="Recorrer subcarpetas")
+    parser.add_argument("--concurrency", type=int, default=EXPORT_CONCURRENCY, help="Descargas simultáneas")
+    parser.add_argument("--page-size", type=int, default=EXPORT_PAGE_SIZE)
+    parser.add_argument("--max-chars", type=int, default=MAX_CHARS_DEFAULT, help="Máx. caracteres de texto por documento")
+    parser.add_argument("--resume", action="store_true", help="Omitir los nodeId ya exportados sin error (los registros con error se reintentan)")
+    parser.add_argument("--gzip", action="store_true", help="Comprimir la salida (añade .gz si falta)")
+    args = parser.parse_args()
+
+    output = args.output
+    if args.gzip and output != "-" and not output.endswith(".gz"):
+        output += ".gz"
+
+    skip_ids: Set[str] = set()
+    if output == "-":
+        out = sys.stdout
+    else:
+        if args.resume:
+            skip_ids = load_exported_ids(output)
+            print(f"Reanudando: {len(skip_ids)} documentos ya exportados en {output}", file=sys.stderr)
+        out = _open_text(output, "a" if args.resume else "w")
+
+    try:
+        summary = export(
+            iter_files(args.folder, args.recursive, args.page_size),
+            out,
+            concurrency=args.concurrency,
+            max_chars=args.max_chars,
+            skip_ids=skip_ids,
+        )
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    print(json.dumps(summary, ensure_ascii=False), file=sys.stderr)
+
 
 if __name__ == "__main__":
-    entries = list_files()
-    result_json = []
-
-    for entry in entries:
-        node = entry["entry"]
-        node_id = node["id"]
-        file_name = node["name"]
-        is_file = node.get("isFile", False)
-
-        if not is_file:
-            print(f"Omitido (no es un archivo): {file_name}")
-            continue
-
-        print(f"Procesando: {file_name}")
-        try:
-            file_path = download_file(node_id, file_name)
-            text = extract_text(file_path)
-        except Exception as e:
-            text = f"[Error descargando o procesando: {e}]"
-
-        result_json.append({
-            "nodeId": node_id,
-            "nombre": file_name,
-            "texto": text
-        })
-
-    print(json.dumps(result_json, indent=2, ensure_ascii=False))
-6
\ No newline at end of file
+    main()
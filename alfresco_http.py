@@ -0,0 +1,373 @@
+import os
+import time
+import base64
+import random
+import asyncio
+import threading
+from http.cookiejar import DefaultCookiePolicy
+from typing import Dict, Any, Optional, Tuple, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import UPSTREAM_SECONDS, UPSTREAM_ERRORS, UPSTREAM_RETRIES, record_stage
+
+# Cliente asíncrono (opcional)
+try:
+    import aiohttp
+except Exception:
+    aiohttp = None
+
+ALFRESCO_USERNAME = os.getenv("ALFRESCO_USERNAME", "admin")
+ALFRESCO_PASSWORD = os.getenv("ALFRESCO_PASSWORD", "admin")
+
+# Pool de conexiones (keep-alive) compartido por todas las llamadas a Alfresco
+HTTP_POOL_SIZE = int(os.getenv("ALFRESCO_HTTP_POOL_SIZE", "20"))
+HTTP_POOL_BLOCK = os.getenv("ALFRESCO_HTTP_POOL_BLOCK", "false").lower() in ("1", "true", "yes")
+HTTP_MAX_RETRIES = int(os.getenv("ALFRESCO_HTTP_MAX_RETRIES", "3"))
+HTTP_BACKOFF_FACTOR = float(os.getenv("ALFRESCO_HTTP_BACKOFF", "0.3"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("ALFRESCO_CONNECT_TIMEOUT", "5"))
+
+# Timeouts de lectura por tipo de endpoint (segundos)
+ENDPOINT_TIMEOUTS: Dict[str, float] = {
+    "search": float(os.getenv("ALFRESCO_TIMEOUT_SEARCH", "30")),
+    "metadata": float(os.getenv("ALFRESCO_TIMEOUT_METADATA", "30")),
+    "content": float(os.getenv("ALFRESCO_TIMEOUT_CONTENT", "60")),
+}
+DEFAULT_READ_TIMEOUT = 30.0
+
+# Estados HTTP transitorios que vale la pena reintentar en llamadas idempotentes
+RETRY_STATUSES = frozenset({429, 502, 503, 504})
+
+Timeout = Union[float, Tuple[float, float]]
+
+
+def build_auth_header(username: str = ALFRESCO_USERNAME, password: str = ALFRESCO_PASSWORD) -> Dict[str, str]:
+    token = base64.b64encode(f"{username}:{password}".encode()).decode()
+    return {"Authorization": f"Basic {token}"}
+
+
+class _NoCookies(DefaultCookiePolicy):
+    # La autenticación es Basic en cada request: no guardamos cookies (JSESSIONID)
+    # para que la sesión compartida no tenga estado mutable entre hilos.
+    def set_ok(self, cookie, request):
+        return False
+
+
+class AlfrescoHttpClient:
+    """
+    Cliente HTTP compartido para Alfresco: un requests.Session con pool de conexiones
+    keep-alive, cabecera de autenticación calculada una sola vez, timeouts por endpoint
+    y reintentos con backoff exponencial para llamadas idempotentes.
+    """
+
+    def __init__(
+        self,
+        pool_size: int = HTTP_POOL_SIZE,
+        pool_block: bool = HTTP_POOL_BLOCK,
+        max_retries: int = HTTP_MAX_RETRIES,
+        backoff_factor: float = HTTP_BACKOFF_FACTOR,
+        connect_timeout: float = HTTP_CONNECT_TIMEOUT,
+        endpoint_timeouts: Optional[Dict[str, float]] = None,
+        auth_header: Optional[Dict[str, str]] = None,
+    ):
+        self.pool_size = pool_size
+        self.max_retries = max(0, max_retries)
+        self.backoff_factor = backoff_factor
+        self.connect_timeout = connect_timeout
+        self.endpoint_timeouts = dict(endpoint_timeouts or ENDPOINT_TIMEOUTS)
+        self.auth_header = dict(auth_header or build_auth_header())
+
+        self._adapter = HTTPAdapter(
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+            pool_block=pool_block,
+            max_retries=0,  # los reintentos los gestionamos aquí, solo para llamadas idempotentes
+        )
+        self.session = requests.Session()
+        self.session.cookies.set_policy(_NoCookies())
+        self.session.mount("http://", self._adapter)
+        self.session.mount("https://", self._adapter)
+        self.session.headers.update({**self.auth_header, "Connection": "keep-alive"})
+
+        self._lock = threading.Lock()
+        self._counters: Dict[str, int] = {"requests": 0, "retries": 0, "errors": 0, "inFlight": 0}
+        self._per_endpoint: Dict[str, Dict[str, float]] = {}
+
+    def timeout_for(self, endpoint: str, timeout: Optional[Timeout] = None) -> Timeout:
+        if timeout is not None:
+            return timeout
+        return (self.connect_timeout, self.endpoint_timeouts.get(endpoint, DEFAULT_READ_TIMEOUT))
+
+    def _backoff(self, attempt: int) -> float:
+        base = self.backoff_factor * (2 ** attempt)
+        return base + random.uniform(0, base / 2)
+
+    def _record(self, endpoint: str, elapsed: float, error: bool) -> None:
+        UPSTREAM_SECONDS.observe(elapsed, endpoint=endpoint, client="sync")
+        record_stage(endpoint, elapsed)
+        if error:
+            UPSTREAM_ERRORS.inc(endpoint=endpoint, client="sync")
+        with self._lock:
+            self._counters["inFlight"] -= 1
+            ep = self._per_endpoint.setdefault(endpoint, {"requests": 0, "errors": 0, "totalSeconds": 0.0})
+            ep["requests"] += 1
+            ep["totalSeconds"] += elapsed
+            if error:
+                ep["errors"] += 1
+                self._counters["errors"] += 1
+
+    def request(
+        self,
+        method: str,
+        url: str,
+        endpoint: str = "default",
+        idempotent: Optional[bool] = None,
+        timeout: Optional[Timeout] = None,
+        **kwargs: Any,
+    ) -> requests.Response:
+        """
+        Ejecuta la petición sobre el pool compartido. Si la llamada es idempotente
+        (GET/HEAD por defecto, o idempotent=True explícito) reintenta ante errores
+        de conexión y estados transitorios (429/502/503/504) con backoff.
+        """
+        method = method.upper()
+        if idempotent is None:
+            idempotent = method in ("GET", "HEAD", "OPTIONS")
+        attempts = 1 + (self.max_retries if idempotent else 0)
+        eff_timeout = self.timeout_for(endpoint, timeout)
+
+        with self._lock:
+            self._counters["requests"] += 1
+            self._counters["inFlight"] += 1
+        started = time.perf_counter()
+        attempt = 0
+        try:
+            while True:
+                try:
+                    resp = self.session.request(method, url, timeout=eff_timeout, **kwargs)
+                except (requests.ConnectionError, requests.Timeout):
+                    if attempt + 1 >= attempts:
+                        raise
+                else:
+                    if resp.status_code not in RETRY_STATUSES or attempt + 1 >= attempts:
+                        self._record(endpoint, time.perf_counter() - started, resp.status_code >= 400)
+                        return resp
+                    resp.close()
+                attempt += 1
+                UPSTREAM_RETRIES.inc(endpoint=endpoint, client="sync")
+                with self._lock:
+                    self._counters["retries"] += 1
+                time.sleep(self._backoff(attempt - 1))
+        except Exception:
+            self._record(endpoint, time.perf_counter() - started, True)
+            raise
+
+    def get(self, url: str, endpoint: str = "default", **kwargs: Any) -> requests.Response:
+        return self.request("GET", url, endpoint=endpoint, **kwargs)
+
+    def post(self, url: str, endpoint: str = "default", **kwargs: Any) -> requests.Response:
+        return self.request("POST", url, endpoint=endpoint, **kwargs)
+
+    def stats(self) -> Dict[str, Any]:
+        pools = []
+        pm = self._adapter.poolmanager
+        if pm is not None:
+            for key in list(pm.pools.keys()):
+                pool = pm.pools.get(key)
+                if pool is None:
+                    continue
+                pools.append({
+                    "host": f"{pool.scheme}://{pool.host}:{pool.port}",
+                    "maxSize": pool.pool.maxsize if pool.pool is not None else 0,
+                    # La cola del pool se rellena con None para los huecos sin conexión abierta
+                    "idleConnections": sum(1 for c in list(pool.pool.queue) if c is not None) if pool.pool is not None else 0,
+                    "connectionsCreated": pool.num_connections,
+                    "requestsServed": pool.num_requests,
+                })
+        with self._lock:
+            return {
+                "poolSize": self.pool_size,
+                "maxRetries": self.max_retries,
+                "timeouts": dict(self.endpoint_timeouts),
+                **self._counters,
+                "endpoints": {k: dict(v) for k, v in self._per_endpoint.items()},
+                "pools": pools,
+            }
+
+    def close(self) -> None:
+        self.session.close()
+
+
+_client: Optional[AlfrescoHttpClient] = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> AlfrescoHttpClient:
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = AlfrescoHttpClient()
+    return _client
+
+
+def reset_client() -> None:
+    """Cierra el cliente compartido; el siguiente get_client() crea uno nuevo (p.ej. tras fork)."""
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+        _client = None
+
+
+class AsyncAlfrescoHttpClient:
+    """
+    Equivalente asyncio de AlfrescoHttpClient sobre aiohttp: mismo pool configurable,
+    cabecera de auth única, timeouts por endpoint y reintentos idempotentes.
+    """
+
+    def __init__(
+        self,
+        pool_size: int = HTTP_POOL_SIZE,
+        max_retries: int = HTTP_MAX_RETRIES,
+        backoff_factor: float = HTTP_BACKOFF_FACTOR,
+        connect_timeout: float = HTTP_CONNECT_TIMEOUT,
+        endpoint_timeouts: Optional[Dict[str, float]] = None,
+        auth_header: Optional[Dict[str, str]] = None,
+    ):
+        if aiohttp is None:
+            raise RuntimeError("aiohttp no instalado: requerido para el cliente asíncrono de Alfresco")
+        self.pool_size = pool_size
+        self.max_retries = max(0, max_retries)
+        self.backoff_factor = backoff_factor
+        self.connect_timeout = connect_timeout
+        self.endpoint_timeouts = dict(endpoint_timeouts or ENDPOINT_TIMEOUTS)
+        self.auth_header = dict(auth_header or build_auth_header())
+        self._connector = aiohttp.TCPConnector(limit=pool_size, limit_per_host=pool_size)
+        self.session = aiohttp.ClientSession(
+            headers=self.auth_header,
+            connector=self._connector,
+            cookie_jar=aiohttp.DummyCookieJar(),
+        )
+        self._counters: Dict[str, int] = {"requests": 0, "retries": 0, "errors": 0, "inFlight": 0}
+        self._per_endpoint: Dict[str, Dict[str, float]] = {}
+
+    def timeout_for(self, endpoint: str, timeout: Optional[Timeout] = None) -> "aiohttp.ClientTimeout":
+        if isinstance(timeout, tuple):
+            return aiohttp.ClientTimeout(sock_connect=timeout[0], sock_read=timeout[1])
+        read = timeout if timeout is not None else self.endpoint_timeouts.get(endpoint, DEFAULT_READ_TIMEOUT)
+        return aiohttp.ClientTimeout(sock_connect=self.connect_timeout, sock_read=read)
+
+    def _backoff(self, attempt: int) -> float:
+        base = self.backoff_factor * (2 ** attempt)
+        return base + random.uniform(0, base / 2)
+
+    def _record(self, endpoint: str, elapsed: float, error: bool) -> None:
+        # Todo ocurre en el event loop: no hace falta lock
+        UPSTREAM_SECONDS.observe(elapsed, endpoint=endpoint, client="async")
+        record_stage(endpoint, elapsed)
+        if error:
+            UPSTREAM_ERRORS.inc(endpoint=endpoint, client="async")
+        self._counters["inFlight"] -= 1
+        ep = self._per_endpoint.setdefault(endpoint, {"requests": 0, "errors": 0, "totalSeconds": 0.0})
+        ep["requests"] += 1
+        ep["totalSeconds"] += elapsed
+        if error:
+            ep["errors"] += 1
+            self._counters["errors"] += 1
+
+    async def request(
+        self,
+        method: str,
+        url: str,
+        endpoint: str = "default",
+        idempotent: Optional[bool] = None,
+        timeout: Optional[Timeout] = None,
+        stream: bool = False,
+        **kwargs: Any,
+    ) -> "aiohttp.ClientResponse":
+        """
+        Igual que AlfrescoHttpClient.request. Sin stream el cuerpo ya viene leído y la
+        conexión devuelta al pool; con stream=True el llamador debe liberar la respuesta
+        con `resp.release()`.
+        """
+        method = method.upper()
+        if idempotent is None:
+            idempotent = method in ("GET", "HEAD", "OPTIONS")
+        attempts = 1 + (self.max_retries if idempotent else 0)
+        eff_timeout = self.timeout_for(endpoint, timeout)
+
+        self._counters["requests"] += 1
+        self._counters["inFlight"] += 1
+        started = time.perf_counter()
+        attempt = 0
+        try:
+            while True:
+                try:
+                    resp = await self.session.request(method, url, timeout=eff_timeout, **kwargs)
+                    if not stream:
+                        await resp.read()
+                        resp.release()
+                except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                    if attempt + 1 >= attempts:
+                        raise
+                else:
+                    if resp.status not in RETRY_STATUSES or attempt + 1 >= attempts:
+                        self._record(endpoint, time.perf_counter() - started, resp.status >= 400)
+                        return resp
+                    resp.release()
+                attempt += 1
+                UPSTREAM_RETRIES.inc(endpoint=endpoint, client="async")
+                self._counters["retries"] += 1
+                await asyncio.sleep(self._backoff(attempt - 1))
+        except Exception:
+            self._record(endpoint, time.perf_counter() - started, True)
+            raise
+
+    async def get(self, url: str, endpoint: str = "default", **kwargs: Any) -> "aiohttp.ClientResponse":
+        return await self.request("GET", url, endpoint=endpoint, **kwargs)
+
+    async def post(self, url: str, endpoint: str = "default", **kwargs: Any) -> "aiohttp.ClientResponse":
+        return await self.request("POST", url, endpoint=endpoint, **kwargs)
+
+    def stats(self) -> Dict[str, Any]:
+        idle = sum(len(conns) for conns in getattr(self._connector, "_conns", {}).values())
+        acquired = len(getattr(self._connector, "_acquired", ()))
+        return {
+            "poolSize": self.pool_size,
+            "maxRetries": self.max_retries,
+            "timeouts": dict(self.endpoint_timeouts),
+            **self._counters,
+            "endpoints": {k: dict(v) for k, v in self._per_endpoint.items()},
+            "idleConnections": idle,
+            "activeConnections": acquired,
+        }
+
+    async def aclose(self) -> None:
+        await self.session.close()
+
+
+_async_client: Optional[AsyncAlfrescoHttpClient] = None
+
+
+def get_async_client() -> AsyncAlfrescoHttpClient:
+    # Se crea dentro del event loop que lo usará (aiohttp liga la sesión al loop)
+    global _async_client
+    if _async_client is None:
+        _async_client = AsyncAlfrescoHttpClient()
+    return _async_client
+
+
+async def aclose_async_client() -> None:
+    global _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+    _async_client = None
+
+
+def pool_stats() -> Dict[str, Any]:
+    stats = {"sync": get_client().stats()}
+    if _async_client is not None:
+        stats["async"] = _async_client.stats()
+    return stats
@@ -1,26 +1,77 @@
 import os
-from typing import Optional, Literal
-from fastapi import FastAPI, Query, HTTPException
+import sys
+import json
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, Optional, Literal, List, AsyncIterator
+from fastapi import FastAPI, Query, HTTPException, Request, Response
+from pydantic import BaseModel, Field
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Paralelismo máximo hacia Alfresco dentro de una petición batch
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "50"))
+# Worker de ingesta en el mismo proceso (también puede correr aparte: python ingestion.py run)
+INGEST_WORKER_ENABLED = os.getenv("INGEST_WORKER_ENABLED", "false").lower() in ("1", "true", "yes")
+# Estrategia por defecto de la búsqueda multi-site: "single" (un OR de PATH) o "fanout" (una consulta por site)
+SEARCH_STRATEGY = os.getenv("SEARCH_STRATEGY", "single").lower()
+# Máximo de caracteres por ventana en /documents/{nodeId}/text
+TEXT_WINDOW_MAX_CHARS = int(os.getenv("TEXT_WINDOW_MAX_CHARS", "200000"))
+
 from list_docs import (
+    DEFAULT_PAGE_SIZE,
+    DEFAULT_MAX_DOCS,
+    MAX_CHARS_DEFAULT,
+    TEXT_WINDOW_DEFAULT_CHARS,
+)
+from list_docs_async import (
     list_sites,
     get_document_library_folder,
     list_folder_children,
     search_documents,
+    search_documents_fanout,
+    FANOUT_SITE_TIMEOUT_S,
     get_node_metadata,
+    NODE_MODIFIED_FIELDS,
     get_document_with_content,
-    DEFAULT_PAGE_SIZE,
-    DEFAULT_MAX_DOCS,
-    MAX_CHARS_DEFAULT,
+    get_text_window,
+    iter_folder_children,
+    iter_search_documents,
 )
+from alfresco_http import pool_stats, aclose_async_client
+from text_cache import get_text_cache
+from extraction import extraction_stats, get_extraction_engine
+from content_buffer import download_buffer_stats
+from response_cache import get_search_cache, search_cache_status
+from rag_index import get_rag_index
+from hierarchy_cache import get_hierarchy_cache, aclose_hierarchy_cache
+from ingestion import EVENT_TYPES, INGEST_QUEUE_DB, get_ingest_queue, get_ingestion_worker
+from metrics import GaugeCallback, ServerTimingMiddleware, render as render_metrics, stage
+import fast_json
 
-app = FastAPI(title="Alfresco Search Backend", version="1.2.2")
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    if INGEST_WORKER_ENABLED:
+        get_ingestion_worker().start()
+    yield
+    if INGEST_WORKER_ENABLED:
+        await asyncio.to_thread(get_ingestion_worker().stop)
+    await aclose_hierarchy_cache()
+    await aclose_async_client()
+    get_extraction_engine().shutdown()
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse serializada con fast_json (orjson si está instalado)."""
+
+    def render(self, content: Any) -> bytes:
+        return fast_json.dumps(content)
+
+app = FastAPI(title="Alfresco Search Backend", version="1.3.0", lifespan=lifespan, default_response_class=FastJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -28,29 +79,194 @@ app.add_middleware(
     allow_credentials=False,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Cache", "Server-Timing"],
 )
+# Se añade después de CORS para quedar por fuera: también mide las respuestas de error
+app.add_middleware(ServerTimingMiddleware)
 
 app.mount("/static", StaticFiles(directory="static", html=True), name="static")
 
 @app.get("/")
-def root():
+async def root():
     return FileResponse("static/index.html")
 
+def _cache_counters():
+    # Contadores de las cachés existentes, leídos en cada scrape de /metrics
+    values = {}
+    for name, cache in (("text", get_text_cache()), ("search", get_search_cache()), ("hierarchy", get_hierarchy_cache())):
+        if cache is None:
+            continue
+        for key, value in cache.stats().items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                values[(name, key)] = value
+    return values
+
+def _extraction_gauges():
+    stats = extraction_stats()
+    return {("inFlight",): stats.get("inFlight", 0), ("queueDepth",): stats.get("queueDepth", 0)}
+
+def _ingest_gauges():
+    stats = get_ingest_queue().stats()
+    return {(key,): stats[key] for key in ("pending", "inFlight", "deadEvents", "oldestEventAgeS")}
+
+GaugeCallback("cache_stats", "Contadores y tamaños de las cachés (texto, búsqueda, jerarquía)", _cache_counters, ("cache", "stat"))
+GaugeCallback("extraction_pool", "Estado del pool de extracción", _extraction_gauges, ("stat",))
+# Sin worker ni cola ya creada no hay nada que medir (y no se crea la base de la cola por un scrape)
+if INGEST_WORKER_ENABLED or os.path.exists(INGEST_QUEUE_DB):
+    GaugeCallback("ingest_queue", "Cola de ingesta: pendientes, en curso, descartados y antigüedad del evento más viejo (s)", _ingest_gauges, ("stat",))
+
+@app.get("/metrics")
+async def api_metrics():
+    """Métricas en formato de exposición de Prometheus."""
+    # Los gauges leen SQLite (caché de texto, cola de ingesta): fuera del event loop
+    return Response(await asyncio.to_thread(render_metrics), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/admin/http-pool")
+async def api_http_pool_stats():
+    """Estadísticas del pool de conexiones HTTP hacia Alfresco (monitoreo)."""
+    return pool_stats()
+
+@app.get("/admin/text-cache")
+async def api_text_cache_stats():
+    """Contadores de la caché de texto extraído (hits/misses/evictions)."""
+    cache = get_text_cache()
+    return cache.stats() if cache else {"enabled": False}
+
+@app.delete("/admin/text-cache")
+async def api_text_cache_clear():
+    cache = get_text_cache()
+    return {"invalidated": cache.invalidate() if cache else 0}
+
+@app.delete("/admin/text-cache/{nodeId}")
+async def api_text_cache_invalidate(nodeId: str):
+    cache = get_text_cache()
+    return {"nodeId": nodeId, "invalidated": cache.invalidate(nodeId) if cache else 0}
+
+@app.get("/admin/extraction")
+async def api_extraction_stats():
+    """Cola y tiempos del motor de extracción de texto, por tipo MIME."""
+    return extraction_stats()
+
+@app.get("/admin/downloads")
+async def api_download_stats():
+    """Memoria en uso por descargas, volcados a disco y RSS pico del proceso."""
+    return download_buffer_stats()
+
+@app.get("/admin/ingestion")
+async def api_ingestion_stats():
+    """Cola de ingesta (pendientes, retraso) y throughput del worker de este proceso."""
+    queue_stats = await asyncio.to_thread(get_ingest_queue().stats)
+    worker = get_ingestion_worker().stats() if INGEST_WORKER_ENABLED else {"running": False}
+    return {"queue": queue_stats, "worker": worker}
+
+class IngestEvent(BaseModel):
+    nodeId: str
+    eventType: Literal[EVENT_TYPES] = "updated"
+    modifiedAt: Optional[str] = None
+
+class IngestEventsRequest(BaseModel):
+    events: List[IngestEvent] = Field(..., min_length=1, max_length=1000)
+
+@app.post("/admin/ingestion/events")
+async def api_ingestion_enqueue(req: IngestEventsRequest):
+    """Encola eventos de nodos creados/modificados/borrados para precalcular su texto."""
+    try:
+        accepted = await asyncio.to_thread(get_ingest_queue().enqueue, [ev.model_dump() for ev in req.events])
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if INGEST_WORKER_ENABLED:
+        get_ingestion_worker().wake()
+    return {"enqueued": accepted}
+
+@app.get("/admin/search-cache")
+async def api_search_cache_stats():
+    cache = get_search_cache()
+    return cache.stats() if cache else {"enabled": False}
+
+@app.delete("/admin/search-cache")
+async def api_search_cache_clear():
+    cache = get_search_cache()
+    return {"invalidated": cache.clear() if cache else 0}
+
+@app.get("/admin/hierarchy-cache")
+async def api_hierarchy_cache_stats():
+    """Caché de jerarquía (documentLibrary por site, hijos de carpetas y prefetch)."""
+    cache = get_hierarchy_cache()
+    return cache.stats() if cache else {"enabled": False}
+
+@app.delete("/admin/hierarchy-cache")
+async def api_hierarchy_cache_clear(folderId: Optional[str] = Query(None, description="Solo esta carpeta")):
+    cache = get_hierarchy_cache()
+    return {"invalidated": cache.invalidate(folderId) if cache else 0}
+
+@app.get("/admin/rag-index")
+async def api_rag_index_stats():
+    """Tamaño del índice local de fragmentos (documentos, fragmentos, términos)."""
+    try:
+        return get_rag_index().stats()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/admin/rag-index/reload")
+async def api_rag_index_reload():
+    """Recarga el índice desde disco (tras `python rag_index.py build`)."""
+    try:
+        index = await asyncio.to_thread(get_rag_index, True)
+        return index.stats()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+def _use_search_cache(request: Request) -> bool:
+    # Cache-Control: no-cache fuerza la consulta a Alfresco
+    return "no-cache" not in (request.headers.get("cache-control") or "").lower()
+
+def _set_cache_header(response: Response) -> None:
+    response.headers["X-Cache"] = search_cache_status.get() or "BYPASS"
+
+FIELDS_QUERY = Query(None, description="CSV de campos a devolver por entrada (p.ej. id,name); por defecto, todos")
+
+def _parse_fields(fields: Optional[str]) -> Optional[List[str]]:
+    names = [f.strip() for f in (fields or "").split(",") if f.strip()]
+    return names or None
+
+def _project(result: dict, fields: Optional[List[str]]) -> dict:
+    """
+    Proyección de primer nivel: en listados se aplica a cada entrada, en un nodo al objeto.
+    Siempre crea dicts nuevos: los resultados pueden venir compartidos de una caché.
+    """
+    if not fields:
+        return result
+    if isinstance(result.get("entries"), list):
+        return {**result, "entries": [{k: e[k] for k in fields if k in e} for e in result["entries"]]}
+    return {k: result[k] for k in fields if k in result}
+
+def _json_response(result: Any, response: Response, fields: Optional[List[str]] = None) -> FastJSONResponse:
+    """
+    Respuesta serializada directamente con fast_json: devolver un dict haría pasar cada
+    valor por jsonable_encoder, que en páginas de 200 entradas cuesta más que el propio
+    JSON. Conserva las cabeceras ya puestas en `response` (X-Cache).
+    """
+    return FastJSONResponse(_project(result, fields), headers=dict(response.headers))
+
 @app.get("/sites")
-def api_list_sites(
+async def api_list_sites(
+    response: Response,
     maxItems: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=200),
     skipCount: int = Query(0, ge=0),
     q: str = Query("", description="Filtro por nombre/título del site"),
+    fields: Optional[str] = FIELDS_QUERY,
 ):
     try:
-        return list_sites(max_items=maxItems, skip_count=skipCount, query_text=q)
+        result = await list_sites(max_items=maxItems, skip_count=skipCount, query_text=q)
+        return _json_response(result, response, _parse_fields(fields))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/sites/{siteId}/document-library")
-def api_get_document_library(siteId: str):
+async def api_get_document_library(siteId: str):
     try:
-        dl = get_document_library_folder(siteId)
+        cache = get_hierarchy_cache()
+        dl = await (cache.get_document_library(siteId) if cache else get_document_library_folder(siteId))
         if not dl:
             raise HTTPException(status_code=404, detail="documentLibrary no encontrada para el site")
         return dl
@@ -60,50 +276,154 @@ def api_get_document_library(siteId: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/folders/{folderId}/children")
-def api_list_folder_children(
+async def api_list_folder_children(
+    request: Request,
+    response: Response,
     folderId: str,
     type: Literal["files", "folders", "all"] = Query("all"),
     maxItems: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=200),
     skipCount: int = Query(0, ge=0),
     excludeSystemAndGenerated: bool = Query(True),
+    prefetch: bool = Query(True, description="Precargar en segundo plano las subcarpetas"),
+    fields: Optional[str] = FIELDS_QUERY,
 ):
     try:
-        return list_folder_children(
+        cache = get_hierarchy_cache() if _use_search_cache(request) else None
+        if cache is not None:
+            result, status = await cache.get_children(
+                folderId, type, maxItems, skipCount, excludeSystemAndGenerated, prefetch=prefetch,
+            )
+            response.headers["X-Cache"] = status
+            return _json_response(result, response, _parse_fields(fields))
+        result = await list_folder_children(
             folder_id=folderId,
             item_type=type,
             max_items=maxItems,
             skip_count=skipCount,
             exclude_system_and_generated=excludeSystemAndGenerated,
+            use_cache=_use_search_cache(request),
         )
+        _set_cache_header(response)
+        return _json_response(result, response, _parse_fields(fields))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/search/documents")
-def api_search_documents(
+async def api_search_documents(
+    request: Request,
+    response: Response,
     q: str = Query("", description="Nombre del archivo o texto libre"),
     siteIds: Optional[str] = Query(None, description="CSV de site IDs"),
     folderId: Optional[str] = Query(None, description="Node ID de carpeta (búsqueda recursiva)"),
     maxItems: int = Query(DEFAULT_MAX_DOCS, ge=1, le=200),
     skipCount: int = Query(0, ge=0),
     includeSnippets: bool = Query(True),
+    strategy: Optional[Literal["single", "fanout"]] = Query(None, description="single: un OR de PATH; fanout: una consulta por site"),
+    siteTimeoutMs: Optional[int] = Query(None, ge=100, le=60000, description="Timeout por site en modo fanout"),
+    fields: Optional[str] = FIELDS_QUERY,
 ):
     try:
         sites = [s.strip() for s in siteIds.split(",")] if siteIds else None
-        return search_documents(
+        if (strategy or SEARCH_STRATEGY) == "fanout" and sites and len(sites) > 1:
+            result = await search_documents_fanout(
+                query_text=q,
+                site_ids=sites,
+                folder_id=folderId,
+                max_items=maxItems,
+                skip_count=skipCount,
+                include_snippets=includeSnippets,
+                use_cache=_use_search_cache(request),
+                site_timeout_s=siteTimeoutMs / 1000.0 if siteTimeoutMs else FANOUT_SITE_TIMEOUT_S,
+            )
+            _set_cache_header(response)
+            return _json_response(result, response, _parse_fields(fields))
+        result = await search_documents(
             query_text=q,
             site_ids=sites,
             folder_id=folderId,
             max_items=maxItems,
             skip_count=skipCount,
             include_snippets=includeSnippets,
+            use_cache=_use_search_cache(request),
         )
+        _set_cache_header(response)
+        return _json_response(result, response, _parse_fields(fields))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def _ndjson_response(items: AsyncIterator[dict], limit: Optional[int], fields: Optional[List[str]] = None) -> StreamingResponse:
+    """
+    Emite un objeto JSON por línea a medida que llegan las páginas. La primera página se
+    pide antes de responder para que un error inicial siga siendo un 500; un error a mitad
+    del stream se reporta como última línea {"error": ...}.
+    """
+    try:
+        first = await items.__anext__()
+    except StopAsyncIteration:
+        first = None
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+    async def body():
+        try:
+            if first is None:
+                return
+            yield fast_json.dumps(_project(first, fields)) + b"\n"
+            count = 1
+            async for item in items:
+                if limit and count >= limit:
+                    break
+                yield fast_json.dumps(_project(item, fields)) + b"\n"
+                count += 1
+        except Exception as e:
+            yield fast_json.dumps({"error": str(e)}) + b"\n"
+        finally:
+            await items.aclose()
+
+    return StreamingResponse(body(), media_type="application/x-ndjson")
+
+@app.get("/folders/{folderId}/children/stream")
+async def api_stream_folder_children(
+    folderId: str,
+    type: Literal["files", "folders", "all"] = Query("all"),
+    pageSize: int = Query(200, ge=1, le=1000),
+    limit: Optional[int] = Query(None, ge=1, description="Máx. entradas a emitir (por defecto, todas)"),
+    excludeSystemAndGenerated: bool = Query(True),
+    fields: Optional[str] = FIELDS_QUERY,
+):
+    """
+    Todos los hijos de la carpeta como NDJSON (una entrada por línea), paginando por DBID
+    en lugar de skipCount crecientes. El orden es por DBID, no por nombre.
+    """
+    items = iter_folder_children(folderId, item_type=type, page_size=pageSize,
+                                 exclude_system_and_generated=excludeSystemAndGenerated)
+    return await _ndjson_response(items, limit, _parse_fields(fields))
+
+@app.get("/search/documents/stream")
+async def api_stream_search_documents(
+    q: str = Query("", description="Nombre del archivo o texto libre"),
+    siteIds: Optional[str] = Query(None, description="CSV de site IDs"),
+    folderId: Optional[str] = Query(None, description="Node ID de carpeta (búsqueda recursiva)"),
+    pageSize: int = Query(200, ge=1, le=1000),
+    limit: Optional[int] = Query(None, ge=1, description="Máx. resultados a emitir (por defecto, todos)"),
+    includeSnippets: bool = Query(False),
+    fields: Optional[str] = FIELDS_QUERY,
+):
+    """
+    Todos los resultados de la búsqueda como NDJSON. Sin q se pagina por DBID; con q se
+    mantiene el orden por relevancia (paginación por offset).
+    """
+    sites = [s.strip() for s in siteIds.split(",")] if siteIds else None
+    items = iter_search_documents(q, site_ids=sites, folder_id=folderId, page_size=pageSize,
+                                  include_snippets=includeSnippets)
+    return await _ndjson_response(items, limit, _parse_fields(fields))
+
 @app.get("/documents/{nodeId}")
-def api_get_document_metadata(nodeId: str):
+async def api_get_document_metadata(response: Response, nodeId: str, fields: Optional[str] = FIELDS_QUERY):
+    """Metadatos del nodo. Con fields, Alfresco ya devuelve solo esos campos."""
     try:
-        return get_node_metadata(nodeId)
+        names = _parse_fields(fields)
+        return _json_response(await get_node_metadata(nodeId, fields=names), response, names)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -124,26 +444,35 @@ def _minimal_projection(raw: dict) -> dict:
         "content": raw.get("contentText") or ""
     }
 
+def _set_content_cache_header(response: Response, raw: dict) -> None:
+    # Texto precalculado (ingesta) o de una petición anterior: HIT tras validar la versión
+    status = raw.get("contentCache")
+    response.headers["X-Cache"] = status.split("-")[0].upper() if status else "BYPASS"
+
 @app.get("/documents/{nodeId}/full")
-def api_get_document_with_content(
+async def api_get_document_with_content(
+    response: Response,
     nodeId: str,
     maxChars: int = Query(MAX_CHARS_DEFAULT, ge=5000, le=500000, description="Máx. caracteres del texto a devolver"),
     minimal: bool = Query(False, description="Si true, devuelve solo {name,title,description,content}"),
+    fields: Optional[str] = FIELDS_QUERY,
 ):
     """
     Devuelve metadatos + contenido textual extraído (contentText), con truncamiento controlado.
     Si minimal=true, devuelve únicamente los campos esenciales para contexto de LLM.
     """
     try:
-        raw = get_document_with_content(nodeId, max_chars=maxChars)
+        raw = await get_document_with_content(nodeId, max_chars=maxChars)
+        _set_content_cache_header(response, raw)
         if minimal:
             return _minimal_projection(raw)
-        return raw
+        return _json_response(raw, response, _parse_fields(fields))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/documents/{nodeId}/minimal")
-def api_get_document_minimal(
+async def api_get_document_minimal(
+    response: Response,
     nodeId: str,
     maxChars: int = Query(MAX_CHARS_DEFAULT, ge=5000, le=500000, description="Máx. caracteres del texto a procesar"),
 ):
@@ -152,7 +481,165 @@ def api_get_document_minimal(
     Equivalente a: /documents/{nodeId}/full?minimal=true
     """
     try:
-        raw = get_document_with_content(nodeId, max_chars=maxChars)
+        raw = await get_document_with_content(nodeId, max_chars=maxChars)
+        _set_content_cache_header(response, raw)
         return _minimal_projection(raw)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/documents/{nodeId}/text")
+async def api_get_document_text_window(
+    response: Response,
+    nodeId: str,
+    offset: int = Query(0, ge=0, description="Carácter inicial de la ventana"),
+    length: int = Query(TEXT_WINDOW_DEFAULT_CHARS, ge=1, le=TEXT_WINDOW_MAX_CHARS, description="Caracteres de la ventana"),
+    pageFrom: Optional[int] = Query(None, ge=1, description="Primera página (solo PDF; sustituye a offset/length)"),
+    pageTo: Optional[int] = Query(None, ge=1, description="Última página, incluida (por defecto pageFrom)"),
+):
+    """
+    Devuelve una ventana del texto extraído (por offset/length o por rango de páginas)
+    leída del índice por fragmentos: memoria y transferencia dependen del tamaño de la
+    ventana, no de su posición en el documento.
+    """
+    try:
+        window = await get_text_window(nodeId, offset=offset, length=length, page_from=pageFrom, page_to=pageTo)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    response.headers["X-Cache"] = {"hit": "HIT", "bypass": "BYPASS"}.get(window["index"], "MISS")
+    return window
+
+@app.get("/rag/search")
+async def api_rag_search(
+    q: str = Query(..., min_length=1, description="Pregunta o texto a buscar"),
+    k: int = Query(8, ge=1, le=50, description="Número de fragmentos"),
+    nodeIds: Optional[str] = Query(None, description="CSV de node IDs para restringir la búsqueda"),
+):
+    """
+    Fragmentos más relevantes del índice local (BM25 + embeddings). No consulta
+    Alfresco: el índice se construye fuera de línea con `python rag_index.py build`.
+    """
+    ids = [x.strip() for x in nodeIds.split(",") if x.strip()] if nodeIds else None
+    try:
+        index = get_rag_index()
+        with stage("rag"):
+            chunks = await asyncio.to_thread(index.search, q, k, ids)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return {
+        "count": len(chunks),
+        "indexedNodeIds": [nid for nid in ids if nid in index] if ids else None,
+        "chunks": chunks,
+    }
+
+class BatchDocumentsRequest(BaseModel):
+    nodeIds: List[str] = Field(..., min_length=1, max_length=BATCH_MAX_ITEMS, description="Node IDs a recuperar")
+    maxChars: int = Field(MAX_CHARS_DEFAULT, ge=5000, le=500000, description="Máx. caracteres del texto por documento")
+    minimal: bool = Field(True, description="Si true, cada documento usa la proyección mínima")
+
+@app.post("/documents/batch")
+async def api_get_documents_batch(req: BatchDocumentsRequest):
+    """
+    Recupera varios documentos (metadatos + contenido) concurrentemente, con paralelismo
+    acotado por BATCH_CONCURRENCY. Devuelve un resultado por nodeId, en el mismo orden;
+    los fallos se reportan por ítem sin tumbar el batch.
+    """
+    sem = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def one(node_id: str) -> dict:
+        async with sem:
+            try:
+                raw = await get_document_with_content(node_id, max_chars=req.maxChars)
+            except Exception as e:
+                return {"nodeId": node_id, "ok": False, "error": str(e)}
+        return {
+            "nodeId": node_id,
+            "ok": True,
+            "modifiedAt": raw.get("modifiedAt"),
+            "document": _minimal_projection(raw) if req.minimal else raw,
+        }
+
+    results = await asyncio.gather(*[one(nid) for nid in req.nodeIds])
+    return {
+        "count": len(results),
+        "errors": sum(1 for r in results if not r["ok"]),
+        "results": results,
+    }
+
+class NodeIdsRequest(BaseModel):
+    nodeIds: List[str] = Field(..., min_length=1, max_length=BATCH_MAX_ITEMS, description="Node IDs a consultar")
+
+@app.post("/documents/modified")
+async def api_get_documents_modified(req: NodeIdsRequest):
+    """
+    modifiedAt actual de varios nodos (solo metadatos, sin contenido), para que los
+    clientes validen documentos que ya tienen. null si el nodo no existe o falla.
+    """
+    sem = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def one(node_id: str) -> Optional[str]:
+        async with sem:
+            try:
+                return (await get_node_metadata(node_id, include="", fields=NODE_MODIFIED_FIELDS)).get("modifiedAt")
+            except Exception:
+                return None
+
+    values = await asyncio.gather(*[one(nid) for nid in req.nodeIds])
+    return {"results": dict(zip(req.nodeIds, values))}
+
+# --- Chat (SSE) ------------------------------------------------------------------------
+
+CHATBOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "chatbot")
+_chat_flow = None
+
+def _get_chat_flow():
+    """Importa el grafo del chatbot bajo demanda (LangChain/Groq solo se cargan si se usa el chat)."""
+    global _chat_flow
+    if _chat_flow is None:
+        if CHATBOT_DIR not in sys.path:
+            sys.path.insert(0, CHATBOT_DIR)
+        import chatbot_flow
+        _chat_flow = chatbot_flow
+    return _chat_flow
+
+@app.get("/admin/chat-checkpoints")
+async def api_chat_checkpoint_stats():
+    """Hilos y checkpoints persistidos del chat (solo si el chat ya se cargó en este proceso)."""
+    if _chat_flow is None:
+        return {"loaded": False}
+    stats = getattr(_chat_flow.memory, "stats", None)
+    return stats() if stats else {"loaded": True, "backend": type(_chat_flow.memory).__name__}
+
+class ChatRequest(BaseModel):
+    message: str = Field(..., min_length=1, description="Mensaje del usuario")
+    threadId: str = Field("web-thread", min_length=1, description="Hilo conversacional (memoria del grafo)")
+    contextIds: List[str] = Field(default_factory=list, description="Node IDs fijados como contexto")
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/chat/stream")
+async def api_chat_stream(req: ChatRequest):
+    """
+    Respuesta del chatbot como server-sent events: `status` al avanzar el grafo
+    (intención, documentos de contexto), `token` por cada fragmento generado, y
+    `done` con el mensaje completo (o `error`).
+    """
+    try:
+        flow = _get_chat_flow()
+    except ImportError as e:
+        raise HTTPException(status_code=503, detail=f"Chat no disponible: {e}")
+
+    async def events() -> AsyncIterator[str]:
+        try:
+            async for kind, data in flow.astream_reply(req.message, req.threadId, req.contextIds):
+                yield _sse(kind, data)
+        except Exception as e:
+            yield _sse("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,133 @@
+"""
+Compara la API síncrona (list_docs en un threadpool del tamaño del de Starlette)
+contra la asíncrona (list_docs_async) con 200+ peticiones concurrentes sobre el mock local.
+Uso: python bench/bench_async_vs_sync.py --concurrency 200 --requests 2000 --op search
+"""
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import threading
+import statistics
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Tamaño del threadpool de Starlette/anyio para handlers `def` (limitador por defecto)
+STARLETTE_THREADPOOL = 40
+
+def _wait_port(host: str, port: int, timeout: float = 15.0) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"El mock no respondió en {host}:{port}")
+
+def _summary(mode: str, latencies: List[float], errors: int, elapsed: float, concurrency: int) -> Dict[str, Any]:
+    lat = sorted(latencies) or [0.0]
+    def pct(p: float) -> float:
+        return round(lat[min(len(lat) - 1, int(p * len(lat)))] * 1000, 2)
+    return {
+        "mode": mode,
+        "requests": len(latencies) + errors,
+        "concurrency": concurrency,
+        "errors": errors,
+        "elapsedSeconds": round(elapsed, 3),
+        "throughputRps": round((len(latencies) + errors) / elapsed, 1) if elapsed else 0.0,
+        "meanMs": round(statistics.mean(lat) * 1000, 2),
+        "p50Ms": pct(0.50),
+        "p95Ms": pct(0.95),
+        "p99Ms": pct(0.99),
+    }
+
+def run_sync(op: str, total: int, concurrency: int) -> Dict[str, Any]:
+    import list_docs
+
+    # `concurrency` clientes simultáneos (lazo cerrado); la latencia se mide desde el
+    # envío e incluye la espera por un hilo libre del threadpool, como en Starlette.
+    clients = threading.BoundedSemaphore(concurrency)
+
+    def one(i: int, t0: float) -> float:
+        try:
+            if op == "search":
+                list_docs.search_documents(query_text=f"q{i % 10}", max_items=20)
+            else:
+                list_docs.get_document_with_content(f"node-{i}", max_chars=5000)
+            return time.perf_counter() - t0
+        finally:
+            clients.release()
+
+    latencies: List[float] = []
+    errors = 0
+    t0 = time.perf_counter()
+    futures = []
+    with ThreadPoolExecutor(max_workers=min(concurrency, STARLETTE_THREADPOOL)) as pool:
+        for i in range(total):
+            clients.acquire()
+            futures.append(pool.submit(one, i, time.perf_counter()))
+        for fut in futures:
+            try:
+                latencies.append(fut.result())
+            except Exception:
+                errors += 1
+    return _summary("sync-threadpool", latencies, errors, time.perf_counter() - t0, concurrency)
+
+async def run_async(op: str, total: int, concurrency: int) -> Dict[str, Any]:
+    import list_docs_async
+    from alfresco_http import aclose_async_client
+
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(i: int) -> float:
+        async with sem:
+            t0 = time.perf_counter()
+            if op == "search":
+                await list_docs_async.search_documents(query_text=f"q{i % 10}", max_items=20)
+            else:
+                await list_docs_async.get_document_with_content(f"node-{i}", max_chars=5000)
+            return time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    results = await asyncio.gather(*[one(i) for i in range(total)], return_exceptions=True)
+    elapsed = time.perf_counter() - t0
+    await aclose_async_client()
+    latencies = [r for r in results if isinstance(r, float)]
+    return _summary("async", latencies, len(results) - len(latencies), elapsed, concurrency)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark sync vs async contra un Alfresco mock")
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--op", choices=["search", "document"], default="search")
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--port", type=int, default=8089)
+    args = parser.parse_args()
+
+    mock = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "bench", "mock_alfresco.py"),
+         "--port", str(args.port), "--latency-ms", str(args.latency_ms)],
+    )
+    try:
+        _wait_port("127.0.0.1", args.port)
+        os.environ["ALFRESCO_BASE_URL"] = f"http://127.0.0.1:{args.port}"
+        os.environ["ALFRESCO_HTTP_POOL_SIZE"] = str(args.concurrency)
+        results = [
+            run_sync(args.op, args.requests, args.concurrency),
+            asyncio.run(run_async(args.op, args.requests, args.concurrency)),
+        ]
+        print(json.dumps({"op": args.op, "mockLatencyMs": args.latency_ms, "results": results}, indent=2))
+    finally:
+        mock.terminate()
+        mock.wait()
+
+if __name__ == "__main__":
+    main()
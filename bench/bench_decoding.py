@@ -0,0 +1,117 @@
+"""
+Compara la decodificación de texto plano: chardet sobre el buffer entero (el enfoque
+anterior) contra el decodificador por niveles (BOM, UTF-8 estricto, chardet sobre una
+muestra) y su versión incremental por trozos de 64 KB, sobre corpus de varios MB en
+UTF-8, UTF-8 con BOM, cp1252/latin-1 y UTF-8 con un único byte latin-1 al final.
+Uso: python bench/bench_decoding.py --sizes-mb 1,4,8 --repeat 3
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from typing import Any, Callable, Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "bench"))
+
+from corpus import text_lines
+from text_decoding import chardet, decode_text, IncrementalTextDecoder
+
+CHUNK_BYTES = 64 * 1024
+
+
+def build_corpus(name: str, size_bytes: int) -> Tuple[bytes, str]:
+    """(bytes, texto esperado) de un corpus de ~size_bytes."""
+    text = "\n".join(text_lines(0, size_bytes)) + "\n"
+    if name == "utf-8":
+        return text.encode("utf-8"), text
+    if name == "utf-8-bom":
+        return text.encode("utf-8-sig"), text
+    if name == "latin-1":
+        return text.encode("cp1252"), text
+    if name == "utf-8-late-latin-1":
+        # Todo UTF-8 válido salvo una palabra latin-1 al final: obliga a detectar tarde
+        tail = "Fin: camión"
+        ascii_text = text.encode("ascii", "ignore").decode("ascii")
+        return ascii_text.encode("utf-8") + tail.encode("cp1252"), ascii_text + tail
+    raise ValueError(name)
+
+
+def chardet_full(data: bytes) -> str:
+    enc = "utf-8"
+    if chardet is not None:
+        det = chardet.detect(data)
+        if det and det.get("encoding"):
+            enc = det["encoding"]
+    try:
+        return str(data, enc, "replace")
+    except Exception:
+        return str(data, "utf-8", "replace")
+
+
+def tiered(data: bytes) -> str:
+    return decode_text(data)[0]
+
+
+def incremental(data: bytes) -> str:
+    decoder = IncrementalTextDecoder()
+    for i in range(0, len(data), CHUNK_BYTES):
+        decoder.feed(data[i:i + CHUNK_BYTES])
+    return decoder.finish()
+
+
+STRATEGIES: Dict[str, Callable[[bytes], str]] = {
+    "chardet-full": chardet_full,
+    "tiered": tiered,
+    "incremental": incremental,
+}
+
+
+def run_case(corpus: str, size_mb: float, repeat: int) -> List[Dict[str, Any]]:
+    data, expected = build_corpus(corpus, int(size_mb * 1024 * 1024))
+    rows = []
+    for name, fn in STRATEGIES.items():
+        if name == "chardet-full" and chardet is None:
+            continue
+        timings = []
+        text = ""
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            text = fn(data)
+            timings.append(time.perf_counter() - t0)
+        best = min(timings)
+        rows.append({
+            "corpus": corpus,
+            "sizeMB": round(len(data) / 1024 / 1024, 2),
+            "strategy": name,
+            "bestS": round(best, 4),
+            "meanS": round(sum(timings) / len(timings), 4),
+            "mbPerS": round(len(data) / 1024 / 1024 / best, 1) if best > 0 else None,
+            # Acentos bien decodificados (sin mojibake ni caracteres de reemplazo)
+            "correct": text == expected,
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de decodificación de texto plano")
+    parser.add_argument("--sizes-mb", default="1,4,8")
+    parser.add_argument("--corpora", default="utf-8,utf-8-bom,latin-1,utf-8-late-latin-1")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    results = []
+    for size in [float(x) for x in args.sizes_mb.split(",") if x]:
+        for corpus in [c for c in args.corpora.split(",") if c]:
+            results += run_case(corpus, size, args.repeat)
+    print(json.dumps({
+        "chardetVersion": getattr(chardet, "__version__", None),
+        "chunkBytes": CHUNK_BYTES,
+        "results": results,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
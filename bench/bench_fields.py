@@ -0,0 +1,121 @@
+"""
+Coste por página de 200 entradas de la Search API antes y después de pedir solo los
+campos de cada operación: tamaño del JSON de Alfresco, parseo (json contra fast_json),
+_parse_* y serialización de la respuesta (jsonable_encoder + json contra fast_json
+directo, con y sin proyección fields=). Las páginas las genera el mock con la misma
+forma que Alfresco (include/fields), sin red de por medio.
+Uso: python bench/bench_fields.py --page-size 200 --repeat 50
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from typing import Any, Callable, Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "bench"))
+
+from fastapi.encoders import jsonable_encoder
+
+import fast_json
+from mock_alfresco import _node
+from list_docs import (
+    _folder_children_body,
+    _parse_folder_children,
+    _search_documents_body,
+    _parse_search_documents,
+)
+
+# Lo que se pedía antes a Alfresco en todas las operaciones
+LEGACY_FIELDS = ["id", "name", "nodeType", "content", "path", "properties", "aspectNames", "allowableOperations", "createdAt", "modifiedAt"]
+LEGACY_INCLUDE = {
+    "folder_children": ["path", "properties", "aspectNames"],
+    "search_documents": ["path"],
+}
+
+
+def upstream_page(body: Dict[str, Any], page_size: int) -> bytes:
+    """Página tal como la devolvería Alfresco para este cuerpo (JSON con separadores por defecto)."""
+    entries = [
+        {"entry": _node(i, body.get("include") or [], body.get("fields")), "search": {"score": 1.0 / (i + 1)}}
+        for i in range(page_size)
+    ]
+    data = {"list": {"pagination": {"count": page_size, "hasMoreItems": True, "skipCount": 0, "maxItems": page_size},
+                     "entries": entries}}
+    return json.dumps(data).encode("utf-8")
+
+
+def starlette_render(content: Any) -> bytes:
+    # Lo que hace FastAPI con un dict devuelto por el endpoint: jsonable_encoder + JSONResponse
+    return json.dumps(jsonable_encoder(content), ensure_ascii=False, allow_nan=False, indent=None,
+                      separators=(",", ":")).encode("utf-8")
+
+
+def project(result: Dict[str, Any], fields: List[str]) -> Dict[str, Any]:
+    return {**result, "entries": [{k: e[k] for k in fields if k in e} for e in result["entries"]]}
+
+
+def best_of(fn: Callable[[], Any], repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - t0)
+    return min(timings)
+
+
+def run_operation(operation: str, page_size: int, repeat: int, fields: List[str]) -> List[Dict[str, Any]]:
+    if operation == "folder_children":
+        body = _folder_children_body("folder", "all", page_size, 0, True)
+        parse = _parse_folder_children
+    else:
+        body = _search_documents_body("contrato", None, None, page_size, 0, None, None, False, True)
+        parse = lambda data: _parse_search_documents(data, False)
+    legacy_body = dict(body, fields=LEGACY_FIELDS, include=LEGACY_INCLUDE[operation])
+
+    rows = []
+    for variant, req_body, loads, render, proj in (
+        ("before", legacy_body, json.loads, starlette_render, None),
+        ("after", body, fast_json.loads, fast_json.dumps, None),
+        ("after+fields", body, fast_json.loads, fast_json.dumps, fields),
+    ):
+        raw = upstream_page(req_body, page_size)
+        data = loads(raw)
+        result = parse(data)
+        out = render(project(result, proj) if proj else result)
+        decode_s = best_of(lambda: loads(raw), repeat)
+        parse_s = best_of(lambda: parse(data), repeat)
+        encode_s = best_of(lambda: render(project(result, proj) if proj else result), repeat)
+        rows.append({
+            "operation": operation,
+            "variant": variant,
+            "pageSize": page_size,
+            "upstreamBytes": len(raw),
+            "responseBytes": len(out),
+            "decodeMs": round(decode_s * 1000, 3),
+            "parseMs": round(parse_s * 1000, 3),
+            "encodeMs": round(encode_s * 1000, 3),
+            "totalMs": round((decode_s + parse_s + encode_s) * 1000, 3),
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de campos mínimos y JSON rápido en páginas de búsqueda")
+    parser.add_argument("--page-size", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--operations", default="search_documents,folder_children")
+    parser.add_argument("--fields", default="id,name", help="Proyección fields= de la variante after+fields")
+    args = parser.parse_args()
+
+    fields = [f for f in args.fields.split(",") if f]
+    results = []
+    for operation in [o for o in args.operations.split(",") if o]:
+        results += run_operation(operation, args.page_size, args.repeat, fields)
+    print(json.dumps({"jsonBackend": fast_json.JSON_BACKEND, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
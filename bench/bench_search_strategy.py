@@ -0,0 +1,95 @@
+"""
+Compara la búsqueda multi-site "single" (un OR de PATH) contra "fanout" (una consulta
+por site en paralelo) sobre el mock local, que cobra un coste extra por cada PATH.
+Uso: python bench/bench_search_strategy.py --sites 10 --path-latency-ms 30 --requests 200
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import subprocess
+from typing import Any, Dict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "bench"))
+
+from bench_async_vs_sync import _wait_port, _summary
+
+async def run_strategy(strategy: str, sites: list, total: int, concurrency: int, site_timeout_s: float) -> Dict[str, Any]:
+    import list_docs_async
+
+    sem = asyncio.Semaphore(concurrency)
+    partial = 0
+
+    async def one(i: int) -> float:
+        nonlocal partial
+        async with sem:
+            t0 = time.perf_counter()
+            if strategy == "fanout":
+                res = await list_docs_async.search_documents_fanout(
+                    query_text=f"q{i % 10}", site_ids=sites, max_items=20, use_cache=False, site_timeout_s=site_timeout_s,
+                )
+                partial += int(res["partial"])
+            else:
+                await list_docs_async.search_documents(query_text=f"q{i % 10}", site_ids=sites, max_items=20, use_cache=False)
+            return time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    results = await asyncio.gather(*[one(i) for i in range(total)], return_exceptions=True)
+    elapsed = time.perf_counter() - t0
+    latencies = [r for r in results if isinstance(r, float)]
+    summary = _summary(strategy, latencies, len(results) - len(latencies), elapsed, concurrency)
+    summary["partialResponses"] = partial
+    return summary
+
+async def run_all(args) -> list:
+    from alfresco_http import aclose_async_client
+
+    sites = [f"site{i}" for i in range(args.sites)]
+    try:
+        return [
+            await run_strategy("single", sites, args.requests, args.concurrency, args.site_timeout_s),
+            await run_strategy("fanout", sites, args.requests, args.concurrency, args.site_timeout_s),
+        ]
+    finally:
+        await aclose_async_client()
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de búsqueda multi-site: single vs fanout")
+    parser.add_argument("--sites", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--path-latency-ms", type=float, default=30.0, help="Coste del mock por cada PATH de site")
+    parser.add_argument("--slow-site", default="", help="Site que excede el timeout (para ver respuestas parciales)")
+    parser.add_argument("--site-timeout-s", type=float, default=2.0)
+    parser.add_argument("--port", type=int, default=8089)
+    args = parser.parse_args()
+
+    env = dict(os.environ, MOCK_SLOW_SITES=args.slow_site)
+    mock = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "bench", "mock_alfresco.py"), "--port", str(args.port),
+         "--latency-ms", str(args.latency_ms), "--path-latency-ms", str(args.path_latency_ms)],
+        env=env,
+    )
+    try:
+        _wait_port("127.0.0.1", args.port)
+        os.environ["ALFRESCO_BASE_URL"] = f"http://127.0.0.1:{args.port}"
+        # El pool debe admitir todas las consultas por site simultáneas
+        os.environ["ALFRESCO_HTTP_POOL_SIZE"] = str(args.concurrency * args.sites)
+        results = asyncio.run(run_all(args))
+        print(json.dumps({
+            "sites": args.sites,
+            "mockLatencyMs": args.latency_ms,
+            "pathLatencyMs": args.path_latency_ms,
+            "results": results,
+        }, indent=2))
+    finally:
+        mock.terminate()
+        mock.wait()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Corpus sintético para el mock: texto, PDF y DOCX generados sin dependencias (el PDF y
+el DOCX se escriben a mano), deterministas por índice de nodo para que los resultados
+sean comparables entre ejecuciones. Todos los documentos de un mismo tipo miden
+exactamente lo mismo (el índice va con ancho fijo), así el mock puede anunciar
+sizeInBytes sin generar el binario.
+"""
+import io
+import zipfile
+from functools import lru_cache
+from typing import Dict, List, Tuple
+from xml.sax.saxutils import escape
+
+MIME_BY_KIND = {
+    "text": "text/plain",
+    "pdf": "application/pdf",
+    "docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+}
+EXT_BY_KIND = {"text": "txt", "pdf": "pdf", "docx": "docx"}
+
+_WORDS = (
+    "contrato expediente informe anexo cliente proveedor factura importe plazo entrega "
+    "cláusula firma revisión auditoría riesgo presupuesto capítulo sección resumen acuerdo "
+    "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor"
+).split()
+LINES_PER_PAGE = 45
+
+
+def parse_mix(spec: str) -> List[Tuple[str, int]]:
+    """'text:5,pdf:3,docx:2' -> [("text", 5), ("pdf", 3), ("docx", 2)] (pesos enteros)."""
+    mix = []
+    for part in spec.split(","):
+        kind, _, weight = part.strip().partition(":")
+        if kind not in MIME_BY_KIND:
+            raise ValueError(f"Tipo de corpus desconocido: {kind!r} (válidos: {', '.join(MIME_BY_KIND)})")
+        mix.append((kind, int(weight or 1)))
+    if not mix or sum(w for _, w in mix) <= 0:
+        raise ValueError("El corpus necesita al menos un tipo con peso > 0")
+    return mix
+
+
+def kind_for(index: int, mix: List[Tuple[str, int]]) -> str:
+    """Reparto determinista según los pesos (round-robin ponderado)."""
+    slot = index % sum(w for _, w in mix)
+    for kind, weight in mix:
+        if slot < weight:
+            return kind
+        slot -= weight
+    return mix[-1][0]
+
+
+def text_lines(index: int, size_bytes: int) -> List[str]:
+    lines = []
+    total = 0
+    n = 0
+    while total < size_bytes:
+        words = [_WORDS[(n * 13 + k * 3) % len(_WORDS)] for k in range(10)]
+        line = f"Documento {index:08d}, línea {n:06d}: " + " ".join(words) + "."
+        lines.append(line)
+        total += len(line.encode("utf-8")) + 1
+        n += 1
+    return lines
+
+
+def _pdf_escape(s: str) -> str:
+    # Helvetica con WinAnsiEncoding: los acentos del español caben en latin-1
+    return s.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def build_pdf(lines: List[str]) -> bytes:
+    pages = [lines[i:i + LINES_PER_PAGE] for i in range(0, len(lines), LINES_PER_PAGE)] or [[]]
+    objects: Dict[int, bytes] = {}
+    font_id = 3
+    objects[font_id] = b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>"
+    kids = []
+    next_id = 4
+    for page_lines in pages:
+        page_id, content_id = next_id, next_id + 1
+        next_id += 2
+        ops = ["BT", "/F1 9 Tf", "11 TL", "40 800 Td"]
+        for line in page_lines:
+            ops.append(f"({_pdf_escape(line)}) Tj T*")
+        ops.append("ET")
+        stream = "\n".join(ops).encode("latin-1", "replace")
+        objects[content_id] = b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream"
+        objects[page_id] = (
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id
+        )
+        kids.append(page_id)
+    objects[1] = b"<< /Type /Catalog /Pages 2 0 R >>"
+    objects[2] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (" ".join(f"{k} 0 R" for k in kids).encode(), len(kids))
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = {}
+    for obj_id in sorted(objects):
+        offsets[obj_id] = out.tell()
+        out.write(b"%d 0 obj\n" % obj_id + objects[obj_id] + b"\nendobj\n")
+    xref = out.tell()
+    size = max(objects) + 1
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % size)
+    for obj_id in range(1, size):
+        out.write(b"%010d 00000 n \n" % offsets[obj_id])
+    out.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (size, xref))
+    return out.getvalue()
+
+
+_DOCX_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/word/document.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+    '</Types>'
+)
+_DOCX_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="word/document.xml"/>'
+    '</Relationships>'
+)
+
+
+def build_docx(lines: List[str]) -> bytes:
+    paragraphs = "".join(f"<w:p><w:r><w:t xml:space=\"preserve\">{escape(line)}</w:t></w:r></w:p>" for line in lines)
+    document = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+        f"<w:body>{paragraphs}</w:body></w:document>"
+    )
+    out = io.BytesIO()
+    # Sin compresión para que el tamaño no dependa del contenido
+    with zipfile.ZipFile(out, "w", zipfile.ZIP_STORED) as z:
+        z.writestr("[Content_Types].xml", _DOCX_CONTENT_TYPES)
+        z.writestr("_rels/.rels", _DOCX_RELS)
+        z.writestr("word/document.xml", document)
+    return out.getvalue()
+
+
+@lru_cache(maxsize=256)
+def build_document(kind: str, index: int, size_bytes: int) -> bytes:
+    """Binario del documento `index`; `size_bytes` es el tamaño aproximado del texto."""
+    lines = text_lines(index, size_bytes)
+    if kind == "pdf":
+        return build_pdf(lines)
+    if kind == "docx":
+        return build_docx(lines)
+    return ("\n".join(lines) + "\n").encode("utf-8")[:size_bytes]
+
+
+@lru_cache(maxsize=None)
+def document_size(kind: str, size_bytes: int) -> int:
+    return len(build_document(kind, 0, size_bytes))
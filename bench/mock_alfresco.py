@@ -0,0 +1,204 @@
+"""
+Mock local de Alfresco (Search API + nodes/content) para benchmarks sin un Alfresco real.
+Uso: python bench/mock_alfresco.py --port 8089 --latency-ms 20 --corpus text:5,pdf:3,docx:2
+"""
+import os
+import re
+import asyncio
+import argparse
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+from corpus import MIME_BY_KIND, EXT_BY_KIND, parse_mix, kind_for, build_document, document_size
+
+API_PREFIX = "/alfresco/api/-default-/public"
+
+LATENCY_MS = float(os.getenv("MOCK_LATENCY_MS", "20"))
+DOC_SIZE_BYTES = int(os.getenv("MOCK_DOC_SIZE_BYTES", str(64 * 1024)))
+# Reparto de tipos del corpus sintético, con pesos: "text:5,pdf:3,docx:2"
+CORPUS = parse_mix(os.getenv("MOCK_CORPUS", "text"))
+# Número de archivos que devuelve el listado de hijos de cualquier carpeta
+CHILDREN_COUNT = int(os.getenv("MOCK_CHILDREN_COUNT", "1000"))
+# Total de resultados de cualquier búsqueda (los DBID van de 0 a SEARCH_TOTAL - 1)
+SEARCH_TOTAL = int(os.getenv("MOCK_SEARCH_TOTAL", "100000"))
+# Corta la conexión tras enviar este número de bytes de contenido (0 = nunca); simula
+# descargas interrumpidas para probar la reanudación con Range
+CONTENT_CUT_BYTES = int(os.getenv("MOCK_CONTENT_CUT_BYTES", "0"))
+
+# Coste extra por cada cláusula PATH de site (simula lo caro que es en Solr un OR de muchos PATH)
+PATH_LATENCY_MS = float(os.getenv("MOCK_PATH_LATENCY_MS", "0"))
+# Sites lentos (CSV): sus consultas tardan SLOW_SITE_LATENCY_MS más
+SLOW_SITES = [x for x in os.getenv("MOCK_SLOW_SITES", "").split(",") if x]
+SLOW_SITE_LATENCY_MS = float(os.getenv("MOCK_SLOW_SITE_LATENCY_MS", "10000"))
+
+_DBID_RANGE_RE = re.compile(r"DBID:\[(\d+) TO MAX\]")
+_NODE_INDEX_RE = re.compile(r"^00000000-0000-4000-8000-(\d{12})$")
+
+app = FastAPI(title="Mock Alfresco")
+
+def _node_index(node_id: str) -> int:
+    m = _NODE_INDEX_RE.match(node_id)
+    return int(m.group(1)) if m else 0
+
+# Campos que Alfresco solo devuelve si se piden en include
+_OPTIONAL_FIELDS = ("path", "properties", "aspectNames", "allowableOperations")
+_USER = {"id": "admin", "displayName": "Administrator"}
+_PATH_ELEMENTS = [
+    {"id": f"00000000-0000-4000-9000-{k:012d}", "name": name, "nodeType": node_type,
+     "aspectNames": ["cm:titled", "cm:auditable", "sys:undeletable"]}
+    for k, (name, node_type) in enumerate([
+        ("Company Home", "cm:folder"), ("Sites", "cm:folder"), ("bench", "st:site"), ("documentLibrary", "cm:folder"),
+    ])
+]
+
+def _node(i: int, include: Optional[Iterable[str]] = None, fields: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+    """
+    Nodo con la forma de Alfresco: los campos de _OPTIONAL_FIELDS solo aparecen si están
+    en include (None = todos) y, con fields, solo quedan esos campos de primer nivel.
+    """
+    kind = kind_for(i, CORPUS)
+    node = {
+        "id": f"00000000-0000-4000-8000-{i:012d}",
+        "name": f"documento-{i}.{EXT_BY_KIND[kind]}",
+        "nodeType": "cm:content",
+        "isFile": True,
+        "isFolder": False,
+        "createdAt": "2024-01-01T00:00:00.000+0000",
+        "createdByUser": _USER,
+        "modifiedAt": "2024-01-02T00:00:00.000+0000",
+        "modifiedByUser": _USER,
+        "parentId": _PATH_ELEMENTS[-1]["id"],
+        "content": {"mimeType": MIME_BY_KIND[kind], "mimeTypeName": kind.upper(),
+                    "sizeInBytes": document_size(kind, DOC_SIZE_BYTES), "encoding": "UTF-8"},
+        "path": {"name": "/Company Home/Sites/bench/documentLibrary", "isComplete": True, "elements": _PATH_ELEMENTS},
+        "properties": {
+            "cm:title": f"Documento {i}", "cm:description": "Documento sintético", "sys:node-dbid": i,
+            "cm:versionLabel": "1.0", "cm:versionType": "MAJOR", "cm:author": "Administrator",
+            "cm:lastThumbnailModification": ["doclib:1704153600000", "pdf:1704153600000"],
+            "cm:autoVersion": True, "cm:autoVersionOnUpdateProps": False, "cm:initialVersion": True,
+            "sys:locale": "es_ES", "sys:store-protocol": "workspace", "sys:store-identifier": "SpacesStore",
+            "sys:node-uuid": f"00000000-0000-4000-8000-{i:012d}", "cm:creator": "admin", "cm:modifier": "admin",
+            "cm:created": "2024-01-01T00:00:00.000+0000", "cm:modified": "2024-01-02T00:00:00.000+0000",
+            "cm:accessed": "2024-01-02T00:00:00.000+0000", "exif:pixelXDimension": None, "exif:pixelYDimension": None,
+        },
+        "aspectNames": ["rn:renditioned", "cm:versionable", "cm:titled", "cm:auditable", "cm:author",
+                        "cm:thumbnailModification", "sys:referenceable", "sys:localized"],
+        "allowableOperations": ["delete", "update", "updatePermissions", "create"],
+    }
+    include = set(_OPTIONAL_FIELDS if include is None else include)
+    for key in _OPTIONAL_FIELDS:
+        if key not in include:
+            node.pop(key)
+    if fields:
+        node = {k: node[k] for k in fields if k in node}
+    return node
+
+def _body(node_id: str) -> Tuple[bytes, str]:
+    i = _node_index(node_id)
+    kind = kind_for(i, CORPUS)
+    return build_document(kind, i, DOC_SIZE_BYTES), MIME_BY_KIND[kind]
+
+async def _latency(extra_ms: float = 0.0) -> None:
+    if LATENCY_MS + extra_ms > 0:
+        await asyncio.sleep((LATENCY_MS + extra_ms) / 1000.0)
+
+def _query_cost_ms(query: str) -> float:
+    cost = PATH_LATENCY_MS * query.count("st:sites/")
+    if any(f"st:sites/cm:{site}/" in query for site in SLOW_SITES):
+        cost += SLOW_SITE_LATENCY_MS
+    return cost
+
+@app.post(API_PREFIX + "/search/versions/1/search")
+async def search(request: Request):
+    body = await request.json()
+    await _latency(_query_cost_ms((body.get("query") or {}).get("query", "")))
+    paging = body.get("paging") or {}
+    max_items = int(paging.get("maxItems", 50))
+    skip = int(paging.get("skipCount", 0))
+    # Continuación por DBID: los resultados empiezan en el DBID pedido
+    m = _DBID_RANGE_RE.search(body["query"]["query"]) if body.get("query") else None
+    start = (int(m.group(1)) if m else 0) + skip
+    end = min(SEARCH_TOTAL, start + max_items)
+    include, fields = body.get("include") or [], body.get("fields")
+    entries = [{"entry": _node(i, include, fields), "search": {"score": 1.0 / (i - start + 1)}} for i in range(start, end)]
+    return {"list": {
+        "pagination": {"count": len(entries), "hasMoreItems": end < SEARCH_TOTAL, "skipCount": skip, "maxItems": max_items},
+        "entries": entries,
+    }}
+
+def _csv(value: Optional[str]) -> list:
+    return [x for x in (value or "").split(",") if x]
+
+@app.get(API_PREFIX + "/alfresco/versions/1/nodes/{node_id}/children")
+async def children(node_id: str, skipCount: int = 0, maxItems: int = 100, include: str = "", fields: str = ""):
+    await _latency()
+    end = min(CHILDREN_COUNT, skipCount + maxItems)
+    entries = [{"entry": _node(i, _csv(include), _csv(fields))} for i in range(skipCount, end)]
+    return {"list": {
+        "pagination": {"count": len(entries), "hasMoreItems": end < CHILDREN_COUNT, "skipCount": skipCount, "maxItems": maxItems},
+        "entries": entries,
+    }}
+
+@app.get(API_PREFIX + "/alfresco/versions/1/nodes/{node_id}")
+async def node(node_id: str, include: str = "", fields: str = ""):
+    await _latency()
+    n = _node(_node_index(node_id), _csv(include), _csv(fields))
+    if "id" in n:
+        n["id"] = node_id
+    return {"entry": n}
+
+@app.get(API_PREFIX + "/alfresco/versions/1/nodes/{node_id}/content")
+async def content(node_id: str, request: Request):
+    await _latency()
+    data, mime = _body(node_id)
+    rng = request.headers.get("range")
+    if rng and rng.startswith("bytes="):
+        start_s, _, end_s = rng[len("bytes="):].partition("-")
+        start = int(start_s or 0)
+        end = min(int(end_s) if end_s else len(data) - 1, len(data) - 1)
+        if start >= len(data):
+            return JSONResponse({"error": "range not satisfiable"}, status_code=416)
+        return _content_response(data[start:end + 1], mime, 206, {"Content-Range": f"bytes {start}-{end}/{len(data)}"})
+    return _content_response(data, mime, 200, {})
+
+def _content_response(body: bytes, mime: str, status: int, headers: Dict[str, str]) -> Response:
+    if not CONTENT_CUT_BYTES or len(body) <= CONTENT_CUT_BYTES:
+        return Response(body, status_code=status, media_type=mime, headers=headers)
+
+    async def _cut():
+        yield body[:CONTENT_CUT_BYTES]
+        raise ConnectionResetError("corte simulado")
+
+    # Content-Length completo: el cliente detecta el cuerpo incompleto
+    headers = dict(headers, **{"Content-Length": str(len(body))})
+    return StreamingResponse(_cut(), status_code=status, media_type=mime, headers=headers)
+
+def main():
+    global LATENCY_MS, PATH_LATENCY_MS, DOC_SIZE_BYTES, CORPUS, SEARCH_TOTAL, CHILDREN_COUNT, CONTENT_CUT_BYTES
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Mock local de Alfresco")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency-ms", type=float, default=LATENCY_MS)
+    parser.add_argument("--path-latency-ms", type=float, default=PATH_LATENCY_MS)
+    parser.add_argument("--doc-size-bytes", type=int, default=DOC_SIZE_BYTES, help="Tamaño aproximado del texto de cada documento")
+    parser.add_argument("--corpus", default=None, help="Tipos y pesos del corpus, p.ej. text:5,pdf:3,docx:2")
+    parser.add_argument("--search-total", type=int, default=SEARCH_TOTAL, help="Resultados totales de cualquier búsqueda")
+    parser.add_argument("--children-count", type=int, default=CHILDREN_COUNT, help="Hijos de cualquier carpeta")
+    parser.add_argument("--content-cut-bytes", type=int, default=CONTENT_CUT_BYTES, help="Corta cada descarga tras N bytes (0 = nunca)")
+    args = parser.parse_args()
+    LATENCY_MS = args.latency_ms
+    PATH_LATENCY_MS = args.path_latency_ms
+    DOC_SIZE_BYTES = args.doc_size_bytes
+    SEARCH_TOTAL = args.search_total
+    CHILDREN_COUNT = args.children_count
+    CONTENT_CUT_BYTES = args.content_cut_bytes
+    if args.corpus:
+        CORPUS = parse_mix(args.corpus)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+"""
+Suite de benchmarks contra el mock local de Alfresco (bench/mock_alfresco.py).
+
+Cada escenario corre en un proceso aparte (memoria pico y pools/cachés independientes)
+y reporta throughput, p50/p95/p99 y memoria pico en JSON. Con --history se añade una
+línea por ejecución a un JSONL para seguir la evolución; con --baseline se compara
+contra una ejecución anterior y se sale con código 1 si hay regresiones.
+
+Uso:
+  python bench/run_bench.py --corpus text:5,pdf:3,docx:2 --requests 300 --concurrency 20
+  python bench/run_bench.py --scenarios api-search,api-document --output bench.json
+  python bench/run_bench.py --baseline bench.json --max-regression 0.15
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import resource
+import subprocess
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "bench"))
+
+from bench_async_vs_sync import _wait_port, _summary
+
+# escenario -> (forma de ejecutarlo, operación)
+SCENARIOS: Dict[str, tuple] = {
+    "lib-sync-search": ("sync", "search"),
+    "lib-sync-document": ("sync", "document"),
+    "lib-async-search": ("async", "search"),
+    "lib-async-document": ("async", "document"),
+    "api-search": ("api", "search"),
+    "api-children": ("api", "children"),
+    "api-document": ("api", "document"),
+    "api-stream": ("api", "stream"),
+}
+WARMUP_REQUESTS = 5
+# Documentos distintos que recorren los escenarios de contenido (con caché de texto, los repetidos son hits)
+DOCUMENT_SPREAD = 1000
+STREAM_LIMIT = 2000
+
+
+def _node_id(i: int) -> str:
+    return f"00000000-0000-4000-8000-{i % DOCUMENT_SPREAD:012d}"
+
+
+def _max_rss_mb(who: int = resource.RUSAGE_SELF) -> float:
+    # ru_maxrss viene en KB en Linux y en bytes en macOS
+    rss = resource.getrusage(who).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+# --- Escenarios (proceso worker) -----------------------------------------------------
+
+def _sync_op(op: str) -> Callable[[int], Any]:
+    import list_docs
+
+    if op == "search":
+        return lambda i: list_docs.search_documents(query_text=f"q{i % 10}", max_items=20)
+    return lambda i: list_docs.get_document_with_content(_node_id(i), max_chars=20000)
+
+
+def run_sync(op: str, total: int, concurrency: int) -> Dict[str, Any]:
+    fn = _sync_op(op)
+    for i in range(WARMUP_REQUESTS):
+        fn(i)
+
+    def one(i: int) -> float:
+        t0 = time.perf_counter()
+        fn(i)
+        return time.perf_counter() - t0
+
+    latencies: List[float] = []
+    errors = 0
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for fut in [pool.submit(one, i) for i in range(total)]:
+            try:
+                latencies.append(fut.result())
+            except Exception:
+                errors += 1
+    return _summary("sync", latencies, errors, time.perf_counter() - t0, concurrency)
+
+
+async def _gather_timed(fn: Callable[[int], Any], total: int, concurrency: int, mode: str) -> Dict[str, Any]:
+    for i in range(WARMUP_REQUESTS):
+        await fn(i)
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(i: int) -> float:
+        async with sem:
+            t0 = time.perf_counter()
+            await fn(i)
+            return time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    results = await asyncio.gather(*[one(i) for i in range(total)], return_exceptions=True)
+    elapsed = time.perf_counter() - t0
+    latencies = [r for r in results if isinstance(r, float)]
+    return _summary(mode, latencies, len(results) - len(latencies), elapsed, concurrency)
+
+
+async def run_async(op: str, total: int, concurrency: int) -> Dict[str, Any]:
+    import list_docs_async
+    from alfresco_http import aclose_async_client
+
+    async def fn(i: int) -> Any:
+        if op == "search":
+            return await list_docs_async.search_documents(query_text=f"q{i % 10}", max_items=20)
+        return await list_docs_async.get_document_with_content(_node_id(i), max_chars=20000)
+
+    try:
+        return await _gather_timed(fn, total, concurrency, "async")
+    finally:
+        await aclose_async_client()
+
+
+async def run_api(op: str, total: int, concurrency: int) -> Dict[str, Any]:
+    """Peticiones HTTP reales al ASGI de api_server, en proceso (incluye middleware y serialización)."""
+    import httpx
+    import api_server
+
+    paths = {
+        "search": lambda i: f"/search/documents?q=q{i % 10}&maxItems=20",
+        "children": lambda i: f"/folders/folder-{i % 50}/children?maxItems=100&prefetch=false",
+        "document": lambda i: f"/documents/{_node_id(i)}/full?maxChars=20000",
+        "stream": lambda i: f"/search/documents/stream?pageSize=500&limit={STREAM_LIMIT}",
+    }
+    path_for = paths[op]
+    items = 0
+
+    async with api_server.app.router.lifespan_context(api_server.app):
+        transport = httpx.ASGITransport(app=api_server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120.0) as client:
+            async def fn(i: int) -> None:
+                nonlocal items
+                r = await client.get(path_for(i))
+                r.raise_for_status()
+                if op == "stream":
+                    items += r.content.count(b"\n")
+
+            summary = await _gather_timed(fn, total, concurrency, "api")
+    if op == "stream":
+        summary["itemsPerSecond"] = round(items / summary["elapsedSeconds"], 1) if summary["elapsedSeconds"] else 0.0
+    return summary
+
+
+def run_worker(scenario: str, total: int, concurrency: int) -> Dict[str, Any]:
+    kind, op = SCENARIOS[scenario]
+    rss_before = _max_rss_mb()
+    if kind == "sync":
+        result = run_sync(op, total, concurrency)
+    elif kind == "async":
+        result = asyncio.run(run_async(op, total, concurrency))
+    else:
+        result = asyncio.run(run_api(op, total, concurrency))
+    # RUSAGE_CHILDREN solo cuenta procesos ya recogidos: se cierra el pool de extracción antes de medir
+    from extraction import get_extraction_engine
+    get_extraction_engine().shutdown(wait=True)
+    result["mode"] = scenario
+    result["peakRssMB"] = _max_rss_mb()
+    result["rssBeforeRunMB"] = rss_before
+    result["peakChildRssMB"] = _max_rss_mb(resource.RUSAGE_CHILDREN)
+    return result
+
+
+# --- Orquestación ----------------------------------------------------------------------
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def _run_scenario(scenario: str, args, env: Dict[str, str]) -> Dict[str, Any]:
+    proc = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--worker", scenario,
+         "--requests", str(args.requests if scenario != "api-stream" else args.stream_requests),
+         "--concurrency", str(args.concurrency if scenario != "api-stream" else 1)],
+        env=env, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        return {"mode": scenario, "failed": True, "stderr": proc.stderr[-2000:]}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def compare(results: List[Dict[str, Any]], baseline: Dict[str, Any], max_regression: float) -> List[Dict[str, Any]]:
+    """Regresiones: throughput que cae o p95 que sube más de `max_regression` (fracción)."""
+    previous = {r["mode"]: r for r in baseline.get("results", []) if not r.get("failed")}
+    regressions = []
+    for r in results:
+        old = previous.get(r["mode"])
+        if old is None or r.get("failed"):
+            continue
+        checks = (
+            ("throughputRps", old["throughputRps"] and (old["throughputRps"] - r["throughputRps"]) / old["throughputRps"]),
+            ("p95Ms", old["p95Ms"] and (r["p95Ms"] - old["p95Ms"]) / old["p95Ms"]),
+            ("peakRssMB", old["peakRssMB"] and (r["peakRssMB"] - old["peakRssMB"]) / old["peakRssMB"]),
+        )
+        for metric, change in checks:
+            if change and change > max_regression:
+                regressions.append({"mode": r["mode"], "metric": metric, "baseline": old[metric],
+                                    "current": r[metric], "change": round(change, 3)})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Suite de benchmarks contra un Alfresco mock")
+    parser.add_argument("--scenarios", default="all", help=f"CSV o 'all': {', '.join(SCENARIOS)}")
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--stream-requests", type=int, default=5, help="Peticiones del escenario api-stream (secuenciales)")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--latency-ms", type=float, default=10.0)
+    parser.add_argument("--doc-size-bytes", type=int, default=64 * 1024)
+    parser.add_argument("--corpus", default="text:5,pdf:3,docx:2", help="Tipos y pesos del corpus sintético")
+    parser.add_argument("--with-caches", action="store_true", help="Mantener activas las cachés de texto/búsqueda/jerarquía")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--output", help="Guardar el resultado JSON en este archivo")
+    parser.add_argument("--history", help="Añadir el resultado como una línea a este JSONL")
+    parser.add_argument("--baseline", help="JSON de una ejecución anterior para detectar regresiones")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="Empeoramiento tolerado (0.2 = 20%%)")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_worker(args.worker, args.requests, args.concurrency)))
+        return 0
+
+    scenarios = list(SCENARIOS) if args.scenarios == "all" else [s.strip() for s in args.scenarios.split(",")]
+    unknown = [s for s in scenarios if s not in SCENARIOS]
+    if unknown:
+        parser.error(f"Escenarios desconocidos: {', '.join(unknown)}")
+
+    mock = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "bench", "mock_alfresco.py"), "--port", str(args.port),
+         "--latency-ms", str(args.latency_ms), "--doc-size-bytes", str(args.doc_size_bytes), "--corpus", args.corpus],
+    )
+    env = dict(
+        os.environ,
+        ALFRESCO_BASE_URL=f"http://127.0.0.1:{args.port}",
+        ALFRESCO_HTTP_POOL_SIZE=str(max(args.concurrency, 10)),
+    )
+    if not args.with_caches:
+        env.update(TEXT_CACHE_ENABLED="false", SEARCH_CACHE_ENABLED="false", HIERARCHY_CACHE_ENABLED="false")
+    try:
+        _wait_port("127.0.0.1", args.port)
+        results = []
+        for scenario in scenarios:
+            print(f"Ejecutando {scenario}...", file=sys.stderr, flush=True)
+            results.append(_run_scenario(scenario, args, env))
+    finally:
+        mock.terminate()
+        mock.wait()
+
+    report: Dict[str, Any] = {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "gitCommit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpuCount": os.cpu_count(),
+        "params": {
+            "requests": args.requests, "concurrency": args.concurrency, "mockLatencyMs": args.latency_ms,
+            "docSizeBytes": args.doc_size_bytes, "corpus": args.corpus, "caches": args.with_caches,
+        },
+        "results": results,
+    }
+    exit_code = 1 if any(r.get("failed") for r in results) else 0
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            report["regressions"] = compare(results, json.load(f), args.max_regression)
+        exit_code = exit_code or (1 if report["regressions"] else 0)
+
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    if args.history:
+        with open(args.history, "a", encoding="utf-8") as f:
+            f.write(json.dumps(report, ensure_ascii=False) + "\n")
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
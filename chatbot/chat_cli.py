@@ -3,14 +3,14 @@ import sys
 import argparse
 from typing import List
 from dotenv import load_dotenv
-from langchain_core.messages import HumanMessage
-from chatbot_flow import app_graph
+from chatbot_flow import stream_reply
 
 load_dotenv(".env")
 
 HELP_TEXT = """Comandos:
   /doc <uuid1> [uuid2 uuid3]   Fija uno o varios documentos como contexto.
   /show                        Muestra los IDs de documentos fijados.
+  /metrics                     Muestra latencia y tokens del LLM en esta sesión.
   /clear                       Limpia el historial del hilo y documentos.
   /exit                        Sale.
 Escribe cualquier otra cosa para conversar.
@@ -58,6 +58,16 @@ def main():
             print(f"Context IDs = {', '.join(context_ids)}")
             continue
 
+        if user.startswith("/metrics"):
+            try:
+                from metrics import render
+            except ImportError:
+                print("Métricas no disponibles (metrics.py no encontrado).")
+                continue
+            lines = [l for l in render().splitlines() if l.startswith("llm_") and ("_sum" in l or "_count" in l or "tokens" in l)]
+            print("\n".join(lines) if lines else "Sin llamadas al LLM todavía.")
+            continue
+
         if user.startswith("/show"):
             if context_ids:
                 print(f"Context IDs actuales: {', '.join(context_ids)}")
@@ -65,11 +75,16 @@ def main():
                 print("No hay IDs de documentos configurados. Usa /doc <uuid>.")
             continue
 
-        # Mensaje normal → invocar grafo
-        state = {"messages": [HumanMessage(content=user)]}
-        config = {"configurable": {"thread_id": thread_id, "context_ids": context_ids}}
-        out = app_graph.invoke(state, config=config)
-        print("Bot:", out["messages"][-1].content)
+        # Mensaje normal → invocar grafo e imprimir los tokens según llegan
+        print("Bot: ", end="", flush=True)
+        for kind, data in stream_reply(user, thread_id, context_ids):
+            if kind == "token":
+                print(data["text"], end="", flush=True)
+            elif kind == "status" and data.get("stage") == "context" and data.get("documents"):
+                reused = (data.get("reuse") or {}).get("reused") or 0
+                note = f", {reused} reutilizado(s)" if reused else ""
+                print(f"[consultando {len(data['documents'])} documento(s){note}] ", end="", flush=True)
+        print()
 
 if __name__ == "__main__":
     sys.exit(main())
\ No newline at end of file
@@ -1,25 +1,89 @@
 import os
 import re
-from typing import Dict, Any, List, Optional
+import sys
+import time
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Tuple, Iterator, AsyncIterator
 
 from dotenv import load_dotenv
 load_dotenv(".env")
 
 from langchain_groq import ChatGroq
-from langchain_core.messages import HumanMessage, AIMessage
+from langchain_core.messages import HumanMessage, AIMessage, RemoveMessage
+from langchain_core.runnables import RunnableConfig
 from langgraph.graph import START, MessagesState, StateGraph
-from langgraph.checkpoint.memory import MemorySaver
 
-from context_client import fetch_minimal_docs
+from context_client import fetch_minimal_docs, fetch_modified_at, retrieve_chunks, ContextClientError
+from context_packer import count_tokens, pack_documents, pack_history, split_budget
+from checkpointer import get_checkpointer
+
+# Métricas compartidas con el backend (metrics.py en la raíz del repo); opcionales
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+try:
+    from metrics import LLM_SECONDS, LLM_TTFT, LLM_TOKENS, LLM_PROMPT_TOKENS, CONTEXT_DOCS, CONTEXT_BYTES_SAVED, CONTEXT_REQUESTS_SAVED, stage
+except ImportError:
+    LLM_SECONDS = LLM_TTFT = LLM_TOKENS = LLM_PROMPT_TOKENS = None
+    CONTEXT_DOCS = CONTEXT_BYTES_SAVED = CONTEXT_REQUESTS_SAVED = None
+
+    @contextmanager
+    def stage(name, histogram=None, **labels):
+        yield
+
+# Recuperación de fragmentos desde el índice local del backend (rag_index.py)
+RAG_ENABLED = os.getenv("RAG_ENABLED", "true").lower() in ("1", "true", "yes")
+RAG_TOP_K = int(os.getenv("RAG_TOP_K", "8"))
+# Mensajes que se conservan en el estado de cada hilo (los más antiguos se eliminan)
+CHAT_MAX_MESSAGES = int(os.getenv("CHAT_MAX_MESSAGES", "40"))
 
 UUID_RE = re.compile(r"\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[1-5][0-9a-fA-F]{3}-[89abAB][0-9a-fA-F]{3}-[0-9a-fA-F]{12}\b")
 
+_llm = None
+_llm_lock = threading.Lock()
+
 def call_llm_model():
-    return ChatGroq(
-        temperature=0.3,
-        model=os.getenv("GROQ_MODEL", "gemma-2b-it"),
-        api_key=os.getenv("GROQ_API_KEY"),
-    )
+    """
+    Cliente único por proceso: ChatGroq conserva su cliente HTTP, así que las
+    conexiones (TLS incluido) se reutilizan entre nodos y turnos.
+    """
+    global _llm
+    if _llm is None:
+        with _llm_lock:
+            if _llm is None:
+                _llm = ChatGroq(
+                    temperature=0.3,
+                    model=os.getenv("GROQ_MODEL", "gemma-2b-it"),
+                    api_key=os.getenv("GROQ_API_KEY"),
+                )
+    return _llm
+
+def invoke_llm(llm, prompt: str, operation: str) -> AIMessage:
+    """
+    Genera en streaming: los tokens llegan a los callbacks de LangGraph (stream_mode
+    "messages") a medida que se producen. Registra latencia total, tiempo hasta el
+    primer token y tokens consumidos por operación.
+    """
+    model = getattr(llm, "model_name", None) or os.getenv("GROQ_MODEL", "gemma-2b-it")
+    t0 = time.perf_counter()
+    first_token = True
+    full = None
+    with stage("llm", LLM_SECONDS, operation=operation, model=model):
+        for chunk in llm.stream(prompt):
+            if first_token and chunk.content:
+                first_token = False
+                if LLM_TTFT is not None:
+                    LLM_TTFT.observe(time.perf_counter() - t0, operation=operation, model=model)
+            full = chunk if full is None else full + chunk
+    if full is None:
+        return AIMessage(content="")
+    usage = getattr(full, "usage_metadata", None) or {}
+    if LLM_TOKENS is not None:
+        for kind in ("input_tokens", "output_tokens"):
+            if usage.get(kind):
+                LLM_TOKENS.inc(usage[kind], operation=operation, kind=kind.split("_")[0])
+    # Mismo id que los chunks emitidos: LangGraph no vuelve a emitir el mensaje completo
+    return AIMessage(content=full.content, id=full.id, usage_metadata=usage or None)
 
 def get_last_user_text(state: MessagesState) -> str:
     if not state.get("messages"):
@@ -43,35 +107,60 @@ def extract_context_ids(user_text: str, config: Optional[Dict[str, Any]]) -> Lis
         ids.update([str(x) for x in cfg_ids if isinstance(x, str)])
     return list(ids)
 
-def render_docs_for_prompt(docs: List[Dict[str, Any]], max_chars_per_doc: int = 8000) -> str:
-    parts = []
-    for i, d in enumerate(docs):
-        name = d.get("name") or "(sin nombre)"
-        title = d.get("title") or ""
-        desc = d.get("description") or ""
-        content = (d.get("content") or "")[:max_chars_per_doc]
-        truncated = d.get("truncated", False)
-        header = f"[DOCUMENTO {i+1} | name={name}{' | title='+title if title else ''}{' | desc='+desc if desc else ''}{' | truncado' if truncated else ''}]"
-        parts.append(f"{header}\n{content}\n[FIN DOCUMENTO {i+1}]")
-    return "\n-----\n".join(parts)
+def chunks_to_docs(chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Agrupa los fragmentos recuperados por documento (en orden de relevancia) para
+    empaquetarlos como documentos; dentro de cada documento van en orden de lectura.
+    """
+    grouped: Dict[str, Dict[str, Any]] = {}
+    for c in chunks:
+        grouped.setdefault(c["nodeId"], {"name": c.get("name"), "title": c.get("title"), "chunks": []})["chunks"].append(c)
+    docs = []
+    for g in grouped.values():
+        parts = sorted(g["chunks"], key=lambda c: c.get("seq", 0))
+        docs.append({
+            "name": g["name"],
+            "title": g["title"],
+            "content": "\n[...]\n".join(p["text"] for p in parts),
+            "truncated": True,
+        })
+    return docs
+
+def history_turns(state: MessagesState, include_last: bool = True) -> List[Tuple[str, str]]:
+    messages = state.get("messages", [])
+    if not include_last and messages:
+        messages = messages[:-1]
+    return [("Usuario" if isinstance(m, HumanMessage) else "Hannia", m.content) for m in messages]
+
+def _record_prompt_sizes(operation: str, raw_tokens: int, prompt: str) -> None:
+    if LLM_PROMPT_TOKENS is not None:
+        LLM_PROMPT_TOKENS.observe(raw_tokens, operation=operation, packing="raw")
+        LLM_PROMPT_TOKENS.observe(count_tokens(prompt), operation=operation, packing="packed")
 
 def answer_from_docs(state: MessagesState, docs: List[Dict[str, Any]]) -> Dict[str, Any]:
     user_text = get_last_user_text(state)
     llm = call_llm_model()
-    context_block = render_docs_for_prompt(docs)
     system_instructions = (
         "Eres Hannia. Responde únicamente con base en los documentos proporcionados. "
         "Si la respuesta no está explícita, di: 'No tengo suficiente información en los documentos'. "
         "Responde en español y sé concisa."
     )
+    fixed = f"{system_instructions}\n\nPregunta del usuario:\n{user_text}\n\nContexto documental:\n\n\nRespuesta:"
+    turns = history_turns(state, include_last=False)
+    history_budget, docs_budget = split_budget(fixed, has_docs=True)
+    context_block, doc_stats = pack_documents(docs, user_text, docs_budget)
+    # Lo que no usan los documentos queda para el historial
+    history_text, hist_stats = pack_history(turns, history_budget + max(0, docs_budget - doc_stats["tokensAfter"]))
+    history_block = f"Conversación previa:\n{history_text}\n\n" if history_text else ""
     prompt = (
         f"{system_instructions}\n\n"
+        f"{history_block}"
         f"Pregunta del usuario:\n{user_text}\n\n"
         f"Contexto documental:\n{context_block}\n\n"
         f"Respuesta:"
     )
-    resp = llm.invoke(prompt)
-    return {"messages": [AIMessage(content=resp.content)]}
+    _record_prompt_sizes("answer_docs", count_tokens(fixed) + hist_stats["tokensBefore"] + doc_stats["tokensBefore"], prompt)
+    return {"messages": [invoke_llm(llm, prompt, "answer_docs")]}
 
 def ask_for_document_ids(_: MessagesState) -> Dict[str, Any]:
     text = (
@@ -82,44 +171,122 @@ def ask_for_document_ids(_: MessagesState) -> Dict[str, Any]:
 
 def small_talk(state: MessagesState) -> Dict[str, Any]:
     llm = call_llm_model()
-    history_text = "\n".join([m.content for m in state.get("messages", [])])
-    prompt = (
+    instructions = (
         "Eres Hannia, una experta en marketing digital que trabaja para VEQSUM.\n"
         "Contesta de forma útil y breve. Si no sabes, di: "
         "\"No estoy segura, pero puedo contactar a un experto para ayudarte\".\n\n"
-        f"Historial:\n{history_text}\n\nRespuesta:"
     )
-    resp = llm.invoke(prompt)
-    return {"messages": [AIMessage(content=resp.content)]}
+    fixed = f"{instructions}Historial:\n\n\nRespuesta:"
+    history_budget, _ = split_budget(fixed, has_docs=False)
+    history_text, hist_stats = pack_history(history_turns(state), history_budget)
+    prompt = f"{instructions}Historial:\n{history_text}\n\nRespuesta:"
+    _record_prompt_sizes("small_talk", count_tokens(fixed) + hist_stats["tokensBefore"], prompt)
+    return {"messages": [invoke_llm(llm, prompt, "small_talk")]}
 
-def node_classify(state: MessagesState) -> Dict[str, Any]:
+class ChatState(MessagesState):
+    intent: str
+    context_ids: List[str]
+    context_docs: List[Dict[str, Any]]
+    # Documentos fijados ya descargados en este hilo: nodeId -> {"modifiedAt", "doc"}
+    context_cache: Dict[str, Dict[str, Any]]
+    # Documentos fijados que el índice local tenía en el último turno (lo renueva cada búsqueda)
+    rag_indexed_ids: List[str]
+    context_stats: Dict[str, Any]
+
+def node_classify(state: ChatState, config: Optional[RunnableConfig] = None) -> Dict[str, Any]:
+    # Los IDs se resuelven aquí (un nodo sí puede actualizar el estado; el router no)
     user_text = get_last_user_text(state)
     intent = classify_intent(user_text)
-    return {"intent": intent}
+    ids = extract_context_ids(user_text, config or {}) if intent == "doc_query" else []
+    update: Dict[str, Any] = {"intent": intent, "context_ids": ids}
+    # Tope de historial por hilo: acota el tamaño de cada checkpoint
+    messages = state.get("messages", [])
+    if len(messages) > CHAT_MAX_MESSAGES:
+        update["messages"] = [RemoveMessage(id=m.id) for m in messages[:-CHAT_MAX_MESSAGES]]
+    return update
 
-def node_route_doc_or_chat(state: MessagesState, config: Optional[Dict[str, Any]] = None) -> str:
+def node_route_doc_or_chat(state: ChatState, config: Optional[Dict[str, Any]] = None) -> str:
     intent = state.get("intent") or "chit_chat"
     if intent != "doc_query":
         return "chat"
-    user_text = get_last_user_text(state)
-    ids = extract_context_ids(user_text, config or {})
-    state["context_ids"] = ids
-    return "have_ids" if ids else "need_ids"
+    # Con el índice local se puede responder sin UUIDs
+    return "have_ids" if state.get("context_ids") or RAG_ENABLED else "need_ids"
 
-def node_load_context(state: MessagesState) -> Dict[str, Any]:
+def _current_versions(node_ids: List[str]) -> Dict[str, Optional[str]]:
+    try:
+        return fetch_modified_at(node_ids)
+    except ContextClientError:
+        # Sin poder validar, se descargan de nuevo
+        return {}
+
+def _record_context_stats(stats: Dict[str, Any]) -> None:
+    if CONTEXT_DOCS is None:
+        return
+    CONTEXT_DOCS.inc(stats["reused"], source="reused")
+    CONTEXT_DOCS.inc(stats["fetched"], source="fetched")
+    CONTEXT_REQUESTS_SAVED.inc(stats["requestsSaved"])
+    if stats["validated"]:
+        CONTEXT_BYTES_SAVED.observe(stats["bytesSaved"])
+
+def node_load_context(state: ChatState) -> Dict[str, Any]:
+    """
+    Recupera los top-k fragmentos relevantes del índice local (restringidos a los IDs
+    si el usuario los dio). Los IDs no indexados se usan completos: se descargan una
+    vez por hilo y en turnos siguientes solo se revalida su modifiedAt. La descarga y
+    la revalidación corren en paralelo con la búsqueda en el índice.
+    """
     ids: List[str] = state.get("context_ids") or []
-    if not ids:
-        return {"context_docs": []}
-    docs = fetch_minimal_docs(ids, max_chars=50000)
-    return {"context_docs": docs}
+    # Lo que ya no está fijado sale de la caché del hilo
+    cache = {i: e for i, e in (state.get("context_cache") or {}).items() if i in ids}
+    to_check = [i for i in ids if i in cache]
+    # Los que el índice tenía en el turno anterior no se descargan de entrada
+    known_indexed = set(state.get("rag_indexed_ids") or []) if RAG_ENABLED else set()
+    to_fetch = [i for i in ids if i not in cache and i not in known_indexed]
+
+    res = None
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        fetching = pool.submit(fetch_minimal_docs, to_fetch, 50000) if to_fetch else None
+        checking = pool.submit(_current_versions, to_check) if to_check else None
+        if RAG_ENABLED:
+            try:
+                res = retrieve_chunks(get_last_user_text(state), k=RAG_TOP_K, node_ids=ids or None)
+            except ContextClientError:
+                res = None
+        fetched = dict(zip(to_fetch, fetching.result())) if fetching else {}
+        versions = checking.result() if checking else {}
 
-def node_answer_with_docs(state: MessagesState) -> Dict[str, Any]:
+    for i in to_check:
+        if versions.get(i) is None or versions[i] != cache[i]["modifiedAt"]:
+            del cache[i]
+    indexed = set((res or {}).get("indexedNodeIds") or [])
+    # Sin índice (o IDs que dejaron de estar indexados/vigentes): completos, en una segunda ronda
+    missing = [i for i in ids if i not in indexed and i not in cache and i not in fetched]
+    if missing:
+        fetched.update(zip(missing, fetch_minimal_docs(missing, max_chars=50000)))
+    for i, doc in fetched.items():
+        if not doc.get("_error"):
+            cache[i] = {"modifiedAt": doc.get("_modifiedAt"), "doc": doc}
+
+    docs = chunks_to_docs(res.get("chunks") or []) if res else []
+    reused = [i for i in ids if i not in indexed and i not in fetched]
+    docs += [fetched[i] if i in fetched else cache[i]["doc"] for i in ids if i not in indexed]
+    stats = {
+        "reused": len(reused),
+        "fetched": len(fetched),
+        "validated": len(to_check),
+        "bytesSaved": sum(len((cache[i]["doc"].get("content") or "").encode("utf-8")) for i in reused),
+        "requestsSaved": len(reused),
+    }
+    _record_context_stats(stats)
+    return {"context_docs": docs, "context_cache": cache, "rag_indexed_ids": sorted(indexed & set(ids)), "context_stats": stats}
+
+def node_answer_with_docs(state: ChatState) -> Dict[str, Any]:
     docs = state.get("context_docs") or []
     if not docs:
         return ask_for_document_ids(state)
     return answer_from_docs(state, docs)
 
-workflow = StateGraph(state_schema=MessagesState)
+workflow = StateGraph(state_schema=ChatState)
 workflow.add_node("classify", node_classify)
 workflow.add_node("load_context", node_load_context)
 workflow.add_node("answer_docs", node_answer_with_docs)
@@ -128,7 +295,7 @@ workflow.add_node("chat", small_talk)
 
 workflow.add_edge(START, "classify")
 
-def router(state: MessagesState, config: Optional[Dict[str, Any]] = None) -> str:
+def router(state: ChatState, config: Optional[RunnableConfig] = None) -> str:
     return node_route_doc_or_chat(state, config)
 
 workflow.add_conditional_edges(
@@ -143,5 +310,62 @@ workflow.add_conditional_edges(
 
 workflow.add_edge("load_context", "answer_docs")
 
-memory = MemorySaver()
-app_graph = workflow.compile(checkpointer=memory)
\ No newline at end of file
+memory = get_checkpointer()
+app_graph = workflow.compile(checkpointer=memory)
+
+# --- Streaming de respuestas ----------------------------------------------------------
+
+# Nodos cuyos mensajes son la respuesta al usuario
+REPLY_NODES = ("answer_docs", "ask_ids", "chat")
+STREAM_MODES = ["updates", "messages"]
+
+def _graph_input(message: str, thread_id: str, context_ids: Optional[List[str]] = None):
+    state = {"messages": [HumanMessage(content=message)]}
+    config = {"configurable": {"thread_id": thread_id, "context_ids": list(context_ids or [])}}
+    return state, config
+
+def _to_event(mode: str, payload: Any) -> Optional[Tuple[str, Dict[str, Any]]]:
+    """Traduce un evento de app_graph.stream a (tipo, datos): status | token."""
+    if mode == "messages":
+        msg, meta = payload
+        if isinstance(msg, AIMessage) and msg.content and meta.get("langgraph_node") in REPLY_NODES:
+            return "token", {"text": msg.content}
+        return None
+    for node, update in (payload or {}).items():
+        if node == "classify":
+            return "status", {"stage": "classify", "intent": (update or {}).get("intent")}
+        if node == "load_context":
+            docs = (update or {}).get("context_docs") or []
+            return "status", {
+                "stage": "context",
+                "documents": [d.get("name") for d in docs],
+                "reuse": (update or {}).get("context_stats"),
+            }
+    return None
+
+def stream_reply(message: str, thread_id: str, context_ids: Optional[List[str]] = None) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Ejecuta el grafo emitiendo ("status", ...) al avanzar de nodo, ("token", {"text"})
+    por cada fragmento generado y ("done", {"message"}) con la respuesta completa.
+    """
+    state, config = _graph_input(message, thread_id, context_ids)
+    parts: List[str] = []
+    for mode, payload in app_graph.stream(state, config=config, stream_mode=STREAM_MODES):
+        event = _to_event(mode, payload)
+        if event is not None:
+            if event[0] == "token":
+                parts.append(event[1]["text"])
+            yield event
+    yield "done", {"message": "".join(parts)}
+
+async def astream_reply(message: str, thread_id: str, context_ids: Optional[List[str]] = None) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    """Versión async de stream_reply (los nodos síncronos corren en el executor del event loop)."""
+    state, config = _graph_input(message, thread_id, context_ids)
+    parts: List[str] = []
+    async for mode, payload in app_graph.astream(state, config=config, stream_mode=STREAM_MODES):
+        event = _to_event(mode, payload)
+        if event is not None:
+            if event[0] == "token":
+                parts.append(event[1]["text"])
+            yield event
+    yield "done", {"message": "".join(parts)}
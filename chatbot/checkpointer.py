@@ -0,0 +1,352 @@
+"""
+Checkpointer persistente para el grafo del chat (reemplaza a MemorySaver).
+
+SQLite en modo WAL: varios procesos del servicio de chat pueden compartir el archivo.
+Cada hilo conserva solo sus últimos CHAT_CHECKPOINTS_PER_THREAD checkpoints, los hilos
+inactivos más de CHAT_THREAD_TTL_S se eliminan, y los checkpoints se guardan con el
+serializador de LangGraph (msgpack) comprimidos con zlib.
+
+Backend configurable con CHAT_CHECKPOINTER: "sqlite" (por defecto), "memory" o una
+ruta "modulo:fabrica" que devuelva un BaseCheckpointSaver (p.ej. Postgres).
+"""
+import os
+import time
+import zlib
+import asyncio
+import sqlite3
+import importlib
+import threading
+from typing import Any, Dict, Iterator, Optional, Sequence, Tuple, AsyncIterator
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+    writes_sort_key,
+)
+
+CHAT_CHECKPOINTER = os.getenv("CHAT_CHECKPOINTER", "sqlite")
+CHAT_CHECKPOINT_DB = os.getenv("CHAT_CHECKPOINT_DB", os.path.join(".cache", "chat_checkpoints.sqlite3"))
+# Checkpoints que se conservan por hilo (el último basta para continuar la conversación)
+CHAT_CHECKPOINTS_PER_THREAD = int(os.getenv("CHAT_CHECKPOINTS_PER_THREAD", "5"))
+# Hilos sin actividad durante este tiempo se eliminan (0 = nunca)
+CHAT_THREAD_TTL_S = float(os.getenv("CHAT_THREAD_TTL_S", str(7 * 24 * 3600)))
+# Cada cuántos segundos, como mucho, se buscan hilos caducados
+CHAT_EVICTION_INTERVAL_S = float(os.getenv("CHAT_EVICTION_INTERVAL_S", "300"))
+# Por debajo de este tamaño no compensa comprimir
+COMPRESS_MIN_BYTES = 512
+
+
+class SqliteCheckpointSaver(BaseCheckpointSaver):
+    """
+    Guarda checkpoints y escrituras pendientes en SQLite. Los métodos async ejecutan los
+    síncronos en un hilo (asyncio.to_thread): una escritura lenta o la espera del lock
+    de SQLite no bloquean el event loop.
+    """
+
+    def __init__(
+        self,
+        db_path: str = CHAT_CHECKPOINT_DB,
+        max_checkpoints: int = CHAT_CHECKPOINTS_PER_THREAD,
+        ttl_s: float = CHAT_THREAD_TTL_S,
+        serde=None,
+    ):
+        super().__init__(serde=serde)
+        self.max_checkpoints = max(1, max_checkpoints)
+        self.ttl_s = ttl_s
+        self._lock = threading.Lock()
+        self._last_eviction = 0.0
+        self._counters: Dict[str, int] = {"puts": 0, "writes": 0, "pruned": 0, "evictedThreads": 0, "bytesRaw": 0, "bytesStored": 0}
+        parent = os.path.dirname(db_path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS checkpoints (
+                thread_id TEXT NOT NULL,
+                checkpoint_ns TEXT NOT NULL DEFAULT '',
+                checkpoint_id TEXT NOT NULL,
+                parent_checkpoint_id TEXT,
+                type TEXT,
+                checkpoint BLOB,
+                metadata_type TEXT,
+                metadata BLOB,
+                PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+            )"""
+        )
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS writes (
+                thread_id TEXT NOT NULL,
+                checkpoint_ns TEXT NOT NULL DEFAULT '',
+                checkpoint_id TEXT NOT NULL,
+                task_id TEXT NOT NULL,
+                idx INTEGER NOT NULL,
+                channel TEXT NOT NULL,
+                type TEXT,
+                value BLOB,
+                task_path TEXT NOT NULL DEFAULT '',
+                PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+            )"""
+        )
+        self._db.execute("CREATE TABLE IF NOT EXISTS threads (thread_id TEXT PRIMARY KEY, updated_at REAL NOT NULL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS ix_threads_updated ON threads(updated_at)")
+
+    # --- Serialización ---------------------------------------------------------------
+
+    def _dump(self, obj: Any) -> Tuple[str, bytes]:
+        kind, data = self.serde.dumps_typed(obj)
+        self._counters["bytesRaw"] += len(data)
+        if len(data) >= COMPRESS_MIN_BYTES:
+            kind, data = f"{kind}+z", zlib.compress(data, 6)
+        self._counters["bytesStored"] += len(data)
+        return kind, data
+
+    def _load(self, kind: str, data: bytes) -> Any:
+        if kind.endswith("+z"):
+            kind, data = kind[:-2], zlib.decompress(data)
+        return self.serde.loads_typed((kind, data))
+
+    # --- Lectura ---------------------------------------------------------------------
+
+    def _tuple(self, thread_id: str, ns: str, row: Tuple) -> CheckpointTuple:
+        checkpoint_id, parent_id, ckpt_type, ckpt, meta_type, meta = row
+        writes = self._db.execute(
+            "SELECT task_id, idx, channel, type, value, task_path FROM writes "
+            "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+            (thread_id, ns, checkpoint_id),
+        ).fetchall()
+        writes.sort(key=lambda w: writes_sort_key(w[5], w[0], w[1]))
+        return CheckpointTuple(
+            config={"configurable": {"thread_id": thread_id, "checkpoint_ns": ns, "checkpoint_id": checkpoint_id}},
+            checkpoint=self._load(ckpt_type, ckpt),
+            metadata=self._load(meta_type, meta),
+            parent_config=(
+                {"configurable": {"thread_id": thread_id, "checkpoint_ns": ns, "checkpoint_id": parent_id}}
+                if parent_id else None
+            ),
+            pending_writes=[(w[0], w[2], self._load(w[3], w[4])) for w in writes],
+        )
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = get_checkpoint_id(config)
+        cols = "checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata"
+        with self._lock:
+            if checkpoint_id:
+                row = self._db.execute(
+                    f"SELECT {cols} FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                    (thread_id, ns, checkpoint_id),
+                ).fetchone()
+            else:
+                row = self._db.execute(
+                    f"SELECT {cols} FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? "
+                    "ORDER BY checkpoint_id DESC LIMIT 1",
+                    (thread_id, ns),
+                ).fetchone()
+            return self._tuple(thread_id, ns, row) if row else None
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        where, params = [], []
+        if config:
+            where.append("thread_id = ?")
+            params.append(config["configurable"]["thread_id"])
+            if config["configurable"].get("checkpoint_ns") is not None:
+                where.append("checkpoint_ns = ?")
+                params.append(config["configurable"]["checkpoint_ns"])
+            if get_checkpoint_id(config):
+                where.append("checkpoint_id = ?")
+                params.append(get_checkpoint_id(config))
+        if before and get_checkpoint_id(before):
+            where.append("checkpoint_id < ?")
+            params.append(get_checkpoint_id(before))
+        sql = (
+            "SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata "
+            "FROM checkpoints" + (" WHERE " + " AND ".join(where) if where else "") + " ORDER BY checkpoint_id DESC"
+        )
+        with self._lock:
+            rows = self._db.execute(sql, params).fetchall()
+        for row in rows:
+            if limit is not None and limit <= 0:
+                break
+            with self._lock:
+                tup = self._tuple(row[0], row[1], row[2:])
+            if filter and not all(tup.metadata.get(k) == v for k, v in filter.items()):
+                continue
+            if limit is not None:
+                limit -= 1
+            yield tup
+
+    # --- Escritura -------------------------------------------------------------------
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        ns = config["configurable"].get("checkpoint_ns", "")
+        ckpt_type, ckpt = self._dump(checkpoint)
+        meta_type, meta = self._dump(get_checkpoint_metadata(config, metadata))
+        with self._lock:
+            self._counters["puts"] += 1
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (thread_id, ns, checkpoint["id"], config["configurable"].get("checkpoint_id"),
+                     ckpt_type, ckpt, meta_type, meta),
+                )
+                self._db.execute("INSERT OR REPLACE INTO threads VALUES (?, ?)", (thread_id, time.time()))
+                self._prune(thread_id, ns)
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+            self._maybe_evict()
+        return {"configurable": {"thread_id": thread_id, "checkpoint_ns": ns, "checkpoint_id": checkpoint["id"]}}
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        thread_id = config["configurable"]["thread_id"]
+        ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        rows = []
+        for idx, (channel, value) in enumerate(writes):
+            kind, data = self._dump(value)
+            rows.append((WRITES_IDX_MAP.get(channel, idx), channel, kind, data))
+        with self._lock:
+            self._counters["writes"] += len(rows)
+            for idx, channel, kind, data in rows:
+                # Las escrituras normales no se repiten; las especiales (idx < 0) se sobrescriben
+                verb = "INSERT OR REPLACE" if idx < 0 else "INSERT OR IGNORE"
+                self._db.execute(
+                    f"{verb} INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (thread_id, ns, checkpoint_id, task_id, idx, channel, kind, data, task_path),
+                )
+
+    def _prune(self, thread_id: str, ns: str) -> None:
+        """Deja solo los últimos max_checkpoints del hilo (y sus escrituras)."""
+        stale = (
+            "SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? "
+            "ORDER BY checkpoint_id DESC LIMIT -1 OFFSET ?"
+        )
+        params = (thread_id, ns, thread_id, ns, self.max_checkpoints)
+        self._db.execute(f"DELETE FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id IN ({stale})", params)
+        cur = self._db.execute(f"DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id IN ({stale})", params)
+        self._counters["pruned"] += max(0, cur.rowcount)
+
+    # --- Expiración y administración ---------------------------------------------------
+
+    def _delete_thread_rows(self, thread_id: str) -> None:
+        for table in ("checkpoints", "writes", "threads"):
+            self._db.execute(f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,))
+
+    def _maybe_evict(self) -> None:
+        now = time.time()
+        if self.ttl_s <= 0 or now - self._last_eviction < CHAT_EVICTION_INTERVAL_S:
+            return
+        self._last_eviction = now
+        self.evict_idle(now - self.ttl_s, locked=True)
+
+    def evict_idle(self, older_than: Optional[float] = None, locked: bool = False) -> int:
+        """Elimina los hilos sin actividad desde `older_than` (epoch). Devuelve cuántos."""
+        cutoff = older_than if older_than is not None else time.time() - self.ttl_s
+        if not locked:
+            with self._lock:
+                return self.evict_idle(cutoff, locked=True)
+        idle = [r[0] for r in self._db.execute("SELECT thread_id FROM threads WHERE updated_at < ?", (cutoff,))]
+        for thread_id in idle:
+            self._delete_thread_rows(thread_id)
+        self._counters["evictedThreads"] += len(idle)
+        return len(idle)
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            self._delete_thread_rows(thread_id)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            threads = self._db.execute("SELECT COUNT(*) FROM threads").fetchone()[0]
+            checkpoints, stored = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(checkpoint)), 0) FROM checkpoints"
+            ).fetchone()
+            return {
+                **self._counters,
+                "threads": threads,
+                "checkpoints": checkpoints,
+                "checkpointBytes": stored,
+                "maxCheckpointsPerThread": self.max_checkpoints,
+                "threadTtlSeconds": self.ttl_s,
+            }
+
+    # --- Async -------------------------------------------------------------------------
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        items = await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for item in items:
+            yield item
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await asyncio.to_thread(self.delete_thread, thread_id)
+
+
+def get_checkpointer() -> BaseCheckpointSaver:
+    """Checkpointer según CHAT_CHECKPOINTER."""
+    if CHAT_CHECKPOINTER == "memory":
+        from langgraph.checkpoint.memory import MemorySaver
+        return MemorySaver()
+    if CHAT_CHECKPOINTER == "sqlite":
+        return SqliteCheckpointSaver()
+    module_name, _, factory = CHAT_CHECKPOINTER.partition(":")
+    return getattr(importlib.import_module(module_name), factory)()
@@ -1,8 +1,10 @@
 import os
 import requests
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 
 BACKEND_API_BASE = os.getenv("BACKEND_API_BASE", "http://localhost:8000").rstrip("/")
+# Debe coincidir con el límite del backend (BATCH_MAX_ITEMS en api_server.py)
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "50"))
 
 class ContextClientError(Exception):
     pass
@@ -20,11 +22,70 @@ def fetch_minimal_doc(node_id: str, max_chars: int = 50000) -> Dict[str, Any]:
     except requests.RequestException as e:
         raise ContextClientError(f"Error solicitando {url}: {e}") from e
 
+def _error_doc(error: str) -> Dict[str, Any]:
+    return {"name": None, "title": None, "description": None, "content": "", "truncated": False, "_error": error}
+
 def fetch_minimal_docs(node_ids: List[str], max_chars: int = 50000) -> List[Dict[str, Any]]:
+    """
+    Recupera los documentos con POST /documents/batch, en lotes de BATCH_MAX_ITEMS
+    (el backend los descarga en paralelo). Conserva el orden de node_ids.
+    """
+    if not node_ids:
+        return []
     docs: List[Dict[str, Any]] = []
-    for nid in node_ids:
-        try:
-            docs.append(fetch_minimal_doc(nid, max_chars=max_chars))
-        except Exception as e:
-            docs.append({"name": None, "title": None, "description": None, "content": "", "truncated": False, "_error": str(e)})
-    return docs
\ No newline at end of file
+    ids = list(node_ids)
+    for start in range(0, len(ids), BATCH_MAX_ITEMS):
+        docs.extend(_fetch_minimal_batch(ids[start:start + BATCH_MAX_ITEMS], max_chars))
+    return docs
+
+def _fetch_minimal_batch(node_ids: List[str], max_chars: int) -> List[Dict[str, Any]]:
+    url = f"{BACKEND_API_BASE}/documents/batch"
+    payload = {"nodeIds": node_ids, "maxChars": max_chars, "minimal": True}
+    try:
+        r = requests.post(url, json=payload, timeout=60)
+        r.raise_for_status()
+        data = r.json()
+    except (requests.RequestException, ValueError) as e:
+        return [_error_doc(f"Error solicitando {url}: {e}") for _ in node_ids]
+
+    docs: List[Dict[str, Any]] = []
+    for item in data.get("results", []):
+        doc = item.get("document")
+        if item.get("ok") and isinstance(doc, dict) and "content" in doc:
+            # Versión del documento, para revalidar el contexto en turnos siguientes
+            doc["_modifiedAt"] = item.get("modifiedAt")
+            docs.append(doc)
+        else:
+            docs.append(_error_doc(item.get("error") or f"Respuesta inesperada para {item.get('nodeId')}: {item}"))
+    return docs
+
+def fetch_modified_at(node_ids: List[str]) -> Dict[str, Optional[str]]:
+    """
+    modifiedAt actual de cada nodo (POST /documents/modified, solo metadatos).
+    Lanza ContextClientError si falla la llamada.
+    """
+    if not node_ids:
+        return {}
+    url = f"{BACKEND_API_BASE}/documents/modified"
+    try:
+        r = requests.post(url, json={"nodeIds": list(node_ids)}, timeout=15)
+        r.raise_for_status()
+        return r.json().get("results") or {}
+    except requests.RequestException as e:
+        raise ContextClientError(f"Error solicitando {url}: {e}") from e
+
+def retrieve_chunks(query: str, k: int = 8, node_ids: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    Top-k fragmentos relevantes del índice local del backend (GET /rag/search).
+    Devuelve {"count", "indexedNodeIds", "chunks"}; lanza ContextClientError si falla.
+    """
+    url = f"{BACKEND_API_BASE}/rag/search"
+    params: Dict[str, Any] = {"q": query, "k": k}
+    if node_ids:
+        params["nodeIds"] = ",".join(node_ids)
+    try:
+        r = requests.get(url, params=params, timeout=15)
+        r.raise_for_status()
+        return r.json()
+    except requests.RequestException as e:
+        raise ContextClientError(f"Error solicitando {url}: {e}") from e
@@ -0,0 +1,239 @@
+"""
+Empaquetado del prompt con presupuesto de tokens: reparte PROMPT_TOKEN_BUDGET entre
+historial y documentos, elige los pasajes más relevantes para la pregunta (puntuación
+léxica tipo BM25, sin llamadas externas) en lugar de prefijos fijos, y resume o
+descarta los turnos antiguos del historial.
+"""
+import os
+import re
+import sys
+import math
+from collections import Counter
+from typing import Dict, Any, List, Optional, Tuple
+
+# tokenize/chunk_text del índice local (rag_index.py, en la raíz del repo)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from rag_index import tokenize, chunk_text
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding(os.getenv("PROMPT_TOKENIZER", "cl100k_base"))
+except Exception:
+    _ENCODING = None
+
+# Tokens totales del prompt (instrucciones + pregunta + historial + documentos)
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "6000"))
+# Fracción del presupuesto libre que puede usar el historial cuando también hay documentos
+PROMPT_HISTORY_SHARE = float(os.getenv("PROMPT_HISTORY_SHARE", "0.25"))
+# Turnos recientes que se conservan literales; los anteriores se resumen
+PROMPT_RECENT_TURNS = int(os.getenv("PROMPT_RECENT_TURNS", "6"))
+PROMPT_PASSAGE_CHARS = int(os.getenv("PROMPT_PASSAGE_CHARS", "700"))
+# Tokens máximos por turno antiguo dentro del resumen
+SUMMARY_TOKENS_PER_TURN = 40
+
+_PIECE_RE = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s")
+
+
+def count_tokens(text: str) -> int:
+    """Tokens con tiktoken si está instalado; si no, estimación por palabras (subpalabras en las largas)."""
+    if not text:
+        return 0
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text, disallowed_special=()))
+    return sum(1 + len(p) // 6 for p in _PIECE_RE.findall(text))
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    if max_tokens <= 0:
+        return ""
+    if count_tokens(text) <= max_tokens:
+        return text
+    # Búsqueda binaria sobre caracteres: exacta con cualquiera de los dos contadores
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if count_tokens(text[:mid]) <= max_tokens - 1:
+            lo = mid
+        else:
+            hi = mid - 1
+    return text[:lo].rstrip() + "…"
+
+
+# --- Documentos -------------------------------------------------------------------------
+
+def _passages(doc: Dict[str, Any]) -> List[str]:
+    content = doc.get("content") or ""
+    # Los documentos hechos de fragmentos RAG ya vienen cortados por "[...]"
+    parts = [p.strip() for p in content.split("\n[...]\n")]
+    passages = []
+    for part in parts:
+        passages += [part[s:e].strip() for s, e in chunk_text(part, PROMPT_PASSAGE_CHARS, 0)] if part else []
+    return [p for p in passages if p]
+
+
+def _score_passages(query: str, passages: List[List[str]]) -> List[List[float]]:
+    """BM25 de la pregunta contra cada pasaje; los IDF se calculan sobre todos los pasajes."""
+    q_terms = set(tokenize(query))
+    tokenized = [[tokenize(p) for p in doc] for doc in passages]
+    flat = [t for doc in tokenized for t in doc]
+    if not q_terms or not flat:
+        return [[0.0] * len(doc) for doc in passages]
+    n = len(flat)
+    avg_len = sum(len(t) for t in flat) / n or 1.0
+    df = Counter(term for toks in flat for term in set(toks) if term in q_terms)
+    idf = {term: math.log(1 + (n - df[term] + 0.5) / (df[term] + 0.5)) for term in df}
+    scores = []
+    for doc in tokenized:
+        doc_scores = []
+        for toks in doc:
+            tf = Counter(t for t in toks if t in idf)
+            score = 0.0
+            for term, freq in tf.items():
+                score += idf[term] * freq * 2.5 / (freq + 1.5 * (0.25 + 0.75 * len(toks) / avg_len))
+            doc_scores.append(score)
+        scores.append(doc_scores)
+    return scores
+
+
+def _doc_header(i: int, d: Dict[str, Any], truncated: bool) -> str:
+    name = d.get("name") or "(sin nombre)"
+    title = d.get("title") or ""
+    desc = d.get("description") or ""
+    return f"[DOCUMENTO {i+1} | name={name}{' | title='+title if title else ''}{' | desc='+desc if desc else ''}{' | truncado' if truncated else ''}]"
+
+
+_PASSAGE_SEP = "\n[...]\n"
+_DOC_SEP = "\n-----\n"
+_NO_PASSAGES = "(sin pasajes dentro del presupuesto)"
+
+
+def _render_documents(docs: List[Dict[str, Any]], passages: List[List[str]], chosen: List[List[int]]) -> str:
+    parts = []
+    for i, d in enumerate(docs):
+        picked = sorted(chosen[i])
+        truncated = bool(d.get("truncated")) or len(picked) < len(passages[i])
+        body = _PASSAGE_SEP.join(passages[i][j] for j in picked) if picked else _NO_PASSAGES
+        parts.append(f"{_doc_header(i, d, truncated)}\n{body}\n[FIN DOCUMENTO {i+1}]")
+    return _DOC_SEP.join(parts)
+
+
+def pack_documents(docs: List[Dict[str, Any]], query: str, budget: int) -> Tuple[str, Dict[str, Any]]:
+    """
+    Elige pasajes por relevancia hasta agotar `budget` tokens, por turnos entre documentos
+    (cada uno toma su mejor pasaje restante) para que ninguno acapare el presupuesto.
+    Dentro de cada documento los pasajes se emiten en orden de lectura. El texto final
+    nunca pasa de `budget` tokens.
+    """
+    passages = [_passages(d) for d in docs]
+    scores = _score_passages(query, passages)
+    sizes = [[count_tokens(p) for p in doc] for doc in passages]
+    # Orden de preferencia por documento: mayor puntuación y, a igualdad, el que aparece antes
+    queues = [sorted(range(len(doc)), key=lambda j, s=s: (-s[j], j)) for doc, s in zip(passages, scores)]
+    chosen: List[List[int]] = [[] for _ in docs]
+    # Orden en que se eligieron los pasajes: si el texto final no cabe, se quitan desde el último
+    picks: List[Tuple[int, int]] = []
+    sep_cost = count_tokens(_PASSAGE_SEP)
+    # Cabecera (en su forma más larga), cierre y separador de cada documento
+    remaining = budget - sum(
+        count_tokens(f"{_doc_header(i, d, True)}\n{_NO_PASSAGES}\n[FIN DOCUMENTO {i+1}]") + count_tokens(_DOC_SEP)
+        for i, d in enumerate(docs)
+    )
+
+    progress = True
+    while progress and remaining > 0:
+        progress = False
+        for i, queue in enumerate(queues):
+            # El mejor pasaje que aún cabe (con su separador); los que no caben se descartan
+            while queue and sizes[i][queue[0]] + sep_cost > remaining:
+                queue.pop(0)
+            if queue:
+                j = queue.pop(0)
+                chosen[i].append(j)
+                picks.append((i, j))
+                remaining -= sizes[i][j] + sep_cost
+                progress = True
+
+    # Los conteos por pieza son una estimación (los tokens no siempre suman al concatenar):
+    # se comprueba el texto final y se quitan pasajes hasta que quepa
+    text = _render_documents(docs, passages, chosen)
+    while picks and count_tokens(text) > budget:
+        i, j = picks.pop()
+        chosen[i].remove(j)
+        text = _render_documents(docs, passages, chosen)
+    if count_tokens(text) > budget:
+        # Ni las cabeceras caben
+        text = truncate_tokens(text, budget)
+    stats = {
+        "documents": len(docs),
+        "passages": sum(len(p) for p in passages),
+        "passagesUsed": sum(len(c) for c in chosen),
+        "tokensBefore": sum(sum(s) for s in sizes),
+        "tokensAfter": count_tokens(text),
+    }
+    return text, stats
+
+
+# --- Historial --------------------------------------------------------------------------
+
+def _first_sentence(text: str) -> str:
+    return _SENTENCE_END_RE.split(text.strip(), maxsplit=1)[0]
+
+
+def pack_history(turns: List[Tuple[str, str]], budget: int, recent_turns: int = PROMPT_RECENT_TURNS) -> Tuple[str, Dict[str, Any]]:
+    """
+    `turns` son (rol, texto) en orden cronológico. Los últimos `recent_turns` van literales
+    (del más reciente hacia atrás mientras quepan); los anteriores se resumen en una
+    línea cada uno (su primera oración, acotada) y, si aun así no caben, se descartan.
+    """
+    lines = [f"{role}: {text}" for role, text in turns]
+    before = sum(count_tokens(l) for l in lines)
+    kept: List[str] = []
+    remaining = budget
+    cut = len(lines)
+    for idx in range(len(lines) - 1, max(-1, len(lines) - 1 - recent_turns), -1):
+        cost = count_tokens(lines[idx])
+        if cost > remaining:
+            if not kept:
+                # El turno más reciente siempre entra, aunque sea recortado
+                kept.append(truncate_tokens(lines[idx], remaining))
+                remaining = 0
+                cut = idx
+            break
+        kept.append(lines[idx])
+        remaining -= cost
+        cut = idx
+    kept.reverse()
+
+    summary: List[str] = []
+    for role, text in reversed(turns[:cut]):
+        line = f"- {role}: {truncate_tokens(_first_sentence(text), SUMMARY_TOKENS_PER_TURN)}"
+        cost = count_tokens(line)
+        if cost > remaining:
+            break
+        summary.append(line)
+        remaining -= cost
+    summary.reverse()
+
+    text = "\n".join(kept)
+    if summary:
+        text = "Resumen de turnos anteriores:\n" + "\n".join(summary) + "\n\nTurnos recientes:\n" + text
+    stats = {
+        "turns": len(turns),
+        "turnsVerbatim": len(kept),
+        "turnsSummarized": len(summary),
+        "turnsDropped": cut - len(summary),
+        "tokensBefore": before,
+        "tokensAfter": count_tokens(text),
+    }
+    return text, stats
+
+
+def split_budget(fixed_text: str, has_docs: bool, budget: Optional[int] = None) -> Tuple[int, int]:
+    """(tokens para historial, tokens para documentos) una vez descontado el texto fijo."""
+    # Margen para separadores y cabeceras que se añaden al unir los bloques
+    free = max(0, (budget or PROMPT_TOKEN_BUDGET) - count_tokens(fixed_text) - 32)
+    if not has_docs:
+        return free, 0
+    history = int(free * PROMPT_HISTORY_SHARE)
+    return history, free - history
@@ -0,0 +1,161 @@
+import os
+import mmap
+import tempfile
+import threading
+from typing import Dict, Any, Optional, Union
+
+try:
+    import resource
+except Exception:
+    resource = None
+
+# Descargas por debajo de este tamaño se quedan en memoria; por encima van a un archivo temporal
+DOWNLOAD_SPILL_THRESHOLD_MB = float(os.getenv("DOWNLOAD_SPILL_THRESHOLD_MB", "1"))
+DOWNLOAD_TMP_DIR = os.getenv("DOWNLOAD_TMP_DIR") or None
+
+
+class _BufferStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.memory_bytes = 0
+        self.peak_memory_bytes = 0
+        self.open_buffers = 0
+        self.spilled_files = 0
+        self.spilled_bytes = 0
+        self.total_spills = 0
+
+    def add_memory(self, n: int) -> None:
+        with self._lock:
+            self.memory_bytes += n
+            self.peak_memory_bytes = max(self.peak_memory_bytes, self.memory_bytes)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            snap = {
+                "spillThresholdBytes": int(DOWNLOAD_SPILL_THRESHOLD_MB * 1024 * 1024),
+                "openBuffers": self.open_buffers,
+                "inMemoryBytes": self.memory_bytes,
+                "peakInMemoryBytes": self.peak_memory_bytes,
+                "spilledFilesOpen": self.spilled_files,
+                "spilledBytesOpen": self.spilled_bytes,
+                "totalSpills": self.total_spills,
+            }
+        if resource is not None:
+            # ru_maxrss está en KB en Linux
+            snap["processPeakRssBytes"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        return snap
+
+
+_stats = _BufferStats()
+
+
+class ContentBuffer:
+    """
+    Destino de una descarga: acumula en memoria hasta spill_threshold bytes y, si la
+    descarga crece más, vuelca a un archivo temporal. Así la memoria por petición queda
+    acotada por el umbral, sin importar MAX_DOWNLOAD_MB.
+
+    Los extractores reciben source(): el bytearray si está en memoria, o la ruta del archivo
+    temporal, que el extractor mapea en memoria (mmap) sin copiarlo al heap; en el pool
+    de procesos solo viaja la ruta, no los bytes. Hay que llamar a close() (o usar `with`)
+    para borrar el temporal.
+    """
+
+    def __init__(self, spill_threshold: Optional[int] = None, tmp_dir: Optional[str] = DOWNLOAD_TMP_DIR):
+        self.spill_threshold = int(DOWNLOAD_SPILL_THRESHOLD_MB * 1024 * 1024) if spill_threshold is None else spill_threshold
+        self.tmp_dir = tmp_dir
+        self._mem: Optional[bytearray] = bytearray()
+        self._file = None
+        self._size = 0
+        self._closed = False
+        with _stats._lock:
+            _stats.open_buffers += 1
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def spilled(self) -> bool:
+        return self._file is not None
+
+    @property
+    def path(self) -> Optional[str]:
+        return self._file.name if self._file is not None else None
+
+    def _spill(self) -> None:
+        self._file = tempfile.NamedTemporaryFile(prefix="alfresco-dl-", dir=self.tmp_dir, delete=False)
+        self._file.write(self._mem)
+        _stats.add_memory(-len(self._mem))
+        self._mem = None
+        with _stats._lock:
+            _stats.spilled_files += 1
+            _stats.spilled_bytes += self._size
+            _stats.total_spills += 1
+
+    def write(self, chunk: bytes) -> None:
+        if not chunk:
+            return
+        if self._file is None and self._size + len(chunk) > self.spill_threshold:
+            self._spill()
+        if self._file is not None:
+            self._file.write(chunk)
+            with _stats._lock:
+                _stats.spilled_bytes += len(chunk)
+        else:
+            self._mem += chunk
+            _stats.add_memory(len(chunk))
+        self._size += len(chunk)
+
+    def source(self) -> Union[bytearray, bytes, str]:
+        """
+        El buffer en memoria (sin copiarlo) o la ruta del archivo temporal, para los
+        extractores. El buffer no debe modificarse mientras se extrae de él.
+        """
+        if self._file is not None:
+            self._file.flush()
+            return self._file.name
+        return self._mem if self._mem is not None else b""
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        with _stats._lock:
+            _stats.open_buffers -= 1
+        if self._file is not None:
+            path = self._file.name
+            self._file.close()
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+            with _stats._lock:
+                _stats.spilled_files -= 1
+                _stats.spilled_bytes -= self._size
+            self._file = None
+        elif self._mem is not None:
+            _stats.add_memory(-len(self._mem))
+            self._mem = None
+
+    def __enter__(self) -> "ContentBuffer":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def open_source(source: Union[bytes, str]):
+    """
+    Devuelve un objeto bytes-like/seekable para extraer: los bytes tal cual, o un mmap
+    de solo lectura sobre el archivo temporal (vista sin copia). Cerrar el mmap al terminar.
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return source
+    with open(source, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def download_buffer_stats() -> Dict[str, Any]:
+    return _stats.snapshot()
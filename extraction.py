@@ -0,0 +1,405 @@
+import os
+import io
+import mmap
+import time
+import signal
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Any, Optional, Callable, Iterator, List, Tuple, Union
+
+from content_buffer import open_source
+from metrics import EXTRACTION_SECONDS
+from text_decoding import decode_text
+
+# Extracción de texto
+try:
+    from pypdf import PdfReader
+except Exception:
+    PdfReader = None
+try:
+    from docx import Document
+except Exception:
+    Document = None
+try:
+    import resource
+except Exception:
+    resource = None
+
+# Motor de extracción: "process" (pool de procesos) o "inline" (en el hilo que llama)
+EXTRACTION_ENGINE = os.getenv("EXTRACTION_ENGINE", "process").lower()
+EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", str(min(4, os.cpu_count() or 1))))
+EXTRACTION_TIMEOUT_S = float(os.getenv("EXTRACTION_TIMEOUT_S", "60"))
+EXTRACTION_MEMORY_MB = int(os.getenv("EXTRACTION_MEMORY_MB", "1024"))
+# Textos planos por debajo de este tamaño se decodifican inline (no compensa el IPC)
+EXTRACTION_INLINE_MAX_BYTES = int(os.getenv("EXTRACTION_INLINE_MAX_BYTES", str(256 * 1024)))
+
+class _BufferReader(io.RawIOBase):
+    """
+    Stream de solo lectura sobre un buffer (bytearray/memoryview) sin copiarlo: BytesIO
+    copiaría todo lo que no sea bytes. close() libera la vista para que el buffer pueda
+    volver a crecer (un bytearray con vistas vivas no se puede redimensionar).
+    """
+
+    def __init__(self, data: Any):
+        self._view = memoryview(data).cast("B")
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._pos, io.SEEK_END: len(self._view)}[whence]
+        self._pos = max(0, base + offset)
+        return self._pos
+
+    def read(self, size: Optional[int] = -1) -> bytes:
+        end = len(self._view) if size is None or size < 0 else min(len(self._view), self._pos + size)
+        chunk = bytes(self._view[self._pos:end]) if end > self._pos else b""
+        self._pos = max(self._pos, end)
+        return chunk
+
+    def readall(self) -> bytes:
+        return self.read()
+
+    def readinto(self, b: Any) -> int:
+        chunk = self.read(len(b))
+        b[:len(chunk)] = chunk
+        return len(chunk)
+
+    def close(self) -> None:
+        if not self.closed:
+            self._view.release()
+        super().close()
+
+def _as_stream(data: Any) -> Any:
+    # Un mmap ya es un stream con seek/read: se usa directamente, sin copiarlo a BytesIO
+    if isinstance(data, mmap.mmap):
+        data.seek(0)
+        return data
+    # BytesIO comparte un objeto bytes sin copiarlo; cualquier otro buffer se lee a través de una vista
+    if isinstance(data, bytes):
+        return io.BytesIO(data)
+    return _BufferReader(data)
+
+def _result(text: str, unit: Optional[str] = None, covered: int = 0, total: int = 0,
+            complete: bool = True, chars_budget: Optional[int] = None,
+            offsets: Optional[List[int]] = None) -> Dict[str, Any]:
+    res = {"text": text, "unit": unit, "covered": covered, "total": total,
+           "complete": complete, "charsBudget": None if complete else chars_budget}
+    if offsets is not None:
+        res["offsets"] = offsets
+    return res
+
+def _failure(text: str) -> Dict[str, Any]:
+    # Fallo transitorio del motor (timeout, memoria, worker caído): la nota no es el texto del documento
+    res = _result(text, complete=False)
+    res["failed"] = True
+    return res
+
+def _join_parts(parts: List[str]) -> Tuple[str, List[int]]:
+    """Une las partes con saltos de línea y devuelve (texto sin espacios en los extremos, inicio de cada parte)."""
+    joined = "\n".join(parts)
+    text = joined.strip()
+    lead = len(joined) - len(joined.lstrip())
+    offsets = []
+    pos = 0
+    for part in parts:
+        offsets.append(min(max(0, pos - lead), len(text)))
+        pos += len(part) + 1
+    return text, offsets
+
+def iter_pdf_pages(reader: "PdfReader") -> Iterator[str]:
+    """Texto página a página; pypdf solo parsea el contenido de cada página cuando se pide."""
+    for page in reader.pages:
+        try:
+            yield page.extract_text() or ""
+        except Exception:
+            yield ""
+
+def iter_docx_paragraphs(doc: Any) -> Iterator[str]:
+    for p in doc.paragraphs:
+        yield p.text
+
+def _collect_until(parts: Iterator[str], max_chars: Optional[int]) -> List[str]:
+    # Consume el iterador solo hasta cubrir max_chars (None = todo)
+    out: List[str] = []
+    count = 0
+    for part in parts:
+        out.append(part)
+        count += len(part) + 1
+        if max_chars and count >= max_chars:
+            break
+    return out
+
+def _extract_text_from_pdf(data: Any, max_chars: Optional[int] = None) -> Dict[str, Any]:
+    if not PdfReader:
+        return _result("[PDF: pypdf no instalado]")
+    try:
+        with _as_stream(data) as stream:
+            reader = PdfReader(stream)
+            total = len(reader.pages)
+            parts = _collect_until(iter_pdf_pages(reader), max_chars)
+        # Inicio de cada página en el texto: permite leer por rango de páginas desde el índice
+        text, offsets = _join_parts(parts)
+        return _result(text, "pages", len(parts), total, len(parts) >= total, max_chars, offsets)
+    except Exception as e:
+        return _result(f"[PDF: error al extraer texto: {e}]")
+
+def _extract_text_from_docx(data: Any, max_chars: Optional[int] = None) -> Dict[str, Any]:
+    if not Document:
+        return _result("[DOCX: python-docx no instalado]")
+    try:
+        with _as_stream(data) as stream:
+            doc = Document(stream)
+            total = len(doc.paragraphs)
+            parts = _collect_until(iter_docx_paragraphs(doc), max_chars)
+        return _result("\n".join(parts).strip(), "paragraphs", len(parts), total, len(parts) >= total, max_chars)
+    except Exception as e:
+        return _result(f"[DOCX: error al extraer texto: {e}]")
+
+def _extract_text_plain(data: Any, max_chars: Optional[int] = None) -> Dict[str, Any]:
+    return _result(decode_text(data)[0])
+
+EXTRACTORS: Dict[str, Callable[..., Dict[str, Any]]] = {
+    "text": _extract_text_plain,
+    "pdf": _extract_text_from_pdf,
+    "docx": _extract_text_from_docx,
+}
+_LABELS = {"text": "TEXTO", "pdf": "PDF", "docx": "DOCX"}
+
+class ExtractionTimeout(BaseException):
+    # BaseException: los extractores capturan Exception por página y no deben tragárselo
+    pass
+
+def _raise_timeout(signum, frame):
+    raise ExtractionTimeout()
+
+def _run_extractor(kind: str, source: Union[bytes, str], max_chars: Optional[int] = None) -> Dict[str, Any]:
+    # source: bytes en memoria o ruta de una descarga volcada a disco (se mapea con mmap)
+    data = open_source(source)
+    try:
+        return EXTRACTORS[kind](data, max_chars)
+    finally:
+        if isinstance(data, mmap.mmap):
+            data.close()
+
+def _source_size(source: Union[bytes, str]) -> int:
+    return len(source) if not isinstance(source, str) else os.path.getsize(source)
+
+def _run_extractor_job(kind: str, source: Union[bytes, str], max_chars: Optional[int], timeout_s: float) -> Dict[str, Any]:
+    """
+    Punto de entrada en el proceso worker (importable a nivel de módulo). El timeout
+    se aplica dentro del worker con SIGALRM, así solo cuenta el tiempo de ejecución
+    y no la espera en cola.
+    """
+    t0 = time.perf_counter()
+    use_alarm = timeout_s > 0 and hasattr(signal, "setitimer")
+    if use_alarm:
+        signal.signal(signal.SIGALRM, _raise_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout_s)
+    try:
+        return {"result": _run_extractor(kind, source, max_chars), "outcome": "ok", "seconds": time.perf_counter() - t0}
+    except ExtractionTimeout:
+        return {"result": None, "outcome": "timeout", "seconds": time.perf_counter() - t0}
+    except MemoryError:
+        return {"result": None, "outcome": "memory", "seconds": time.perf_counter() - t0}
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+def _limit_worker_memory(memory_mb: int) -> None:
+    # Inicializador del worker: tope de memoria virtual; un PDF patológico da MemoryError
+    # dentro del worker en lugar de tumbar el servidor.
+    if resource is None or memory_mb <= 0:
+        return
+    limit = memory_mb * 1024 * 1024
+    try:
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    except (ValueError, OSError):
+        pass
+
+
+class ExtractionMetrics:
+    def __init__(self, workers: int = 1):
+        self._lock = threading.Lock()
+        self.workers = workers
+        self._in_flight = 0
+        self._per_mime: Dict[str, Dict[str, float]] = {}
+
+    def submitted(self) -> None:
+        with self._lock:
+            self._in_flight += 1
+
+    def finished(self, mime: str, mode: str, elapsed: float, outcome: str = "ok") -> None:
+        EXTRACTION_SECONDS.observe(elapsed, mime=mime or "desconocido", mode=mode)
+        with self._lock:
+            self._in_flight -= 1
+            m = self._per_mime.setdefault(mime or "desconocido", {
+                "jobs": 0, "inline": 0, "process": 0, "errors": 0, "timeouts": 0,
+                "totalSeconds": 0.0, "maxSeconds": 0.0,
+            })
+            m["jobs"] += 1
+            m[mode] += 1
+            m["totalSeconds"] += elapsed
+            m["maxSeconds"] = max(m["maxSeconds"], elapsed)
+            if outcome == "timeout":
+                m["timeouts"] += 1
+            elif outcome != "ok":
+                m["errors"] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            per_mime = {}
+            for mime, m in self._per_mime.items():
+                per_mime[mime] = {**m, "avgSeconds": (m["totalSeconds"] / m["jobs"]) if m["jobs"] else 0.0}
+            return {
+                "inFlight": self._in_flight,
+                # Trabajos esperando un worker libre
+                "queueDepth": max(0, self._in_flight - self.workers),
+                "perMime": per_mime,
+            }
+
+
+class InlineExtractionEngine:
+    """Extrae en el hilo que llama (útil en desarrollo o con EXTRACTION_WORKERS=0)."""
+
+    def __init__(self):
+        self.metrics = ExtractionMetrics()
+
+    def extract(self, kind: str, source: Union[bytes, str], mime: str = "", max_chars: Optional[int] = None) -> Dict[str, Any]:
+        self.metrics.submitted()
+        t0 = time.perf_counter()
+        try:
+            return _run_extractor(kind, source, max_chars)
+        finally:
+            self.metrics.finished(mime, "inline", time.perf_counter() - t0)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"engine": "inline", **self.metrics.snapshot()}
+
+    def shutdown(self, wait: bool = False) -> None:
+        pass
+
+
+class ProcessPoolExtractionEngine:
+    """
+    Envía la extracción CPU-bound (pypdf es Python puro y retiene el GIL) a un pool de
+    procesos con timeout por trabajo y tope de memoria por worker. Los textos pequeños
+    se decodifican inline. Si un trabajo excede el timeout o la memoria, el documento
+    recibe una nota de error en lugar del texto (con "failed": no se guarda en caché);
+    si un worker muere, el pool se recrea y el trabajo se reintenta una vez.
+    """
+
+    def __init__(
+        self,
+        workers: int = EXTRACTION_WORKERS,
+        timeout_s: float = EXTRACTION_TIMEOUT_S,
+        memory_mb: int = EXTRACTION_MEMORY_MB,
+        inline_max_bytes: int = EXTRACTION_INLINE_MAX_BYTES,
+    ):
+        self.workers = max(1, workers)
+        self.timeout_s = timeout_s
+        self.memory_mb = memory_mb
+        self.inline_max_bytes = inline_max_bytes
+        self.metrics = ExtractionMetrics(self.workers)
+        self._lock = threading.Lock()
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._restarts = 0
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                # forkserver/spawn: no heredamos hilos ni sockets del servidor
+                method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context(method),
+                    initializer=_limit_worker_memory,
+                    initargs=(self.memory_mb,),
+                )
+            return self._pool
+
+    def _restart_pool(self, broken: ProcessPoolExecutor) -> None:
+        with self._lock:
+            if self._pool is not broken:
+                return
+            self._pool = None
+            self._restarts += 1
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def extract(self, kind: str, source: Union[bytes, str], mime: str = "", max_chars: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Devuelve {"text", "unit", "covered", "total", "complete", "charsBudget"}. Con max_chars
+        los PDF/DOCX dejan de parsearse en cuanto se cubre el presupuesto de caracteres.
+        Si source es una ruta (descarga volcada a disco), al worker solo viaja la ruta.
+        """
+        self.metrics.submitted()
+        t0 = time.perf_counter()
+        if kind == "text" and _source_size(source) <= self.inline_max_bytes:
+            try:
+                return _run_extractor(kind, source, max_chars)
+            finally:
+                self.metrics.finished(mime, "inline", time.perf_counter() - t0)
+
+        label = _LABELS.get(kind, kind.upper())
+        for attempt in range(2):
+            pool = self._get_pool()
+            try:
+                job = pool.submit(_run_extractor_job, kind, source, max_chars, self.timeout_s).result()
+                break
+            except BrokenProcessPool as e:
+                # El worker murió (p.ej. OOM del sistema): recreamos el pool y reintentamos una vez
+                self._restart_pool(pool)
+                if attempt:
+                    self.metrics.finished(mime, "process", time.perf_counter() - t0, "error")
+                    return _failure(f"[{label}: error al extraer texto: {e}]")
+
+        self.metrics.finished(mime, "process", job["seconds"], job["outcome"])
+        if job["outcome"] == "timeout":
+            return _failure(f"[{label}: la extracción excedió {self.timeout_s:g}s]")
+        if job["outcome"] == "memory":
+            return _failure(f"[{label}: la extracción excedió el límite de memoria ({self.memory_mb} MB)]")
+        return job["result"]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "engine": "process",
+            "workers": self.workers,
+            "timeoutSeconds": self.timeout_s,
+            "memoryLimitMB": self.memory_mb,
+            "inlineMaxBytes": self.inline_max_bytes,
+            "poolRestarts": self._restarts,
+            **self.metrics.snapshot(),
+        }
+
+    def shutdown(self, wait: bool = False) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=wait, cancel_futures=True)
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+def get_extraction_engine():
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                if EXTRACTION_ENGINE == "inline" or EXTRACTION_WORKERS <= 0:
+                    _engine = InlineExtractionEngine()
+                else:
+                    _engine = ProcessPoolExtractionEngine()
+    return _engine
+
+def extraction_stats() -> Dict[str, Any]:
+    return get_extraction_engine().stats()
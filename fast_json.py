@@ -0,0 +1,27 @@
+"""
+JSON rápido para respuestas de Alfresco y de la API: orjson si está instalado (parseo y
+serialización en Rust, varias veces más rápido que json en páginas de cientos de
+entradas); si no, el módulo json de la biblioteca estándar con la misma salida.
+"""
+import json
+from typing import Any, Union
+
+try:
+    import orjson
+except Exception:
+    orjson = None
+
+JSON_BACKEND = "orjson" if orjson is not None else "json"
+
+
+def loads(data: Union[bytes, bytearray, memoryview, str]) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(obj: Any) -> bytes:
+    """JSON compacto en UTF-8 (sin escapar caracteres no ASCII)."""
+    if orjson is not None:
+        return orjson.dumps(obj, default=str, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
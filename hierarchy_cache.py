@@ -0,0 +1,222 @@
+import os
+import time
+import asyncio
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple, Set
+
+from response_cache import _retrieve_exception
+from list_docs_async import get_document_library_folder, list_folder_children, get_node_metadata, NODE_MODIFIED_FIELDS
+
+HIERARCHY_CACHE_ENABLED = os.getenv("HIERARCHY_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+# Dentro de esta ventana se sirve sin revalidar; después se compara el modifiedAt de la carpeta
+HIERARCHY_FRESH_S = float(os.getenv("HIERARCHY_FRESH_S", "5"))
+# Edad máxima de un listado aunque la carpeta no cambie (red de seguridad)
+HIERARCHY_MAX_AGE_S = float(os.getenv("HIERARCHY_MAX_AGE_S", "300"))
+HIERARCHY_CACHE_MAX_FOLDERS = int(os.getenv("HIERARCHY_CACHE_MAX_FOLDERS", "2000"))
+HIERARCHY_PREFETCH = os.getenv("HIERARCHY_PREFETCH", "true").lower() in ("1", "true", "yes")
+HIERARCHY_PREFETCH_MAX_FOLDERS = int(os.getenv("HIERARCHY_PREFETCH_MAX_FOLDERS", "10"))
+HIERARCHY_PREFETCH_CONCURRENCY = int(os.getenv("HIERARCHY_PREFETCH_CONCURRENCY", "4"))
+
+# (item_type, max_items, skip_count, exclude_system_and_generated)
+PageKey = Tuple[str, int, int, bool]
+
+
+class HierarchyCache:
+    """
+    Caché de la jerarquía para el navegador de documentos:
+    - siteId -> documentLibrary: se memoriza para siempre (ese nodeId no cambia).
+    - Hijos de carpeta: por carpeta y página, validados contra el modifiedAt de la
+      carpeta (una llamada barata a la API de nodos, sin Solr). Alfresco actualiza el
+      cm:modified del padre al crear/borrar/renombrar hijos (system.enableTimestampPropagation).
+    - Prefetch opcional en segundo plano del primer nivel de subcarpetas al abrir una.
+    Pensada para usarse desde un único event loop.
+    """
+
+    def __init__(self):
+        self._doclib: Dict[str, Dict[str, Any]] = {}
+        # folder_id -> {"modifiedAt", "pages": {PageKey: (fetched_at, result)}}
+        self._folders: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._inflight: Dict[Tuple[str, PageKey], "asyncio.Task[Dict[str, Any]]"] = {}
+        self._prefetch_sem = asyncio.Semaphore(HIERARCHY_PREFETCH_CONCURRENCY)
+        self._prefetch_tasks: Set[asyncio.Task] = set()
+        self._counters: Dict[str, int] = {
+            "doclibHits": 0, "doclibMisses": 0,
+            "hits": 0, "revalidated": 0, "misses": 0, "invalidations": 0, "evictions": 0,
+            "prefetched": 0, "prefetchHits": 0, "errors": 0,
+        }
+        self._prefetched: Set[str] = set()
+
+    # --- documentLibrary -----------------------------------------------------------
+
+    async def get_document_library(self, site_id: str) -> Optional[Dict[str, Any]]:
+        hit = self._doclib.get(site_id)
+        if hit is not None:
+            self._counters["doclibHits"] += 1
+            return hit
+        self._counters["doclibMisses"] += 1
+        dl = await get_document_library_folder(site_id)
+        # Solo se memorizan resultados positivos: un site recién creado puede no estar indexado aún
+        if dl:
+            self._doclib[site_id] = dl
+        return dl
+
+    # --- Hijos de carpeta ----------------------------------------------------------
+
+    async def _folder_modified(self, folder_id: str) -> Optional[str]:
+        meta = await get_node_metadata(folder_id, include="", fields=NODE_MODIFIED_FIELDS)
+        return meta.get("modifiedAt")
+
+    async def _fetch(self, folder_id: str, key: PageKey) -> Tuple[Dict[str, Any], Optional[str]]:
+        item_type, max_items, skip_count, exclude = key
+        # El modifiedAt se lee antes que el listado (no en paralelo): así el listado nunca es más
+        # antiguo que la versión registrada, y un cambio entre ambos lo detecta la próxima revalidación
+        modified = await self._folder_modified(folder_id)
+        result = await list_folder_children(folder_id, item_type, max_items, skip_count, exclude, use_cache=False)
+        return result, modified
+
+    def _store(self, folder_id: str, key: PageKey, modified: Optional[str], result: Dict[str, Any]) -> None:
+        folder = self._folders.get(folder_id)
+        if folder is None or folder["modifiedAt"] != modified:
+            folder = {"modifiedAt": modified, "pages": {}}
+            self._folders[folder_id] = folder
+        folder["pages"][key] = (time.monotonic(), result)
+        self._folders.move_to_end(folder_id)
+        while len(self._folders) > HIERARCHY_CACHE_MAX_FOLDERS:
+            evicted, _ = self._folders.popitem(last=False)
+            self._prefetched.discard(evicted)
+            self._counters["evictions"] += 1
+
+    async def _load(self, folder_id: str, key: PageKey) -> Dict[str, Any]:
+        # Single-flight por (carpeta, página): una navegación y un prefetch simultáneos hacen una sola consulta
+        flight = (folder_id, key)
+        pending = self._inflight.get(flight)
+        if pending is None:
+            # La consulta corre en su propia tarea: si la navegación que la inició se cancela
+            # (cliente desconectado), los demás que esperan la misma página reciben el resultado
+            pending = asyncio.ensure_future(self._fetch_and_store(folder_id, key))
+            pending.add_done_callback(_retrieve_exception)
+            self._inflight[flight] = pending
+        return await asyncio.shield(pending)
+
+    async def _fetch_and_store(self, folder_id: str, key: PageKey) -> Dict[str, Any]:
+        try:
+            result, modified = await self._fetch(folder_id, key)
+        except Exception:
+            self._counters["errors"] += 1
+            raise
+        finally:
+            self._inflight.pop((folder_id, key), None)
+        self._store(folder_id, key, modified, result)
+        return result
+
+    async def get_children(
+        self,
+        folder_id: str,
+        item_type: str = "all",
+        max_items: int = 50,
+        skip_count: int = 0,
+        exclude_system_and_generated: bool = True,
+        prefetch: bool = HIERARCHY_PREFETCH,
+    ) -> Tuple[Dict[str, Any], str]:
+        """Devuelve (resultado, estado) con estado en HIT | REVALIDATED | MISS."""
+        key: PageKey = (item_type, max_items, skip_count, exclude_system_and_generated)
+        status = "MISS"
+        result = None
+        folder = self._folders.get(folder_id)
+        entry = folder["pages"].get(key) if folder else None
+        if entry is not None:
+            age = time.monotonic() - entry[0]
+            if age < HIERARCHY_FRESH_S:
+                result, status = entry[1], "HIT"
+            elif age < HIERARCHY_MAX_AGE_S and await self._folder_modified(folder_id) == folder["modifiedAt"]:
+                folder["pages"][key] = (time.monotonic(), entry[1])
+                result, status = entry[1], "REVALIDATED"
+            else:
+                self._counters["invalidations"] += 1
+
+        if result is None:
+            result = await self._load(folder_id, key)
+        else:
+            self._folders.move_to_end(folder_id)
+
+        if status == "MISS":
+            self._counters["misses"] += 1
+        else:
+            self._counters["hits" if status == "HIT" else "revalidated"] += 1
+            if folder_id in self._prefetched:
+                self._prefetched.discard(folder_id)
+                self._counters["prefetchHits"] += 1
+
+        if prefetch:
+            self._schedule_prefetch(result, key)
+        return result, status
+
+    # --- Prefetch ------------------------------------------------------------------
+
+    def _schedule_prefetch(self, result: Dict[str, Any], key: PageKey) -> None:
+        subfolders = [e["id"] for e in result.get("entries", []) if e.get("isFolder")]
+        for sub in subfolders[:HIERARCHY_PREFETCH_MAX_FOLDERS]:
+            folder = self._folders.get(sub)
+            if (folder and key in folder["pages"]) or (sub, key) in self._inflight:
+                continue
+            task = asyncio.create_task(self._prefetch_one(sub, key))
+            self._prefetch_tasks.add(task)
+            task.add_done_callback(self._prefetch_tasks.discard)
+
+    async def _prefetch_one(self, folder_id: str, key: PageKey) -> None:
+        async with self._prefetch_sem:
+            try:
+                await self._load(folder_id, key)
+            except Exception:
+                # Un prefetch fallido no importa: la navegación real volverá a intentarlo
+                return
+        self._prefetched.add(folder_id)
+        self._counters["prefetched"] += 1
+
+    # --- Administración --------------------------------------------------------------
+
+    def invalidate(self, folder_id: Optional[str] = None) -> int:
+        if folder_id is not None:
+            return 1 if self._folders.pop(folder_id, None) is not None else 0
+        n = len(self._folders) + len(self._doclib)
+        self._folders.clear()
+        self._doclib.clear()
+        self._prefetched.clear()
+        return n
+
+    async def aclose(self) -> None:
+        for task in list(self._prefetch_tasks):
+            task.cancel()
+        if self._prefetch_tasks:
+            await asyncio.gather(*self._prefetch_tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._counters,
+            "sites": len(self._doclib),
+            "folders": len(self._folders),
+            "pages": sum(len(f["pages"]) for f in self._folders.values()),
+            "prefetchInFlight": len(self._prefetch_tasks),
+            "maxFolders": HIERARCHY_CACHE_MAX_FOLDERS,
+            "freshSeconds": HIERARCHY_FRESH_S,
+            "maxAgeSeconds": HIERARCHY_MAX_AGE_S,
+        }
+
+
+_hierarchy_cache: Optional[HierarchyCache] = None
+
+
+def get_hierarchy_cache() -> Optional[HierarchyCache]:
+    global _hierarchy_cache
+    if not HIERARCHY_CACHE_ENABLED:
+        return None
+    if _hierarchy_cache is None:
+        _hierarchy_cache = HierarchyCache()
+    return _hierarchy_cache
+
+
+async def aclose_hierarchy_cache() -> None:
+    global _hierarchy_cache
+    if _hierarchy_cache is not None:
+        await _hierarchy_cache.aclose()
+        _hierarchy_cache = None
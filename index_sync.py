@@ -0,0 +1,409 @@
+"""
+Sincronización incremental del contenido de Alfresco hacia un almacén local (SQLite).
+
+En lugar de recorrer y descargar todo en cada ejecución, guarda una marca de agua
+(high-water mark) de cm:modified y en la siguiente ejecución solo pide a la Search API
+los nodos modificados desde entonces. Solo se re-extrae el texto de los nodos cuya
+versión (modifiedAt|versionLabel|size) cambió. La marca se guarda después de cada
+página procesada, así que si el proceso se cae se reanuda desde la última página.
+
+Uso:
+  python index_sync.py            # sincroniza cambios desde la última ejecución
+  python index_sync.py --rag      # además actualiza el índice local (rag_index.py)
+  python index_sync.py --reconcile  # detecta también nodos purgados (recorrido de IDs)
+  python index_sync.py --reset    # olvida la marca de agua (sincronización completa)
+"""
+import os
+import json
+import time
+import zlib
+import sqlite3
+import argparse
+import threading
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional, List, Tuple, Iterator
+
+from alfresco_http import get_client
+from text_cache import content_version
+from list_docs import (
+    ALFRESCO_BASE_URL,
+    DEFAULT_MIME_WHITELIST,
+    DEFAULT_MAX_SIZE_MB,
+    DBID_FIELD,
+    MODIFIED_FIELD,
+    _post_search,
+    _uploaded_only_filters,
+    _mime_and_size_filters,
+    _fields,
+    _include,
+    get_document_with_content,
+    content_fetch_failed,
+)
+
+SYNC_DB = os.getenv("SYNC_DB", os.path.join(".cache", "sync_store.sqlite3"))
+SYNC_PAGE_SIZE = int(os.getenv("SYNC_PAGE_SIZE", "100"))
+SYNC_WORKERS = int(os.getenv("SYNC_WORKERS", "4"))
+SYNC_MAX_CHARS = int(os.getenv("SYNC_MAX_CHARS", "200000"))
+
+DELETED_NODES_URL = f"{ALFRESCO_BASE_URL}/alfresco/api/-default-/public/alfresco/versions/1/deleted-nodes"
+
+def afts_date(value: str) -> str:
+    """'2024-05-01T10:20:30.123+0000' -> '2024-05-01T10:20:30.123Z' (formato de rango AFTS, en UTC)."""
+    dt = datetime.strptime(value, "%Y-%m-%dT%H:%M:%S.%f%z").astimezone(timezone.utc)
+    return dt.strftime("%Y-%m-%dT%H:%M:%S.") + f"{dt.microsecond // 1000:03d}Z"
+
+
+class SyncStore:
+    """
+    Almacén local de documentos sincronizados: una fila por nodo con su versión y el
+    texto extraído (zlib), más una tabla clave/valor para la marca de agua.
+    Las bajas quedan como lápida (deleted=1) hasta que el índice RAG las procese.
+    """
+
+    def __init__(self, db_path: str = SYNC_DB):
+        parent = os.path.dirname(db_path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS documents (
+                node_id TEXT PRIMARY KEY,
+                name TEXT,
+                title TEXT,
+                path TEXT,
+                mime TEXT,
+                size_bytes INTEGER,
+                modified_at TEXT,
+                version TEXT,
+                status TEXT,
+                note TEXT,
+                text_z BLOB,
+                text_truncated INTEGER,
+                synced_at REAL,
+                deleted INTEGER NOT NULL DEFAULT 0,
+                rag_pending INTEGER NOT NULL DEFAULT 1
+            )"""
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS ix_documents_rag_pending ON documents(rag_pending)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS sync_state (key TEXT PRIMARY KEY, value TEXT)")
+
+    # --- Estado ------------------------------------------------------------------
+
+    def get_state(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            row = self._db.execute("SELECT value FROM sync_state WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set_state(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO sync_state (key, value) VALUES (?, ?)", (key, json.dumps(value)))
+
+    def reset_state(self) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM sync_state")
+
+    # --- Documentos --------------------------------------------------------------
+
+    def version_of(self, node_id: str) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT version FROM documents WHERE node_id = ? AND status = 'ok' AND deleted = 0", (node_id,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def upsert(self, node_id: str, doc: Dict[str, Any], version: Optional[str], status: str = "ok", note: str = "") -> None:
+        props = doc.get("properties") or {}
+        content = doc.get("content") or {}
+        text = doc.get("contentText") or ""
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO documents "
+                "(node_id, name, title, path, mime, size_bytes, modified_at, version, status, note, text_z, "
+                "text_truncated, synced_at, deleted, rag_pending) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 0, 1)",
+                (node_id, doc.get("name"), props.get("cm:title"), (doc.get("path") or {}).get("name", ""),
+                 content.get("mimeType"), content.get("sizeInBytes"), doc.get("modifiedAt"), version, status,
+                 note or doc.get("contentNote") or "", zlib.compress(text.encode("utf-8"), 6),
+                 int(bool(doc.get("contentTextTruncated"))), time.time()),
+            )
+
+    def mark_error(self, node_id: str, doc: Dict[str, Any], note: str = "") -> None:
+        """
+        Registra un intento fallido sin tocar el texto ni la versión ya guardados: el índice
+        RAG conserva la última versión buena y failed_ids() lo reintenta en la próxima pasada.
+        """
+        content = doc.get("content") or {}
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO documents (node_id, name, mime, size_bytes, modified_at, status, note, synced_at, rag_pending) "
+                "VALUES (?, ?, ?, ?, ?, 'error', ?, ?, 0) "
+                "ON CONFLICT(node_id) DO UPDATE SET status = 'error', note = excluded.note, synced_at = excluded.synced_at",
+                (node_id, doc.get("name"), content.get("mimeType"), content.get("sizeInBytes"), doc.get("modifiedAt"),
+                 note or doc.get("contentNote") or "", time.time()),
+            )
+
+    def mark_deleted(self, node_ids: List[str]) -> int:
+        if not node_ids:
+            return 0
+        with self._lock:
+            cur = self._db.executemany(
+                "UPDATE documents SET deleted = 1, text_z = NULL, rag_pending = 1 WHERE node_id = ? AND deleted = 0",
+                [(nid,) for nid in node_ids],
+            )
+            return cur.rowcount
+
+    def live_ids(self) -> List[str]:
+        with self._lock:
+            return [r[0] for r in self._db.execute("SELECT node_id FROM documents WHERE deleted = 0")]
+
+    def failed_ids(self) -> List[str]:
+        with self._lock:
+            return [r[0] for r in self._db.execute("SELECT node_id FROM documents WHERE status = 'error' AND deleted = 0")]
+
+    def get_text(self, node_id: str) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute("SELECT text_z FROM documents WHERE node_id = ? AND deleted = 0", (node_id,)).fetchone()
+        return zlib.decompress(row[0]).decode("utf-8") if row and row[0] else None
+
+    def iter_rag_pending(self) -> Iterator[Tuple[str, bool, Dict[str, Any]]]:
+        """(node_id, deleted, meta) de los nodos que el índice RAG aún no refleja."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT node_id, deleted, name, title, modified_at FROM documents WHERE rag_pending = 1"
+            ).fetchall()
+        for node_id, deleted, name, title, modified_at in rows:
+            yield node_id, bool(deleted), {"name": name, "title": title, "modifiedAt": modified_at}
+
+    def clear_rag_pending(self, node_ids: List[str]) -> None:
+        with self._lock:
+            self._db.execute("BEGIN")
+            self._db.executemany("UPDATE documents SET rag_pending = 0 WHERE node_id = ?", [(n,) for n in node_ids])
+            # Las lápidas ya reflejadas en el índice se pueden purgar
+            self._db.execute("DELETE FROM documents WHERE deleted = 1 AND rag_pending = 0")
+            self._db.execute("COMMIT")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            live, errors, deleted, pending = self._db.execute(
+                "SELECT COALESCE(SUM(deleted = 0), 0), COALESCE(SUM(status = 'error' AND deleted = 0), 0), "
+                "COALESCE(SUM(deleted = 1), 0), COALESCE(SUM(rag_pending = 1), 0) FROM documents"
+            ).fetchone()
+        return {
+            "documents": live,
+            "errors": errors,
+            "tombstones": deleted,
+            "ragPending": pending,
+            "watermark": self.get_state("watermark"),
+            "lastRun": self.get_state("last_run"),
+        }
+
+
+# --- Consultas a Alfresco ------------------------------------------------------------
+
+def _changed_since_body(since: Optional[str], skip: int, page_size: int) -> Dict[str, Any]:
+    filters = _uploaded_only_filters(True)
+    filters += _mime_and_size_filters(DEFAULT_MIME_WHITELIST, DEFAULT_MAX_SIZE_MB)
+    if since:
+        filters.append(f"cm:modified:['{since}' TO MAX]")
+    return {
+        "query": {"query": " AND ".join(filters), "language": "afts"},
+        "paging": {"maxItems": page_size, "skipCount": skip},
+        # Orden estable: fecha de modificación y, a igualdad, DBID
+        "sort": [
+            {"type": "FIELD", "field": MODIFIED_FIELD, "ascending": True},
+            {"type": "FIELD", "field": DBID_FIELD, "ascending": True},
+        ],
+        "include": _include("changes"),
+        "fields": _fields("changes"),
+    }
+
+
+def _next_watermark(since: Optional[str], skip: int, entries: List[Dict[str, Any]]) -> Tuple[str, int]:
+    """
+    Avanza la marca (fecha, skip) tras una página ordenada por cm:modified ascendente.
+    La siguiente consulta vuelve a incluir la última fecha (rango inclusivo); los nodos
+    repetidos se descartan por versión. Solo si toda la página comparte la misma fecha
+    (cargas masivas) hace falta saltar con skipCount para no quedarse en bucle.
+    """
+    last = afts_date(entries[-1]["modifiedAt"])
+    if last == since:
+        return last, skip + len(entries)
+    return last, 0
+
+
+def _parse_date(value: str) -> datetime:
+    return datetime.strptime(value, "%Y-%m-%dT%H:%M:%S.%f%z")
+
+
+def _iter_deleted_nodes(since: Optional[str] = None, page_size: int = SYNC_PAGE_SIZE) -> Iterator[Tuple[str, str]]:
+    """
+    (id, archivedAt) de la papelera (borrados no purgados) vía /deleted-nodes. Con since,
+    solo los archivados desde entonces: la papelera se lista de más reciente a más antiguo,
+    así que se deja de paginar con la primera página que ya no trae nada nuevo.
+    """
+    client = get_client()
+    since_dt = _parse_date(since) if since else None
+    skip = 0
+    while True:
+        r = client.get(DELETED_NODES_URL, endpoint="metadata", params={"skipCount": skip, "maxItems": page_size})
+        r.raise_for_status()
+        data = r.json().get("list", {})
+        fresh = 0
+        for it in data.get("entries", []):
+            archived = it["entry"].get("archivedAt")
+            if since_dt is None or archived is None or _parse_date(archived) >= since_dt:
+                fresh += 1
+                yield it["entry"]["id"], archived
+        if not fresh or not data.get("pagination", {}).get("hasMoreItems"):
+            break
+        skip += page_size
+
+
+def _iter_live_node_ids(page_size: int = SYNC_PAGE_SIZE) -> Iterator[str]:
+    # Todos los IDs vigentes que entrarían en la sincronización (para reconciliar purgados)
+    skip = 0
+    while True:
+        body = _changed_since_body(None, skip, page_size)
+        body["fields"] = ["id"]
+        body["include"] = []
+        data = _post_search(body).get("list", {})
+        for it in data.get("entries", []):
+            yield it["entry"]["id"]
+        if not data.get("pagination", {}).get("hasMoreItems"):
+            break
+        skip += page_size
+
+
+# --- Sincronización --------------------------------------------------------------------
+
+def _sync_one(store: SyncStore, entry: Dict[str, Any]) -> str:
+    node_id = entry["id"]
+    version = content_version(entry)
+    if store.version_of(node_id) == version:
+        return "unchanged"
+    try:
+        doc = get_document_with_content(node_id, max_chars=SYNC_MAX_CHARS, meta=entry)
+    except Exception as e:
+        # Queda como error: se reintenta al inicio de la próxima ejecución
+        store.mark_error(node_id, entry, note=str(e))
+        return "error"
+    # get_document_with_content no lanza si la descarga falla: lo indica en el documento
+    if content_fetch_failed(doc):
+        store.mark_error(node_id, doc)
+        return "error"
+    store.upsert(node_id, doc, version)
+    return "updated"
+
+
+def _retry_failed(store: SyncStore, pool: ThreadPoolExecutor, counts: Dict[str, int]) -> None:
+    from list_docs import get_node_metadata
+
+    def retry(node_id: str) -> str:
+        try:
+            meta = get_node_metadata(node_id)
+        except Exception:
+            return "error"
+        return _sync_one(store, meta)
+
+    for outcome in pool.map(retry, store.failed_ids()):
+        counts[outcome] += 1
+
+
+def sync(store: Optional[SyncStore] = None, page_size: int = SYNC_PAGE_SIZE, workers: int = SYNC_WORKERS,
+         reconcile: bool = False, verbose: bool = True) -> Dict[str, Any]:
+    """
+    Una pasada de sincronización incremental. Devuelve un resumen con contadores.
+    La marca de agua se persiste tras cada página: una caída no obliga a empezar de cero.
+    """
+    store = store or SyncStore()
+    t0 = time.perf_counter()
+    counts = {"updated": 0, "unchanged": 0, "error": 0, "deleted": 0, "pages": 0}
+    mark = store.get_state("watermark") or {"since": None, "skip": 0}
+    since, skip = mark["since"], mark["skip"]
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        _retry_failed(store, pool, counts)
+
+        while True:
+            data = _post_search(_changed_since_body(since, skip, page_size)).get("list", {})
+            entries = [it["entry"] for it in data.get("entries", [])]
+            if not entries:
+                break
+            for outcome in pool.map(lambda e: _sync_one(store, e), entries):
+                counts[outcome] += 1
+            counts["pages"] += 1
+            since, skip = _next_watermark(since, skip, entries)
+            store.set_state("watermark", {"since": since, "skip": skip})
+            if verbose:
+                print(f"Página {counts['pages']}: hasta {since} ({counts['updated']} actualizados, {counts['unchanged']} sin cambios)")
+            if not data.get("pagination", {}).get("hasMoreItems"):
+                break
+
+    # Bajas: la Search API no devuelve nodos borrados. Solo lo archivado desde la última
+    # consulta de la papelera (completa la primera vez o con reconcile)
+    trash_since = None if reconcile else store.get_state("trash_since")
+    try:
+        deleted = list(_iter_deleted_nodes(trash_since, page_size))
+        counts["deleted"] += store.mark_deleted([node_id for node_id, _ in deleted])
+        newest = max((a for _, a in deleted if a), key=_parse_date, default=None)
+        if newest and (trash_since is None or _parse_date(newest) > _parse_date(trash_since)):
+            store.set_state("trash_since", newest)
+    except Exception as e:
+        if verbose:
+            print(f"No se pudo consultar la papelera: {e}")
+    if reconcile:
+        live = set(_iter_live_node_ids(page_size))
+        counts["deleted"] += store.mark_deleted([nid for nid in store.live_ids() if nid not in live])
+
+    summary = {**counts, "seconds": round(time.perf_counter() - t0, 3), "watermark": {"since": since, "skip": skip}}
+    store.set_state("last_run", {"finishedAt": datetime.now(timezone.utc).isoformat(), **counts})
+    return summary
+
+
+def apply_to_rag_index(store: SyncStore, verbose: bool = True) -> Dict[str, int]:
+    """Lleva al índice local (rag_index.py) los cambios pendientes del almacén."""
+    from rag_index import get_rag_index
+
+    index = get_rag_index()
+    pending = list(store.iter_rag_pending())
+    # Quitar primero todo lo que cambió, en una sola reconstrucción del índice
+    removed = index.remove_documents([node_id for node_id, _, _ in pending])
+    added = 0
+    for node_id, deleted, meta in pending:
+        if not deleted:
+            index.add_document(node_id, store.get_text(node_id) or "", meta)
+            added += 1
+    index.save()
+    store.clear_rag_pending([node_id for node_id, _, _ in pending])
+    if verbose:
+        print(f"Índice RAG: {added} documentos (re)indexados, {removed} fragmentos eliminados")
+    return {"indexed": added, "chunksRemoved": removed}
+
+
+def main():
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Sincronización incremental de Alfresco a un almacén local")
+    parser.add_argument("--rag", action="store_true", help="Actualizar también el índice RAG local")
+    parser.add_argument("--reconcile", action="store_true", help="Detectar nodos purgados comparando todos los IDs")
+    parser.add_argument("--reset", action="store_true", help="Olvidar la marca de agua y sincronizar todo")
+    parser.add_argument("--page-size", type=int, default=SYNC_PAGE_SIZE)
+    parser.add_argument("--workers", type=int, default=SYNC_WORKERS)
+    args = parser.parse_args()
+
+    store = SyncStore()
+    if args.reset:
+        store.reset_state()
+    summary = sync(store, page_size=args.page_size, workers=args.workers, reconcile=args.reconcile)
+    if args.rag:
+        summary["rag"] = apply_to_rag_index(store)
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,482 @@
+"""
+Ingesta en segundo plano: extrae por adelantado el texto de los nodos creados o
+modificados y lo deja en la caché de texto (text_cache.py). Así el primer
+/documents/{nodeId}/full ya no descarga ni extrae: solo pide los metadatos y compara
+la versión (content_version) con la del texto guardado.
+
+Los eventos esperan en una cola SQLite local (una fila pendiente por nodo: los eventos
+repetidos de un nodo aún no procesado se funden). Fuentes de eventos, como sustituto
+de los eventos de Alfresco:
+  - un archivo JSONL (INGEST_EVENTS_FILE) que se lee por offset, una línea por evento:
+    {"nodeId": "...", "eventType": "created|updated|deleted", "modifiedAt": "..."}
+  - POST /admin/ingestion/events en la API
+  - python ingestion.py enqueue <nodeId> [...]
+
+Uso:
+  python ingestion.py run               # worker en primer plano
+  python ingestion.py enqueue ID [ID...]
+  python ingestion.py stats
+"""
+import os
+import json
+import time
+import logging
+import sqlite3
+import argparse
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional, List
+
+import requests
+
+from text_cache import get_text_cache, content_version, TEXT_CACHE_MAX_CHARS
+from list_docs import get_node_metadata, get_document_with_content, _content_result_base, _needs_download
+from metrics import INGEST_EVENTS, INGEST_LAG_SECONDS, INGEST_SECONDS
+
+logger = logging.getLogger(__name__)
+
+INGEST_QUEUE_DB = os.getenv("INGEST_QUEUE_DB", os.path.join(".cache", "ingest_queue.sqlite3"))
+INGEST_EVENTS_FILE = os.getenv("INGEST_EVENTS_FILE", "")
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "16"))
+INGEST_POLL_INTERVAL_S = float(os.getenv("INGEST_POLL_INTERVAL_S", "1"))
+# Reintentos con espera exponencial (INGEST_RETRY_BASE_S * 2^intento); agotados, el evento pasa a dead_events
+INGEST_MAX_ATTEMPTS = int(os.getenv("INGEST_MAX_ATTEMPTS", "5"))
+INGEST_RETRY_BASE_S = float(os.getenv("INGEST_RETRY_BASE_S", "5"))
+# Un evento reclamado hace más de esto se da por perdido (worker caído) y se vuelve a entregar
+INGEST_LEASE_S = float(os.getenv("INGEST_LEASE_S", "300"))
+# Se extrae hasta el máximo que guarda la caché, para servir cualquier maxChars de la API
+INGEST_MAX_CHARS = int(os.getenv("INGEST_MAX_CHARS", str(TEXT_CACHE_MAX_CHARS)))
+
+EVENT_TYPES = ("created", "updated", "deleted")
+
+
+class IngestError(Exception):
+    pass
+
+
+class IngestQueue:
+    """
+    Cola persistente de eventos de ingesta sobre SQLite. claim() marca los eventos como
+    reclamados (lease) dentro de una transacción, así varios workers o procesos pueden
+    compartir la cola; ack() los borra y fail() los reprograma con espera exponencial.
+    """
+
+    def __init__(self, db_path: str = INGEST_QUEUE_DB):
+        parent = os.path.dirname(db_path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("PRAGMA busy_timeout=5000")
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                node_id TEXT NOT NULL,
+                event_type TEXT NOT NULL,
+                modified_at TEXT,
+                enqueued_at REAL NOT NULL,
+                available_at REAL NOT NULL,
+                claimed_at REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT
+            )"""
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS ix_events_node ON events(node_id)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS ix_events_available ON events(available_at)")
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS dead_events (
+                id INTEGER PRIMARY KEY,
+                node_id TEXT NOT NULL,
+                event_type TEXT NOT NULL,
+                modified_at TEXT,
+                enqueued_at REAL,
+                attempts INTEGER,
+                last_error TEXT,
+                failed_at REAL
+            )"""
+        )
+        self._db.execute("CREATE TABLE IF NOT EXISTS ingest_state (key TEXT PRIMARY KEY, value TEXT)")
+        self._counters: Dict[str, int] = {"enqueued": 0, "coalesced": 0, "claimed": 0, "acked": 0, "retried": 0, "dead": 0}
+
+    # --- Estado ------------------------------------------------------------------
+
+    def get_state(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            row = self._db.execute("SELECT value FROM ingest_state WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set_state(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO ingest_state (key, value) VALUES (?, ?)", (key, json.dumps(value)))
+
+    # --- Cola --------------------------------------------------------------------
+
+    def enqueue(self, events: List[Dict[str, Any]]) -> int:
+        """
+        Encola eventos {"nodeId", "eventType", "modifiedAt"}. Si el nodo ya tiene un evento
+        pendiente (no reclamado) se actualiza ese, conservando su enqueued_at: el retraso se
+        mide desde el primer cambio sin procesar. Devuelve los eventos aceptados.
+        """
+        now = time.time()
+        accepted = 0
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                for ev in events:
+                    node_id = ev.get("nodeId")
+                    event_type = ev.get("eventType") or "updated"
+                    if not node_id or event_type not in EVENT_TYPES:
+                        continue
+                    cur = self._db.execute(
+                        "UPDATE events SET event_type = ?, modified_at = ?, available_at = MIN(available_at, ?) "
+                        "WHERE node_id = ? AND claimed_at IS NULL",
+                        (event_type, ev.get("modifiedAt"), now, node_id),
+                    )
+                    if cur.rowcount:
+                        self._counters["coalesced"] += 1
+                    else:
+                        self._db.execute(
+                            "INSERT INTO events (node_id, event_type, modified_at, enqueued_at, available_at) VALUES (?, ?, ?, ?, ?)",
+                            (node_id, event_type, ev.get("modifiedAt"), now, now),
+                        )
+                        self._counters["enqueued"] += 1
+                    accepted += 1
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        return accepted
+
+    def claim(self, limit: int) -> List[Dict[str, Any]]:
+        """Reclama hasta `limit` eventos listos, el más antiguo primero, sin repetir nodo en curso."""
+        now = time.time()
+        expired = now - INGEST_LEASE_S
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._db.execute(
+                    "SELECT id, node_id, event_type, modified_at, enqueued_at, attempts FROM events "
+                    "WHERE available_at <= ? AND (claimed_at IS NULL OR claimed_at < ?) "
+                    "AND node_id NOT IN (SELECT node_id FROM events WHERE claimed_at >= ?) "
+                    "ORDER BY available_at, id LIMIT ?",
+                    (now, expired, expired, limit * 4),
+                ).fetchall()
+                batch: List[Dict[str, Any]] = []
+                seen = set()
+                for event_id, node_id, event_type, modified_at, enqueued_at, attempts in rows:
+                    if node_id in seen:
+                        continue
+                    seen.add(node_id)
+                    batch.append({
+                        "id": event_id, "nodeId": node_id, "eventType": event_type,
+                        "modifiedAt": modified_at, "enqueuedAt": enqueued_at, "attempts": attempts,
+                    })
+                    if len(batch) >= limit:
+                        break
+                self._db.executemany("UPDATE events SET claimed_at = ? WHERE id = ?", [(now, ev["id"]) for ev in batch])
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+            self._counters["claimed"] += len(batch)
+        return batch
+
+    def ack(self, event_id: int) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM events WHERE id = ?", (event_id,))
+            self._counters["acked"] += 1
+
+    def fail(self, event: Dict[str, Any], error: str) -> bool:
+        """Reprograma el evento con espera exponencial; devuelve False si pasó a dead_events."""
+        attempts = event["attempts"] + 1
+        now = time.time()
+        with self._lock:
+            if attempts >= INGEST_MAX_ATTEMPTS:
+                self._db.execute("BEGIN IMMEDIATE")
+                self._db.execute(
+                    "INSERT OR REPLACE INTO dead_events (id, node_id, event_type, modified_at, enqueued_at, attempts, last_error, failed_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (event["id"], event["nodeId"], event["eventType"], event["modifiedAt"], event["enqueuedAt"], attempts, error, now),
+                )
+                self._db.execute("DELETE FROM events WHERE id = ?", (event["id"],))
+                self._db.execute("COMMIT")
+                self._counters["dead"] += 1
+                return False
+            self._db.execute(
+                "UPDATE events SET claimed_at = NULL, attempts = ?, last_error = ?, available_at = ? WHERE id = ?",
+                (attempts, error, now + INGEST_RETRY_BASE_S * 2 ** (attempts - 1), event["id"]),
+            )
+            self._counters["retried"] += 1
+            return True
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.time()
+        with self._lock:
+            pending, in_flight, oldest = self._db.execute(
+                "SELECT COALESCE(SUM(claimed_at IS NULL OR claimed_at < ?), 0), COALESCE(SUM(claimed_at >= ?), 0), "
+                "MIN(enqueued_at) FROM events",
+                (now - INGEST_LEASE_S, now - INGEST_LEASE_S),
+            ).fetchone()
+            dead = self._db.execute("SELECT COUNT(*) FROM dead_events").fetchone()[0]
+            return {
+                **self._counters,
+                "pending": pending,
+                "inFlight": in_flight,
+                "deadEvents": dead,
+                # Retraso de la cola: antigüedad del evento más viejo sin terminar
+                "oldestEventAgeS": round(now - oldest, 3) if oldest is not None else 0.0,
+            }
+
+
+class EventFileSource:
+    """
+    Lee eventos nuevos de un archivo JSONL (una línea por evento) y los pasa a la cola.
+    El offset leído se guarda en la propia cola, así un reinicio no reprocesa el archivo;
+    si el archivo encoge (rotación) se vuelve a leer desde el principio.
+    """
+
+    def __init__(self, path: str, queue: IngestQueue):
+        self.path = path
+        self.queue = queue
+        self._state_key = f"file-offset:{os.path.abspath(path)}"
+        self.invalid_lines = 0
+
+    def poll(self) -> int:
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            return 0
+        offset = self.queue.get_state(self._state_key, 0)
+        if size < offset:
+            offset = 0
+        if size == offset:
+            return 0
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            data = f.read(size - offset)
+        # Solo líneas completas: la última puede estar a medio escribir
+        end = data.rfind(b"\n") + 1
+        events = []
+        for line in data[:end].splitlines():
+            if not line.strip():
+                continue
+            try:
+                events.append(json.loads(line))
+            except ValueError:
+                self.invalid_lines += 1
+        accepted = self.queue.enqueue(events) if events else 0
+        self.queue.set_state(self._state_key, offset + end)
+        return accepted
+
+
+def ingest_event(event: Dict[str, Any]) -> str:
+    """
+    Procesa un evento: extrae y guarda el texto del nodo (o lo invalida si se borró).
+    Devuelve el resultado: extracted | unchanged | skipped | deleted. Lanza si hay que reintentar.
+    """
+    cache = get_text_cache()
+    if cache is None:
+        raise IngestError("TEXT_CACHE_ENABLED=false: no hay dónde guardar el texto")
+    node_id = event["nodeId"]
+    if event["eventType"] == "deleted":
+        cache.invalidate(node_id)
+        return "deleted"
+    try:
+        meta = get_node_metadata(node_id)
+    except requests.HTTPError as e:
+        if e.response is not None and e.response.status_code == 404:
+            cache.invalidate(node_id)
+            return "deleted"
+        raise
+    if not _needs_download(_content_result_base(meta, INGEST_MAX_CHARS)):
+        return "skipped"
+    doc = get_document_with_content(node_id, max_chars=INGEST_MAX_CHARS, meta=meta)
+    if str(doc.get("contentCache", "")).startswith("hit"):
+        return "unchanged"
+    # get_document_with_content no lanza: si el texto no quedó guardado, algo falló
+    if not cache.has(node_id, content_version(meta)):
+        raise IngestError(doc.get("contentNote") or "El texto no quedó en la caché")
+    return "extracted"
+
+
+class IngestionWorker:
+    """
+    Hilo que vacía la cola: lee la fuente de eventos, reclama lotes y los procesa con
+    `workers` hilos. stats() da el throughput del último minuto; el retraso de la cola
+    está en IngestQueue.stats() y en la métrica ingest_lag_seconds.
+    """
+
+    def __init__(self, queue: Optional[IngestQueue] = None, source: Optional[EventFileSource] = None,
+                 workers: int = INGEST_WORKERS, batch_size: int = INGEST_BATCH_SIZE,
+                 poll_interval_s: float = INGEST_POLL_INTERVAL_S):
+        self.queue = queue or IngestQueue()
+        self.source = source
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        self.poll_interval_s = poll_interval_s
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._counters: Dict[str, int] = {"processed": 0, "extracted": 0, "unchanged": 0, "skipped": 0,
+                                          "deleted": 0, "retry": 0, "dead": 0}
+        self._recent: "deque[float]" = deque()
+        self._started_at: Optional[float] = None
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._started_at = time.time()
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ingest")
+        self._thread = threading.Thread(target=self._loop, name="ingestion-worker", daemon=True)
+        self._thread.start()
+
+    def stop(self, wait: bool = True) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None and wait:
+            self._thread.join()
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait)
+        self._thread = None
+        self._pool = None
+
+    def wake(self) -> None:
+        """Despierta el bucle (p.ej. tras encolar desde la API) sin esperar al sondeo."""
+        self._wake.set()
+
+    def run_once(self) -> int:
+        """Una vuelta: lee la fuente y procesa un lote. Devuelve los eventos procesados."""
+        if self.source is not None:
+            self.source.poll()
+        batch = self.queue.claim(self.batch_size)
+        if batch:
+            pool = self._pool or ThreadPoolExecutor(max_workers=self.workers)
+            try:
+                list(pool.map(self._process, batch))
+            finally:
+                if pool is not self._pool:
+                    pool.shutdown()
+        return len(batch)
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                processed = self.run_once()
+            except Exception:
+                logger.exception("Error en el bucle del worker de ingesta")
+                processed = 0
+            if not processed:
+                self._wake.wait(self.poll_interval_s)
+                self._wake.clear()
+
+    def _process(self, event: Dict[str, Any]) -> None:
+        t0 = time.perf_counter()
+        try:
+            outcome = ingest_event(event)
+        except Exception as e:
+            outcome = "retry" if self.queue.fail(event, str(e)) else "dead"
+        else:
+            self.queue.ack(event["id"])
+            INGEST_LAG_SECONDS.observe(max(0.0, time.time() - event["enqueuedAt"]))
+        INGEST_SECONDS.observe(time.perf_counter() - t0)
+        INGEST_EVENTS.inc(outcome=outcome)
+        now = time.time()
+        with self._lock:
+            self._counters[outcome] += 1
+            self._counters["processed"] += 1
+            self._recent.append(now)
+            while self._recent and self._recent[0] < now - 60:
+                self._recent.popleft()
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.time()
+        with self._lock:
+            while self._recent and self._recent[0] < now - 60:
+                self._recent.popleft()
+            return {
+                "running": self._thread is not None and self._thread.is_alive(),
+                "workers": self.workers,
+                "batchSize": self.batch_size,
+                "uptimeS": round(now - self._started_at, 1) if self._started_at else 0.0,
+                "eventsLastMinute": len(self._recent),
+                "eventsPerSecond": round(len(self._recent) / 60.0, 3),
+                "invalidFileLines": self.source.invalid_lines if self.source else 0,
+                **self._counters,
+            }
+
+
+_queue: Optional[IngestQueue] = None
+_worker: Optional[IngestionWorker] = None
+_ingest_lock = threading.Lock()
+
+
+def get_ingest_queue() -> IngestQueue:
+    global _queue
+    if _queue is None:
+        with _ingest_lock:
+            if _queue is None:
+                _queue = IngestQueue()
+    return _queue
+
+
+def get_ingestion_worker() -> IngestionWorker:
+    """Worker compartido del proceso (sin arrancar), con la fuente INGEST_EVENTS_FILE si está definida."""
+    global _worker
+    queue = get_ingest_queue()
+    if _worker is None:
+        with _ingest_lock:
+            if _worker is None:
+                source = EventFileSource(INGEST_EVENTS_FILE, queue) if INGEST_EVENTS_FILE else None
+                _worker = IngestionWorker(queue, source)
+    return _worker
+
+
+def main():
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Worker de ingesta: precalcula el texto extraído de los nodos modificados")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run = sub.add_parser("run", help="Procesar la cola en primer plano")
+    run.add_argument("--workers", type=int, default=INGEST_WORKERS)
+    run.add_argument("--drain", action="store_true", help="Terminar cuando la cola quede vacía")
+    enqueue = sub.add_parser("enqueue", help="Encolar eventos para uno o más nodos")
+    enqueue.add_argument("node_ids", nargs="+")
+    enqueue.add_argument("--event-type", choices=EVENT_TYPES, default="updated")
+    sub.add_parser("stats", help="Estado de la cola")
+    args = parser.parse_args()
+
+    queue = get_ingest_queue()
+    if args.command == "enqueue":
+        n = queue.enqueue([{"nodeId": nid, "eventType": args.event_type} for nid in args.node_ids])
+        print(json.dumps({"enqueued": n}))
+        return
+    if args.command == "stats":
+        print(json.dumps(queue.stats(), indent=2))
+        return
+
+    worker = get_ingestion_worker()
+    worker.workers = max(1, args.workers)
+    if args.drain:
+        while worker.run_once():
+            pass
+        print(json.dumps({"queue": queue.stats(), "worker": worker.stats()}, indent=2))
+        return
+    worker.start()
+    try:
+        while True:
+            time.sleep(30)
+            print(json.dumps({"queue": queue.stats(), "worker": worker.stats()}, ensure_ascii=False))
+    except KeyboardInterrupt:
+        worker.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,20 @@
 import os
-import io
-import base64
 import requests
-from typing import Dict, List, Optional, Literal, Any, Tuple
-
-# Extracción de texto
-try:
-    from pypdf import PdfReader 
-except Exception:
-    PdfReader = None
-try:
-    from docx import Document 
-except Exception:
-    Document = None
-try:
-    import chardet  
-except Exception:
-    chardet = None
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Literal, Any, Tuple, Callable, Iterator
+
+import fast_json
+from alfresco_http import get_client
+from text_cache import get_text_cache, content_version, TEXT_INDEX_MAX_CHARS
+from extraction import get_extraction_engine
+from content_buffer import ContentBuffer
+from metrics import (
+    stage, DOWNLOAD_BYTES, DOWNLOAD_SECONDS, DOWNLOAD_TRANSFERRED_BYTES, DOWNLOAD_RANGE_REQUESTS,
+    DOWNLOAD_INTERRUPTED, EXTRACTION_CHARS, EXTRACTION_SECONDS,
+)
+from text_decoding import IncrementalTextDecoder
 
 ALFRESCO_BASE_URL = os.getenv("ALFRESCO_BASE_URL", "http://localhost:8080").rstrip("/")
-ALFRESCO_USERNAME = os.getenv("ALFRESCO_USERNAME", "admin")
-ALFRESCO_PASSWORD = os.getenv("ALFRESCO_PASSWORD", "admin")
 
 SEARCH_URL = f"{ALFRESCO_BASE_URL}/alfresco/api/-default-/public/search/versions/1/search"
 NODES_BASE = f"{ALFRESCO_BASE_URL}/alfresco/api/-default-/public/alfresco/versions/1/nodes"
@@ -50,10 +44,6 @@ DEFAULT_MIME_WHITELIST = [
 class AlfrescoSearchError(Exception):
     pass
 
-def _auth_header() -> Dict[str, str]:
-    token = base64.b64encode(f"{ALFRESCO_USERNAME}:{ALFRESCO_PASSWORD}".encode()).decode()
-    return {"Authorization": f"Basic {token}"}
-
 def _qname_encode(local: str) -> str:
     # Encodifica un string a QName (cm:my_x002d_site) para PATH en AFTS
     out = []
@@ -64,12 +54,12 @@ def _qname_encode(local: str) -> str:
             out.append(f"_x{ord(ch):04x}_")
     return "cm:" + "".join(out)
 
-def _post_search(body: Dict, timeout: int = 30) -> Dict:
-    headers = {**_auth_header(), "Content-Type": "application/json"}
-    r = requests.post(SEARCH_URL, json=body, headers=headers, timeout=timeout)
+def _post_search(body: Dict, timeout: Optional[float] = None) -> Dict:
+    # La búsqueda es de solo lectura: se marca idempotente para permitir reintentos
+    r = get_client().post(SEARCH_URL, endpoint="search", json=body, idempotent=True, timeout=timeout)
     if r.status_code >= 400:
         raise AlfrescoSearchError(f"Search API error {r.status_code}: {r.text}")
-    return r.json()
+    return fast_json.loads(r.content)
 
 def _uploaded_only_filters(exclude_system_and_generated: bool = True) -> List[str]:
     filters = ["EXACTTYPE:'cm:content'"]
@@ -97,28 +87,47 @@ def _mime_and_size_filters(
         parts.append(f"cm:content.size:[1 TO {max_bytes}]")
     return parts
 
-def _fields() -> List[str]:
-    return ["id", "name", "nodeType", "content", "path", "properties", "aspectNames", "allowableOperations", "createdAt", "modifiedAt"]
-
-def list_sites(
-    max_items: int = DEFAULT_PAGE_SIZE,
-    skip_count: int = 0,
-    query_text: str = "",
-) -> Dict[str, Any]:
+# Campos (fields) e includes que pide cada operación a la Search API: solo lo que lee su
+# _parse_*. Con properties/aspectNames/allowableOperations la respuesta de Alfresco es
+# 5-10x mayor que lo que devolvemos, y parsearla domina la CPU en páginas grandes.
+OPERATION_FIELDS: Dict[str, List[str]] = {
+    "sites": ["id", "name", "path", "properties"],
+    "document_library": ["id", "name", "nodeType", "path"],
+    "folder_children": ["id", "name", "nodeType", "content", "path"],
+    "search_documents": ["id", "name", "content", "path"],
+    # Sincronización del índice: metadatos que se pasan tal cual a get_document_with_content
+    "changes": ["id", "name", "nodeType", "content", "path", "properties", "createdAt", "modifiedAt"],
+}
+OPERATION_INCLUDE: Dict[str, List[str]] = {
+    "sites": ["path", "properties"],
+    "document_library": ["path"],
+    "folder_children": ["path"],
+    "search_documents": ["path"],
+    "changes": ["path", "properties"],
+}
+
+def _fields(operation: str) -> List[str]:
+    return list(OPERATION_FIELDS[operation])
+
+def _include(operation: str) -> List[str]:
+    return list(OPERATION_INCLUDE[operation])
+
+def _list_sites_body(max_items: int, skip_count: int, query_text: str) -> Dict[str, Any]:
     filters = ["EXACTTYPE:'st:site'"]
     if query_text.strip():
         q = query_text.replace("'", "\\'")
         filters.append(f"(cm:name:'{q}*' OR cm:title:'{q}*')")
     afts = " AND ".join(filters)
 
-    body = {
+    return {
         "query": {"query": afts, "language": "afts"},
         "paging": {"maxItems": max_items, "skipCount": skip_count},
         "sort": [{"type": "FIELD", "field": "{http://www.alfresco.org/model/content/1.0}name", "ascending": True}],
-        "include": ["path", "properties"],
-        "fields": _fields(),
+        "include": _include("sites"),
+        "fields": _fields("sites"),
     }
-    data = _post_search(body)
+
+def _parse_sites(data: Dict[str, Any]) -> Dict[str, Any]:
     results = []
     for it in data.get("list", {}).get("entries", []):
         e = it["entry"]
@@ -133,31 +142,44 @@ def list_sites(
         })
     return {"count": len(results), "entries": results, "pagination": data.get("list", {}).get("pagination", {})}
 
-def get_document_library_folder(site_id: str) -> Optional[Dict[str, Any]]:
+def list_sites(
+    max_items: int = DEFAULT_PAGE_SIZE,
+    skip_count: int = 0,
+    query_text: str = "",
+) -> Dict[str, Any]:
+    data = _post_search(_list_sites_body(max_items, skip_count, query_text))
+    return _parse_sites(data)
+
+def _document_library_body(site_id: str) -> Dict[str, Any]:
     qn_site = _qname_encode(site_id)
     afts = " AND ".join([
         "EXACTTYPE:'cm:folder'",
         f'PATH:"/app:company_home/st:sites/{qn_site}/cm:documentLibrary"',
     ])
-    body = {
+    return {
         "query": {"query": afts, "language": "afts"},
         "paging": {"maxItems": 1, "skipCount": 0},
-        "include": ["path", "properties"],
-        "fields": _fields(),
+        "include": _include("document_library"),
+        "fields": _fields("document_library"),
     }
-    data = _post_search(body)
+
+def _parse_document_library(data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
     entries = data.get("list", {}).get("entries", [])
     if not entries:
         return None
     e = entries[0]["entry"]
     return {"id": e["id"], "name": e["name"], "path": (e.get("path") or {}).get("name", ""), "nodeType": e.get("nodeType")}
 
-def list_folder_children(
+def get_document_library_folder(site_id: str) -> Optional[Dict[str, Any]]:
+    data = _post_search(_document_library_body(site_id))
+    return _parse_document_library(data)
+
+def _folder_children_body(
     folder_id: str,
-    item_type: Literal["files", "folders", "all"] = "all",
-    max_items: int = DEFAULT_PAGE_SIZE,
-    skip_count: int = 0,
-    exclude_system_and_generated: bool = True,
+    item_type: Literal["files", "folders", "all"],
+    max_items: int,
+    skip_count: int,
+    exclude_system_and_generated: bool,
 ) -> Dict[str, Any]:
     filters: List[str] = [f"PARENT:'workspace://SpacesStore/{folder_id}'"]
     if item_type == "files":
@@ -168,15 +190,15 @@ def list_folder_children(
         filters.append("(EXACTTYPE:'cm:folder' OR EXACTTYPE:'cm:content')")
 
     afts = " AND ".join(filters)
-    body = {
+    return {
         "query": {"query": afts, "language": "afts"},
         "paging": {"maxItems": max_items, "skipCount": skip_count},
         "sort": [{"type": "FIELD", "field": "{http://www.alfresco.org/model/content/1.0}name", "ascending": True}],
-        "include": ["path", "properties", "aspectNames"],
-        "fields": _fields(),
+        "include": _include("folder_children"),
+        "fields": _fields("folder_children"),
     }
-    data = _post_search(body)
 
+def _parse_folder_children(data: Dict[str, Any]) -> Dict[str, Any]:
     results = []
     for it in data.get("list", {}).get("entries", []):
         e = it["entry"]
@@ -192,16 +214,27 @@ def list_folder_children(
         })
     return {"count": len(results), "entries": results, "pagination": data.get("list", {}).get("pagination", {})}
 
-def search_documents(
-    query_text: str = "",
-    site_ids: Optional[List[str]] = None,
-    folder_id: Optional[str] = None,
-    max_items: int = DEFAULT_MAX_DOCS,
+def list_folder_children(
+    folder_id: str,
+    item_type: Literal["files", "folders", "all"] = "all",
+    max_items: int = DEFAULT_PAGE_SIZE,
     skip_count: int = 0,
-    mime_whitelist: Optional[List[str]] = None,
-    max_size_mb: Optional[float] = None,
-    include_snippets: bool = True,
     exclude_system_and_generated: bool = True,
+) -> Dict[str, Any]:
+    body = _folder_children_body(folder_id, item_type, max_items, skip_count, exclude_system_and_generated)
+    data = _post_search(body)
+    return _parse_folder_children(data)
+
+def _search_documents_body(
+    query_text: str,
+    site_ids: Optional[List[str]],
+    folder_id: Optional[str],
+    max_items: int,
+    skip_count: int,
+    mime_whitelist: Optional[List[str]],
+    max_size_mb: Optional[float],
+    include_snippets: bool,
+    exclude_system_and_generated: bool,
 ) -> Dict[str, Any]:
     filters = _uploaded_only_filters(exclude_system_and_generated)
     filters += _mime_and_size_filters(mime_whitelist or DEFAULT_MIME_WHITELIST, max_size_mb or DEFAULT_MAX_SIZE_MB)
@@ -225,8 +258,8 @@ def search_documents(
         "query": {"query": afts, "language": "afts"},
         "paging": {"maxItems": max_items, "skipCount": skip_count},
         "sort": [{"type": "SCORE"}],
-        "include": ["path"],
-        "fields": _fields(),
+        "include": _include("search_documents"),
+        "fields": _fields("search_documents"),
     }
     if include_snippets:
         body["highlight"] = {
@@ -236,8 +269,9 @@ def search_documents(
             "fields": [{"field": "cm:content"}],
             "snippetCount": 3,
         }
+    return body
 
-    data = _post_search(body)
+def _parse_search_documents(data: Dict[str, Any], include_snippets: bool) -> Dict[str, Any]:
     results = []
     for it in data.get("list", {}).get("entries", []):
         e = it["entry"]
@@ -254,121 +288,360 @@ def search_documents(
         })
     return {"count": len(results), "entries": results, "pagination": data.get("list", {}).get("pagination", {})}
 
-def get_node_metadata(node_id: str) -> Dict[str, Any]:
+def search_documents(
+    query_text: str = "",
+    site_ids: Optional[List[str]] = None,
+    folder_id: Optional[str] = None,
+    max_items: int = DEFAULT_MAX_DOCS,
+    skip_count: int = 0,
+    mime_whitelist: Optional[List[str]] = None,
+    max_size_mb: Optional[float] = None,
+    include_snippets: bool = True,
+    exclude_system_and_generated: bool = True,
+) -> Dict[str, Any]:
+    body = _search_documents_body(
+        query_text, site_ids, folder_id, max_items, skip_count,
+        mime_whitelist, max_size_mb, include_snippets, exclude_system_and_generated,
+    )
+    data = _post_search(body)
+    return _parse_search_documents(data, include_snippets)
+
+# --- Paginación profunda ----------------------------------------------------------
+
+DBID_FIELD = "{http://www.alfresco.org/model/system/1.0}node-dbid"
+MODIFIED_FIELD = "{http://www.alfresco.org/model/content/1.0}modified"
+
+def _entry_dbid(entry: Dict[str, Any]) -> Optional[int]:
+    try:
+        return int((entry.get("properties") or {}).get("sys:node-dbid"))
+    except (TypeError, ValueError):
+        return None
+
+def _with_continuation(body: Dict[str, Any], after_dbid: Optional[int]) -> Dict[str, Any]:
+    # Orden por DBID y rango DBID > último visto: cada página cuesta lo mismo sin importar la profundidad
+    query = body["query"]["query"]
+    if after_dbid is not None:
+        query = f"{query} AND DBID:[{after_dbid + 1} TO MAX]"
+    # sys:node-dbid viene en properties: hay que pedirlas aunque la operación no las use
+    include = list(body.get("include") or [])
+    if "properties" not in include:
+        include.append("properties")
+    fields = list(body.get("fields") or [])
+    if fields and "properties" not in fields:
+        fields.append("properties")
+    return {
+        **body,
+        "query": {**body["query"], "query": query},
+        "sort": [{"type": "FIELD", "field": DBID_FIELD, "ascending": True}],
+        "include": include,
+        **({"fields": fields} if fields else {}),
+    }
+
+class SearchCursor:
+    """
+    Estado de continuación entre páginas de la Search API. Con keyset=True pagina por
+    DBID (sort + rango) en lugar de skipCount crecientes; si algún nodo no trae
+    sys:node-dbid, sigue con offset sobre la misma consulta. Con keyset=False (orden
+    por relevancia) usa offsets. build(max_items, skip_count) arma el cuerpo AFTS.
+    """
+
+    def __init__(self, build: Callable[[int, int], Dict[str, Any]], page_size: int, keyset: bool = True):
+        self.build = build
+        self.page_size = page_size
+        self.keyset = keyset
+        self.after_dbid: Optional[int] = None
+        self.skip = 0
+        self.pages = 0
+
+    def body(self) -> Dict[str, Any]:
+        if not self.keyset:
+            return self.build(self.page_size, self.skip)
+        body = _with_continuation(self.build(self.page_size, 0), self.after_dbid)
+        body["paging"] = {"maxItems": self.page_size, "skipCount": self.skip}
+        return body
+
+    def advance(self, data: Dict[str, Any]) -> bool:
+        """Actualiza la continuación con la página recibida; devuelve si hay más páginas."""
+        lst = data.get("list", {})
+        entries = lst.get("entries", [])
+        self.pages += 1
+        if not entries or not lst.get("pagination", {}).get("hasMoreItems"):
+            return False
+        dbid = _entry_dbid(entries[-1]["entry"]) if self.keyset else None
+        if dbid is not None:
+            self.after_dbid, self.skip = dbid, 0
+        else:
+            self.skip += len(entries)
+        return True
+
+def iter_search_pages(cursor: SearchCursor, prefetch: bool = True) -> Iterator[Dict[str, Any]]:
+    """
+    Recorre las páginas de un cursor. Con prefetch, la página siguiente se pide en
+    segundo plano mientras el consumidor procesa la actual (como mucho una por delante).
+    """
+    with ThreadPoolExecutor(max_workers=1) as prefetcher:
+        pending = prefetcher.submit(_post_search, cursor.body())
+        while pending is not None:
+            data = pending.result()
+            more = cursor.advance(data)
+            pending = prefetcher.submit(_post_search, cursor.body()) if more and prefetch else None
+            yield data
+            if more and not prefetch:
+                pending = prefetcher.submit(_post_search, cursor.body())
+
+def iter_folder_children(
+    folder_id: str,
+    item_type: Literal["files", "folders", "all"] = "all",
+    page_size: int = DEFAULT_PAGE_SIZE,
+    exclude_system_and_generated: bool = True,
+    prefetch: bool = True,
+) -> Iterator[Dict[str, Any]]:
+    """Todos los hijos de una carpeta, en orden de DBID (no por nombre), sin offsets profundos."""
+    cursor = SearchCursor(
+        lambda n, skip: _folder_children_body(folder_id, item_type, n, skip, exclude_system_and_generated),
+        page_size,
+    )
+    for data in iter_search_pages(cursor, prefetch):
+        yield from _parse_folder_children(data)["entries"]
+
+def iter_search_documents(
+    query_text: str = "",
+    site_ids: Optional[List[str]] = None,
+    folder_id: Optional[str] = None,
+    page_size: int = DEFAULT_PAGE_SIZE,
+    mime_whitelist: Optional[List[str]] = None,
+    max_size_mb: Optional[float] = None,
+    include_snippets: bool = False,
+    exclude_system_and_generated: bool = True,
+    prefetch: bool = True,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Todos los resultados de una búsqueda. Sin texto se pagina por DBID; con texto se
+    conserva el orden por relevancia, que solo admite offsets.
+    """
+    cursor = SearchCursor(
+        lambda n, skip: _search_documents_body(
+            query_text, site_ids, folder_id, n, skip,
+            mime_whitelist, max_size_mb, include_snippets, exclude_system_and_generated,
+        ),
+        page_size,
+        keyset=not query_text.strip(),
+    )
+    for data in iter_search_pages(cursor, prefetch):
+        yield from _parse_search_documents(data, include_snippets)["entries"]
+
+NODE_METADATA_INCLUDE = "path,properties,allowableOperations,aspectNames"
+# Solo para validar versiones (modifiedAt de carpetas y documentos): sin includes
+NODE_MODIFIED_FIELDS = ["id", "modifiedAt"]
+
+def _node_metadata_params(include: str, fields: Optional[List[str]]) -> Dict[str, str]:
+    params = {"include": include} if include else {}
+    if fields:
+        params["fields"] = ",".join(fields)
+    return params
+
+def get_node_metadata(node_id: str, include: str = NODE_METADATA_INCLUDE, fields: Optional[List[str]] = None) -> Dict[str, Any]:
     """
     Obtiene el JSON del nodo (documento) directamente desde la API de nodos de Alfresco.
-    No descarga contenido, solo metadatos.
+    No descarga contenido, solo metadatos. Con fields, Alfresco devuelve solo esos campos.
     """
     url = f"{NODES_BASE}/{node_id}"
-    params = {"include": "path,properties,allowableOperations,aspectNames"}
-    headers = {**_auth_header()}
-    r = requests.get(url, headers=headers, params=params, timeout=30)
+    r = get_client().get(url, endpoint="metadata", params=_node_metadata_params(include, fields))
     r.raise_for_status()
-    data = r.json()
+    data = fast_json.loads(r.content)
     return data.get("entry", data)
 
-def _stream_content_bytes(node_id: str, max_bytes: int, expected_size: Optional[int] = None) -> Tuple[bytes, Optional[str]]:
+# Formatos de texto: se piden solo los bytes que probablemente cubren max_chars
+# (caracteres x ancho estimado de la codificación) y se amplía el Range si no alcanzan
+CONTENT_BYTES_PER_CHAR = float(os.getenv("CONTENT_BYTES_PER_CHAR", "1.2"))
+CONTENT_RANGE_MIN_KB = float(os.getenv("CONTENT_RANGE_MIN_KB", "16"))
+# Reanudaciones (Range desde el último byte recibido) tras un corte a mitad de descarga
+CONTENT_RESUME_ATTEMPTS = int(os.getenv("CONTENT_RESUME_ATTEMPTS", "3"))
+
+INTERRUPTED_NOTE = "La descarga se interrumpió y no pudo reanudarse; el texto es parcial."
+DOWNLOAD_FAILED_NOTE = "No se pudo descargar el contenido"
+
+TEXT_MIMES = ("application/json", "application/xml", "text/xml", "text/csv", "text/html")
+
+# Ventanas de texto (/documents/{id}/text): longitud por defecto, caracteres por página
+# que se suponen para un PDF aún sin indexar y rondas de extracción para cubrir la ventana
+TEXT_WINDOW_DEFAULT_CHARS = int(os.getenv("TEXT_WINDOW_DEFAULT_CHARS", "20000"))
+PAGE_CHARS_ESTIMATE = int(os.getenv("PAGE_CHARS_ESTIMATE", "3000"))
+TEXT_WINDOW_ROUNDS = 4
+
+def _mime_kind(mime: str) -> Optional[str]:
+    if mime.startswith("text/") or mime in TEXT_MIMES:
+        return "text"
+    if mime == "application/pdf":
+        return "pdf"
+    if mime == "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
+        return "docx"
+    return None
+
+class ContentTransfer:
     """
-    Descarga el contenido del nodo en memoria, limitado a max_bytes.
-    Si expected_size está disponible, ajusta el Range para evitar lecturas incompletas.
-    Devuelve (bytes_leidos, mimeType). En errores de streaming, retorna lo ya leído.
+    Contabilidad de la descarga de un documento: bytes recibidos por la red (incluidos
+    los descartados), peticiones con Range, ampliaciones del Range y reanudaciones.
     """
-    import http.client as httplib
 
-    url = f"{NODES_BASE}/{node_id}/content"
-    params = {"attachment": "false"}
+    def __init__(self):
+        self.bytes_transferred = 0
+        self.requests = 0
+        self.extensions = 0
+        self.resumes = 0
+        self.total_size: Optional[int] = None
+        self.interrupted = False
+
+    def observe_response(self, content_range: Optional[str]) -> None:
+        # "bytes 0-16383/123456": el total permite saber si queda algo por pedir
+        if content_range and "/" in content_range:
+            total = content_range.rsplit("/", 1)[1].strip()
+            if total.isdigit():
+                self.total_size = int(total)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "bytesTransferred": self.bytes_transferred,
+            "requests": self.requests,
+            "extensions": self.extensions,
+            "resumes": self.resumes,
+            "interrupted": self.interrupted,
+        }
 
-    def _read_response(resp: requests.Response, limit: int) -> Tuple[bytes, Optional[str]]:
-        mime = resp.headers.get("Content-Type")
-        buf = io.BytesIO()
-        read = 0
-        try:
-            for chunk in resp.iter_content(chunk_size=64 * 1024):
-                if not chunk:
-                    break
-                if read + len(chunk) > limit:
-                    buf.write(chunk[: limit - read])
-                    read = limit
-                    break
-                buf.write(chunk)
-                read += len(chunk)
-        except (requests.exceptions.ChunkedEncodingError,
-                requests.exceptions.ContentDecodingError,
-                requests.exceptions.StreamConsumedError,
-                httplib.IncompleteRead,
-                Exception):
-            # Devolvemos lo que alcanzamos a leer
-            return buf.getvalue(), mime
-        return buf.getvalue(), mime
-
-    # Primer intento: con Range (ajustado al tamaño esperado si lo sabemos)
-    headers = {**_auth_header(), "Accept": "*/*"}
-    if max_bytes > 0:
-        end = max_bytes - 1
+    def record(self) -> None:
+        DOWNLOAD_TRANSFERRED_BYTES.inc(self.bytes_transferred)
+        if self.extensions:
+            DOWNLOAD_RANGE_REQUESTS.inc(self.extensions, reason="extend")
+        if self.resumes:
+            DOWNLOAD_RANGE_REQUESTS.inc(self.resumes, reason="resume")
+        if self.interrupted:
+            DOWNLOAD_INTERRUPTED.inc()
+
+def _initial_byte_budget(mime: str, max_chars: int, max_bytes: int) -> int:
+    """Bytes a pedir de entrada: todo (hasta max_bytes) salvo en texto, donde basta max_chars."""
+    if _mime_kind(mime) != "text" or max_chars <= 0:
+        return max_bytes
+    estimate = int(max(max_chars * CONTENT_BYTES_PER_CHAR, CONTENT_RANGE_MIN_KB * 1024))
+    return min(max_bytes, estimate)
+
+def _next_byte_budget(payload: Dict[str, Any], max_chars: int, budget: int, max_bytes: int,
+                      total_size: Optional[int]) -> Optional[int]:
+    """
+    Nuevo tope de bytes si el texto decodificado no llega a max_chars y aún queda contenido
+    por pedir; None si lo descargado basta. Extrapola con los bytes/carácter observados.
+    """
+    if payload.get("failed"):
+        return None
+    read = payload["bytesRead"]
+    chars = len(payload["text"])
+    if chars >= max_chars or read < budget or budget >= max_bytes:
+        return None
+    if total_size is not None and read >= total_size:
+        return None
+    per_char = read / max(chars, 1)
+    wanted = int((max_chars - chars) * per_char * 1.1) + 1
+    return min(max_bytes, read + max(wanted, budget // 2, int(CONTENT_RANGE_MIN_KB * 1024)))
+
+def _reached_end(read: int, budget: int, total_size: Optional[int], transfer: ContentTransfer) -> bool:
+    """Si se leyó el contenido hasta el final, y no solo hasta el tope del Range."""
+    if transfer.interrupted:
+        return False
+    if total_size:
+        return read >= total_size
+    return read < budget
+
+def _content_range_header(start: int, end: int, expected_size: Optional[int]) -> Dict[str, str]:
+    headers = {"Accept": "*/*"}
+    if end > 0:
         if expected_size and expected_size > 0:
             end = min(end, expected_size - 1)
-        headers["Range"] = f"bytes=0-{end}"
-
-    try:
-        with requests.get(url, headers=headers, params=params, stream=True, timeout=60) as r:
-            if r.status_code == 416:
-                # Range inválido: reintenta sin Range
-                with requests.get(url, headers={**_auth_header(), "Accept": "*/*"}, params=params, stream=True, timeout=60) as r2:
-                    r2.raise_for_status()
-                    return _read_response(r2, max_bytes)
-            r.raise_for_status()
-            return _read_response(r, max_bytes)
-    except requests.RequestException as e:
-        # Error de transporte/HTTP a pesar de los intentos
-        raise AlfrescoSearchError(f"Content request failed: {e}") from e
-    
-def _decode_text(data: bytes, fallback_encoding: str = "utf-8") -> str:
-    if not data:
-        return ""
-    enc = fallback_encoding
-    if chardet:
-        try:
-            det = chardet.detect(data)
-            if det and det.get("encoding"):
-                enc = det["encoding"]
-        except Exception:
-            pass
-    try:
-        return data.decode(enc, errors="replace")
-    except Exception:
-        return data.decode("utf-8", errors="replace")
-
-def _extract_text_from_pdf(data: bytes) -> str:
-    if not PdfReader:
-        return "[PDF: pypdf no instalado]"
-    try:
-        reader = PdfReader(io.BytesIO(data))
-        parts = []
-        for page in reader.pages:
-            try:
-                parts.append(page.extract_text() or "")
-            except Exception:
-                parts.append("")
-        return "\n".join(parts).strip()
-    except Exception as e:
-        return f"[PDF: error al extraer texto: {e}]"
-
-def _extract_text_from_docx(data: bytes) -> str:
-    if not Document:
-        return "[DOCX: python-docx no instalado]"
-    try:
-        doc = Document(io.BytesIO(data))
-        parts = [p.text for p in doc.paragraphs]
-        return "\n".join(parts).strip()
-    except Exception as e:
-        return f"[DOCX: error al extraer texto: {e}]"
-
-def get_document_with_content(node_id: str, max_chars: int = MAX_CHARS_DEFAULT) -> Dict[str, Any]:
+        headers["Range"] = f"bytes={start}-{end}"
+    return headers
+
+def _iter_body(resp: requests.Response, chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+    # read1 (urllib3 >= 2) entrega lo que ya llegó; con iter_content, un corte a mitad de
+    # bloque se lleva el bloque entero y la reanudación repetiría esos bytes
+    read1 = getattr(resp.raw, "read1", None)
+    if read1 is None:
+        yield from resp.iter_content(chunk_size=chunk_size)
+        return
+    while True:
+        chunk = read1(chunk_size, decode_content=True)
+        if not chunk:
+            return
+        yield chunk
+
+def _stream_content(node_id: str, max_bytes: int, expected_size: Optional[int] = None,
+                    buf: Optional[ContentBuffer] = None, transfer: Optional[ContentTransfer] = None,
+                    on_chunk: Optional[Callable[[bytes], None]] = None,
+                    ) -> Tuple[ContentBuffer, Optional[str]]:
     """
-    Retorna el JSON del nodo + el campo contentText (texto extraído) y banderas de truncamiento.
-    Nunca lanza 500: si algo falla, devuelve metadatos y una nota en contentNote.
+    Descarga el contenido del nodo hasta max_bytes en un ContentBuffer (memoria hasta el
+    umbral de volcado, archivo temporal por encima). El llamador debe cerrarlo.
+    Con buf, continúa a partir de len(buf) (ampliación del Range). Si la conexión se corta
+    a mitad del cuerpo, reanuda con Range desde el último byte recibido (hasta
+    CONTENT_RESUME_ATTEMPTS veces); agotadas, devuelve lo leído y marca transfer.interrupted.
+    on_chunk recibe cada trozo en cuanto se escribe (p.ej. para decodificar texto en paralelo).
+    Un 416 significa que no quedan bytes a partir de la posición pedida.
+    Devuelve (buffer, mimeType).
     """
-    meta = get_node_metadata(node_id)
+    import http.client as httplib
+    import urllib3
+
+    url = f"{NODES_BASE}/{node_id}/content"
+    params = {"attachment": "false"}
+    client = get_client()
+    buf = ContentBuffer() if buf is None else buf
+    transfer = ContentTransfer() if transfer is None else transfer
+    mime: Optional[str] = None
+    resumes_left = CONTENT_RESUME_ATTEMPTS
+
+    while len(buf) < max_bytes:
+        start = len(buf)
+        headers = _content_range_header(start, max_bytes - 1, expected_size)
+        transfer.requests += 1
+        try:
+            with client.get(url, endpoint="content", headers=headers, params=params, stream=True) as r:
+                if r.status_code == 416:
+                    break
+                r.raise_for_status()
+                mime = mime or r.headers.get("Content-Type")
+                transfer.observe_response(r.headers.get("Content-Range"))
+                # Un servidor que ignora Range responde 200 con el cuerpo entero: se salta lo ya leído
+                skip = start if r.status_code == 200 else 0
+                try:
+                    for chunk in _iter_body(r):
+                        if not chunk:
+                            break
+                        transfer.bytes_transferred += len(chunk)
+                        if skip:
+                            dropped = min(skip, len(chunk))
+                            chunk, skip = chunk[dropped:], skip - dropped
+                        room = max_bytes - len(buf)
+                        buf.write(chunk[:room])
+                        if on_chunk is not None:
+                            on_chunk(chunk[:room])
+                        if len(chunk) >= room:
+                            break
+                except (requests.exceptions.RequestException, urllib3.exceptions.HTTPError, httplib.HTTPException, OSError):
+                    # Los intentos se reponen mientras cada conexión avance; se agotan si se corta sin aportar bytes
+                    resumes_left = CONTENT_RESUME_ATTEMPTS if len(buf) > start else resumes_left - 1
+                    if resumes_left < 0 or CONTENT_RESUME_ATTEMPTS <= 0:
+                        transfer.interrupted = True
+                        break
+                    transfer.resumes += 1
+                    continue
+                break
+        except requests.RequestException as e:
+            # Error de transporte/HTTP a pesar de los intentos; si ya hay bytes, se conservan
+            if not len(buf):
+                buf.close()
+                raise AlfrescoSearchError(f"Content request failed: {e}") from e
+            transfer.interrupted = True
+            break
+    return buf, mime
+
+def _content_result_base(meta: Dict[str, Any], max_chars: int) -> Dict[str, Any]:
     content_info = meta.get("content") or {}
     declared_mime = content_info.get("mimeType") or ""
     size_bytes = int(content_info.get("sizeInBytes") or 0)
@@ -378,6 +651,7 @@ def get_document_with_content(node_id: str, max_chars: int = MAX_CHARS_DEFAULT)
     combined["contentText"] = ""
     combined["contentTextTruncated"] = False
     combined["contentBytesRead"] = 0
+    combined["contentBytesTransferred"] = 0
     combined["contentMaxDownloadMB"] = MAX_DOWNLOAD_MB
     combined["contentMaxChars"] = max_chars
     combined["contentMimeDetected"] = declared_mime
@@ -386,54 +660,332 @@ def get_document_with_content(node_id: str, max_chars: int = MAX_CHARS_DEFAULT)
 
     if not declared_mime and size_bytes == 0:
         combined["contentNote"] = "El nodo no contiene binario o no expone mimeType/size."
-        return combined
+    return combined
 
-    max_download_bytes = int(MAX_DOWNLOAD_MB * 1024 * 1024)
-
-    # Descargar binario (limitado), ajustando Range al tamaño esperado
-    try:
-        raw, resp_mime = _stream_content_bytes(node_id, max_download_bytes, expected_size=size_bytes if size_bytes > 0 else None)
-    except AlfrescoSearchError as e:
-        combined["contentNote"] = f"No se pudo descargar el contenido: {e}"
-        return combined
+def _needs_download(combined: Dict[str, Any]) -> bool:
+    return bool(combined["contentMimeDetected"] or combined["contentTotalSizeInBytes"])
 
+def _extract_payload(raw: ContentBuffer, declared_mime: str, resp_mime: Optional[str], size_bytes: int, max_chars: Optional[int] = None,
+                     decoder: Optional[IncrementalTextDecoder] = None, final: bool = True) -> Dict[str, Any]:
+    """
+    Extrae el texto del binario descargado, listo para caché. Los PDF/DOCX se recorren
+    página a página (párrafo a párrafo) y se dejan de parsear al cubrir max_chars.
+    El trabajo CPU-bound (pypdf/python-docx) lo hace el motor de extracción (pool de
+    procesos); la versión async además llama desde fuera del event loop.
+    Con decoder, el texto plano ya se decodificó mientras se descargaba; final indica si
+    la descarga llegó al final del contenido (si no, se omite la secuencia cortada).
+    size_bytes es el tamaño total si se conoce (metadatos o Content-Range), 0 si no.
+    """
     eff_mime = declared_mime or resp_mime or ""
-    combined["contentMimeDetected"] = eff_mime
-    combined["contentBytesRead"] = len(raw)
-    combined["contentDownloadTruncated"] = bool(size_bytes and len(raw) < size_bytes)
+    payload: Dict[str, Any] = {
+        "text": "",
+        "note": "",
+        "mime": eff_mime,
+        "bytesRead": len(raw),
+        # Sin tamaño conocido (ni en metadatos ni en Content-Range), solo cuenta si se llegó al final
+        "downloadTruncated": len(raw) < size_bytes if size_bytes else not final,
+        "textComplete": True,
+        "charsBudget": None,
+        "extent": None,
+    }
 
-    if combined["contentDownloadTruncated"] and eff_mime in (
+    if payload["downloadTruncated"] and eff_mime in (
         "application/pdf",
         "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
         "application/msword",
     ):
-        combined["contentNote"] = (
+        payload["note"] = (
             f"Archivo más grande que el límite de descarga ({MAX_DOWNLOAD_MB} MB). "
             f"No se intentó extraer texto para evitar errores. Aumenta MAX_DOWNLOAD_MB o descarga completo."
         )
-        return combined
+        return payload
 
     # Extraer texto según tipo
-    text = ""
-    note = combined["contentNote"] or ""
-    if eff_mime.startswith("text/") or eff_mime in ("application/json", "application/xml", "text/xml", "text/csv", "text/html"):
-        text = _decode_text(raw)
-    elif eff_mime == "application/pdf":
-        text = _extract_text_from_pdf(raw)
-    elif eff_mime == "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
-        text = _extract_text_from_docx(raw)
-    elif eff_mime == "application/msword":
-        note = (note + " " if note else "") + "El formato .doc clásico no está soportado para extracción en este demo."
-    else:
-        note = (note + " " if note else "") + f"Tipo MIME no soportado para extracción de texto: {eff_mime or 'desconocido'}"
-
-    # Truncar por caracteres
-    truncated = False
+    kind = _mime_kind(eff_mime)
+    if kind is None and eff_mime == "application/msword":
+        payload["note"] = "El formato .doc clásico no está soportado para extracción en este demo."
+    elif kind is None:
+        payload["note"] = f"Tipo MIME no soportado para extracción de texto: {eff_mime or 'desconocido'}"
+
+    if kind == "text" and decoder is not None:
+        text = decoder.finish() if final else decoder.text()
+        res = {"text": text, "complete": True, "charsBudget": None, "unit": None}
+    elif kind:
+        with stage("extraction"):
+            res = get_extraction_engine().extract(kind, raw.source(), eff_mime, max_chars)
+    if kind:
+        EXTRACTION_CHARS.observe(len(res["text"]), mime=eff_mime)
+        payload["text"] = res["text"]
+        payload["textComplete"] = res["complete"]
+        payload["charsBudget"] = res["charsBudget"]
+        if res.get("failed"):
+            # Fallo transitorio del motor de extracción: no debe llegar a la caché
+            payload["failed"] = True
+        if kind == "text" and payload["downloadTruncated"] and len(raw) < int(MAX_DOWNLOAD_MB * 1024 * 1024):
+            # Texto de un Range parcial (no del tope MAX_DOWNLOAD_MB): el último carácter
+            # puede haber quedado partido, y la caché debe saber que hay más por pedir
+            payload["text"] = payload["text"].rstrip("\ufffd")
+            payload["textComplete"] = False
+            payload["charsBudget"] = len(payload["text"])
+        if res.get("unit"):
+            payload["extent"] = {"unit": res["unit"], "covered": res["covered"], "total": res["total"]}
+            if res.get("offsets") is not None:
+                payload["extent"]["offsets"] = res["offsets"]
+    return payload
+
+def _apply_payload(combined: Dict[str, Any], payload: Dict[str, Any], max_chars: int) -> Dict[str, Any]:
+    combined["contentMimeDetected"] = payload["mime"]
+    combined["contentBytesRead"] = payload["bytesRead"]
+    combined["contentDownloadTruncated"] = payload["downloadTruncated"]
+
+    # Truncar por caracteres (un texto que ya se guardó recortado sigue estando truncado)
+    text = payload["text"]
+    truncated = not payload.get("textComplete", True)
     if text and len(text) > max_chars:
         text = text[:max_chars]
         truncated = True
 
     combined["contentText"] = text
     combined["contentTextTruncated"] = bool(truncated)
-    combined["contentNote"] = note
-    return combined
\ No newline at end of file
+    combined["contentNote"] = payload["note"]
+    if payload.get("failed"):
+        combined["contentExtractionFailed"] = True
+
+    # Qué parte del documento se recorrió (la extracción se detiene al cubrir max_chars)
+    extent = payload.get("extent")
+    if extent and extent.get("unit") == "pages":
+        combined["contentPagesCovered"] = extent["covered"]
+        combined["contentPagesTotal"] = extent["total"]
+    elif extent and extent.get("unit") == "paragraphs":
+        combined["contentParagraphsCovered"] = extent["covered"]
+        combined["contentParagraphsTotal"] = extent["total"]
+    return combined
+
+def _download_and_extract(node_id: str, mime: str, size_bytes: int, max_chars: int) -> Tuple[Dict[str, Any], ContentTransfer]:
+    """
+    Descarga lo necesario para cubrir max_chars (en texto, por Range ampliable) y extrae el
+    texto. Devuelve (payload para caché, transferencia). Lanza AlfrescoSearchError si la
+    primera descarga falla.
+    """
+    max_download_bytes = int(MAX_DOWNLOAD_MB * 1024 * 1024)
+    expected_size = size_bytes if size_bytes > 0 else None
+    budget = _initial_byte_budget(mime, max_chars, max_download_bytes)
+    transfer = ContentTransfer()
+    # El texto plano se decodifica a medida que llega, solapado con la descarga
+    decoder = IncrementalTextDecoder() if _mime_kind(mime) == "text" else None
+    on_chunk = decoder.feed if decoder is not None else None
+
+    # Descargar binario (limitado); en texto, solo el Range que cubre max_chars
+    with stage("download", DOWNLOAD_SECONDS):
+        raw, resp_mime = _stream_content(node_id, budget, expected_size, transfer=transfer, on_chunk=on_chunk)
+
+    with raw:
+        final = _reached_end(len(raw), budget, transfer.total_size or expected_size, transfer)
+        payload = _extract_payload(raw, mime, resp_mime, size_bytes or transfer.total_size or 0, max_chars, decoder, final)
+        # Si el texto decodificado no llega a max_chars, se amplía el Range desde donde quedó
+        while not transfer.interrupted:
+            budget = _next_byte_budget(payload, max_chars, budget, max_download_bytes, transfer.total_size or expected_size)
+            if budget is None:
+                break
+            transfer.extensions += 1
+            with stage("download", DOWNLOAD_SECONDS):
+                _stream_content(node_id, budget, expected_size, buf=raw, transfer=transfer, on_chunk=on_chunk)
+            final = _reached_end(len(raw), budget, transfer.total_size or expected_size, transfer)
+            payload = _extract_payload(raw, mime, resp_mime, size_bytes or transfer.total_size or 0, max_chars, decoder, final)
+    if decoder is not None:
+        EXTRACTION_SECONDS.observe(decoder.seconds, mime=payload["mime"], mode="stream")
+    DOWNLOAD_BYTES.observe(payload["bytesRead"])
+    transfer.record()
+    if transfer.interrupted:
+        payload["note"] = (payload["note"] + " " + INTERRUPTED_NOTE).strip()
+    return payload, transfer
+
+def _payload_index_info(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Misma forma que ExtractedTextCache.index_info() para un payload recién extraído."""
+    return {"chars": len(payload["text"]), "complete": bool(payload.get("textComplete", True)), "extent": payload.get("extent")}
+
+def _page_char_range(info: Dict[str, Any], page_from: int, page_to: int) -> Optional[Tuple[int, int]]:
+    """[inicio, fin) en caracteres de las páginas page_from..page_to (desde 1); None si aún no están extraídas."""
+    extent = info.get("extent") or {}
+    offsets = extent.get("offsets")
+    if extent.get("unit") != "pages" or offsets is None:
+        # Texto indexado antes de guardar el inicio de cada página: hay que volver a extraer
+        return None
+    total = extent.get("total") or 0
+    if total and page_from > total:
+        raise ValueError(f"pageFrom={page_from} supera el número de páginas del documento ({total})")
+    page_to = min(page_to, total) if total else page_to
+    if page_to < len(offsets):
+        return offsets[page_from - 1], offsets[page_to]
+    if info["complete"] and page_from <= len(offsets):
+        return offsets[page_from - 1], info["chars"]
+    return None
+
+def _window_bounds(info: Dict[str, Any], offset: int, length: int, page_from: Optional[int], page_to: Optional[int]) -> Optional[Tuple[int, int]]:
+    """[inicio, fin) de la ventana si el texto extraído/indexado la cubre; None si hay que extraer más."""
+    if page_from is not None:
+        return _page_char_range(info, page_from, page_to)
+    end = offset + length
+    if info["complete"]:
+        return min(offset, info["chars"]), min(end, info["chars"])
+    return (offset, end) if info["chars"] >= end else None
+
+def _window_chars_needed(info: Optional[Dict[str, Any]], offset: int, length: int, page_from: Optional[int], page_to: Optional[int]) -> int:
+    """Caracteres que hay que extraer para cubrir la ventana (nunca menos del doble de lo ya indexado)."""
+    if page_from is None:
+        needed = offset + length
+    else:
+        offsets = ((info or {}).get("extent") or {}).get("offsets") or []
+        per_page = info["chars"] / len(offsets) if info and offsets else PAGE_CHARS_ESTIMATE
+        # La página siguiente a page_to marca dónde termina la ventana
+        needed = int(per_page * (page_to + 1) * 1.25)
+    if info is not None:
+        needed = max(needed, 2 * info["chars"])
+    return max(1, min(needed, TEXT_INDEX_MAX_CHARS))
+
+def _validate_window(mime: str, offset: int, length: int, page_from: Optional[int], page_to: Optional[int]) -> Tuple[Optional[int], Optional[int]]:
+    if offset < 0 or length < 0:
+        raise ValueError("offset y length no pueden ser negativos")
+    if page_from is None and page_to is None:
+        return None, None
+    page_from = page_from or 1
+    page_to = page_to or page_from
+    if page_from < 1 or page_to < page_from:
+        raise ValueError("Rango de páginas inválido: se requiere 1 <= pageFrom <= pageTo")
+    if _mime_kind(mime) != "pdf":
+        raise ValueError("El rango de páginas solo está disponible para PDF")
+    return page_from, page_to
+
+def _window_base(node_id: str, meta: Dict[str, Any], offset: int, page_from: Optional[int], page_to: Optional[int]) -> Dict[str, Any]:
+    base = _content_result_base(meta, 0)
+    result: Dict[str, Any] = {
+        "id": node_id,
+        "name": meta.get("name"),
+        "mime": base["contentMimeDetected"],
+        "offset": offset,
+        "length": 0,
+        "text": "",
+        "totalChars": None,
+        "hasMore": False,
+        "note": base["contentNote"],
+        "index": "bypass",
+        "chunksRead": 0,
+        "bytesTransferred": 0,
+    }
+    if page_from is not None:
+        result["pageFrom"], result["pageTo"] = page_from, page_to
+    return result
+
+def _window_result(result: Dict[str, Any], info: Dict[str, Any], bounds: Tuple[int, int], text: str, chunks_read: int) -> Dict[str, Any]:
+    result.update({
+        "offset": bounds[0],
+        "length": len(text),
+        "text": text,
+        "totalChars": info["chars"] if info["complete"] else None,
+        "hasMore": not info["complete"] or bounds[1] < info["chars"],
+        "chunksRead": chunks_read,
+    })
+    extent = info.get("extent") or {}
+    if extent.get("unit") == "pages":
+        result["pagesTotal"] = extent.get("total")
+    return result
+
+def _window_not_covered(result: Dict[str, Any]) -> Dict[str, Any]:
+    result["hasMore"] = True
+    note = f"La ventana queda fuera del texto que se puede extraer e indexar (máximo {TEXT_INDEX_MAX_CHARS} caracteres)."
+    result["note"] = (result["note"] + " " + note).strip()
+    return result
+
+def get_text_window(node_id: str, offset: int = 0, length: int = TEXT_WINDOW_DEFAULT_CHARS, page_from: Optional[int] = None,
+                    page_to: Optional[int] = None, meta: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Ventana del texto extraído: los caracteres [offset, offset + length) o las páginas
+    page_from..page_to (solo PDF), leída de los fragmentos del índice de la caché: solo se
+    descomprimen los que se solapan con la ventana. Si el índice no la cubre, se extrae
+    hasta el final de la ventana (no el documento entero), se indexa y se responde.
+    Lanza ValueError con parámetros inválidos y AlfrescoSearchError si la descarga falla.
+    """
+    if meta is None:
+        meta = get_node_metadata(node_id)
+    mime = (meta.get("content") or {}).get("mimeType") or ""
+    page_from, page_to = _validate_window(mime, offset, length, page_from, page_to)
+    result = _window_base(node_id, meta, offset, page_from, page_to)
+    content_info = meta.get("content") or {}
+    if not (mime or content_info.get("sizeInBytes")):
+        return result
+
+    cache = get_text_cache()
+    version = content_version(meta)
+    info = cache.index_info(node_id, version) if cache is not None else None
+    if cache is not None:
+        result["index"] = "hit"
+    payload = None
+    interrupted = False
+    for _ in range(TEXT_WINDOW_ROUNDS):
+        bounds = _window_bounds(info, offset, length, page_from, page_to) if info is not None else None
+        if bounds is not None:
+            # Recién extraído: el texto ya está en memoria; si no, se lee del índice
+            if payload is not None:
+                return _window_result(result, info, bounds, payload["text"][bounds[0]:bounds[1]], 0)
+            read = cache.read_window(node_id, version, bounds[0], bounds[1] - bounds[0])
+            if read is not None:
+                return _window_result(result, info, bounds, read["text"], read["chunksRead"])
+        if interrupted or (info is not None and (info["complete"] or info["chars"] >= TEXT_INDEX_MAX_CHARS)):
+            break
+        needed = _window_chars_needed(info, offset, length, page_from, page_to)
+        if cache is not None:
+            result["index"] = "miss" if info is None else "extended"
+        payload, transfer = _download_and_extract(node_id, result["mime"], int(content_info.get("sizeInBytes") or 0), needed)
+        result["bytesTransferred"] += transfer.bytes_transferred
+        result["mime"] = payload["mime"]
+        result["note"] = payload["note"]
+        if payload.get("failed"):
+            break
+        if cache is not None and not transfer.interrupted:
+            cache.put(node_id, version, payload)
+        info = _payload_index_info(payload)
+        interrupted = transfer.interrupted
+    return _window_not_covered(result)
+
+def content_fetch_failed(doc: Dict[str, Any]) -> bool:
+    """
+    True si get_document_with_content no pudo obtener el texto completo por un fallo
+    transitorio (descarga fallida o cortada, extracción fallida): hay que reintentarlo.
+    """
+    return (
+        str(doc.get("contentNote") or "").startswith(DOWNLOAD_FAILED_NOTE)
+        or bool((doc.get("contentTransfer") or {}).get("interrupted"))
+        or bool(doc.get("contentExtractionFailed"))
+    )
+
+def get_document_with_content(node_id: str, max_chars: int = MAX_CHARS_DEFAULT, meta: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Retorna el JSON del nodo + el campo contentText (texto extraído) y banderas de truncamiento.
+    Nunca lanza 500: si algo falla, devuelve metadatos y una nota en contentNote.
+    Si el llamador ya tiene los metadatos del nodo (p.ej. de una búsqueda), puede pasarlos en meta.
+    """
+    if meta is None:
+        meta = get_node_metadata(node_id)
+    combined = _content_result_base(meta, max_chars)
+    if not _needs_download(combined):
+        return combined
+
+    # Los metadatos ya traen modifiedAt/versión: basta para validar el texto en caché
+    cache = get_text_cache()
+    version = content_version(meta)
+    if cache is not None:
+        payload, status = cache.get(node_id, version, max_chars)
+        combined["contentCache"] = status
+        if payload is not None:
+            return _apply_payload(combined, payload, max_chars)
+
+    try:
+        payload, transfer = _download_and_extract(node_id, combined["contentMimeDetected"], combined["contentTotalSizeInBytes"], max_chars)
+    except AlfrescoSearchError as e:
+        combined["contentNote"] = f"{DOWNLOAD_FAILED_NOTE}: {e}"
+        return combined
+    if cache is not None and not transfer.interrupted and not payload.get("failed"):
+        cache.put(node_id, version, payload)
+    combined["contentBytesTransferred"] = transfer.bytes_transferred
+    combined["contentTransfer"] = transfer.as_dict()
+    return _apply_payload(combined, payload, max_chars)
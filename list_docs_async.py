@@ -0,0 +1,448 @@
+"""
+Versión asyncio de la API de list_docs sobre el cliente HTTP asíncrono con pool.
+Reutiliza los mismos constructores de consulta AFTS y parsers que la versión síncrona;
+la extracción de texto (CPU-bound) se ejecuta fuera del event loop.
+"""
+import os
+import time
+import asyncio
+from typing import Dict, List, Optional, Literal, Any, Tuple, AsyncIterator, Callable
+
+import fast_json
+from alfresco_http import get_async_client
+from list_docs import (
+    SEARCH_URL,
+    NODES_BASE,
+    NODE_METADATA_INCLUDE,
+    NODE_MODIFIED_FIELDS,
+    DEFAULT_PAGE_SIZE,
+    DEFAULT_MAX_DOCS,
+    MAX_DOWNLOAD_MB,
+    MAX_CHARS_DEFAULT,
+    CONTENT_RESUME_ATTEMPTS,
+    TEXT_WINDOW_DEFAULT_CHARS,
+    TEXT_WINDOW_ROUNDS,
+    AlfrescoSearchError,
+    ContentTransfer,
+    INTERRUPTED_NOTE,
+    DOWNLOAD_FAILED_NOTE,
+    _list_sites_body,
+    _parse_sites,
+    _document_library_body,
+    _parse_document_library,
+    _folder_children_body,
+    _parse_folder_children,
+    _search_documents_body,
+    _parse_search_documents,
+    _node_metadata_params,
+    _content_range_header,
+    _initial_byte_budget,
+    _mime_kind,
+    _reached_end,
+    _next_byte_budget,
+    _content_result_base,
+    _needs_download,
+    _extract_payload,
+    _apply_payload,
+    _payload_index_info,
+    _window_bounds,
+    _window_chars_needed,
+    _validate_window,
+    _window_base,
+    _window_result,
+    _window_not_covered,
+    SearchCursor,
+)
+from text_cache import get_text_cache, content_version, TEXT_INDEX_MAX_CHARS
+from content_buffer import ContentBuffer
+from response_cache import get_search_cache, normalize_key, search_cache_status
+from metrics import stage, DOWNLOAD_BYTES, DOWNLOAD_SECONDS, EXTRACTION_SECONDS
+from text_decoding import IncrementalTextDecoder
+
+try:
+    import aiohttp
+except Exception:
+    aiohttp = None
+
+# Búsqueda multi-site en abanico: una consulta por site en paralelo
+FANOUT_CONCURRENCY = int(os.getenv("FANOUT_CONCURRENCY", "8"))
+FANOUT_SITE_TIMEOUT_S = float(os.getenv("FANOUT_SITE_TIMEOUT_S", "5"))
+
+
+async def _search_upstream(body: Dict, timeout: Optional[float] = None) -> Dict:
+    r = await get_async_client().post(SEARCH_URL, endpoint="search", json=body, idempotent=True, timeout=timeout)
+    if r.status >= 400:
+        raise AlfrescoSearchError(f"Search API error {r.status}: {await r.text()}")
+    return await r.json(loads=fast_json.loads, content_type=None)
+
+async def _post_search(body: Dict, timeout: Optional[float] = None, use_cache: bool = False) -> Dict:
+    """
+    Con use_cache, la respuesta se sirve de la caché TTL por cuerpo AFTS normalizado y las
+    consultas idénticas concurrentes se coalescen; el estado queda en search_cache_status.
+    """
+    cache = get_search_cache() if use_cache else None
+    if cache is None:
+        search_cache_status.set("BYPASS")
+        return await _search_upstream(body, timeout)
+    data, status = await cache.get_or_fetch(normalize_key(body), lambda: _search_upstream(body, timeout))
+    search_cache_status.set(status)
+    return data
+
+async def list_sites(
+    max_items: int = DEFAULT_PAGE_SIZE,
+    skip_count: int = 0,
+    query_text: str = "",
+) -> Dict[str, Any]:
+    data = await _post_search(_list_sites_body(max_items, skip_count, query_text))
+    return _parse_sites(data)
+
+async def get_document_library_folder(site_id: str) -> Optional[Dict[str, Any]]:
+    data = await _post_search(_document_library_body(site_id))
+    return _parse_document_library(data)
+
+async def list_folder_children(
+    folder_id: str,
+    item_type: Literal["files", "folders", "all"] = "all",
+    max_items: int = DEFAULT_PAGE_SIZE,
+    skip_count: int = 0,
+    exclude_system_and_generated: bool = True,
+    use_cache: bool = True,
+) -> Dict[str, Any]:
+    body = _folder_children_body(folder_id, item_type, max_items, skip_count, exclude_system_and_generated)
+    data = await _post_search(body, use_cache=use_cache)
+    return _parse_folder_children(data)
+
+async def search_documents(
+    query_text: str = "",
+    site_ids: Optional[List[str]] = None,
+    folder_id: Optional[str] = None,
+    max_items: int = DEFAULT_MAX_DOCS,
+    skip_count: int = 0,
+    mime_whitelist: Optional[List[str]] = None,
+    max_size_mb: Optional[float] = None,
+    include_snippets: bool = True,
+    exclude_system_and_generated: bool = True,
+    use_cache: bool = True,
+) -> Dict[str, Any]:
+    body = _search_documents_body(
+        query_text, site_ids, folder_id, max_items, skip_count,
+        mime_whitelist, max_size_mb, include_snippets, exclude_system_and_generated,
+    )
+    data = await _post_search(body, use_cache=use_cache)
+    return _parse_search_documents(data, include_snippets)
+
+async def search_documents_fanout(
+    query_text: str = "",
+    site_ids: Optional[List[str]] = None,
+    folder_id: Optional[str] = None,
+    max_items: int = DEFAULT_MAX_DOCS,
+    skip_count: int = 0,
+    mime_whitelist: Optional[List[str]] = None,
+    max_size_mb: Optional[float] = None,
+    include_snippets: bool = True,
+    exclude_system_and_generated: bool = True,
+    use_cache: bool = True,
+    concurrency: int = FANOUT_CONCURRENCY,
+    site_timeout_s: float = FANOUT_SITE_TIMEOUT_S,
+) -> Dict[str, Any]:
+    """
+    Alternativa a search_documents para varios sites: en lugar de un OR de PATH (lento en
+    Solr) lanza una consulta por site, con paralelismo acotado y timeout por site, y mezcla
+    los resultados por score en una sola página. Si un site falla o excede el timeout se
+    devuelven los demás (partial=true) y el detalle queda en "sites".
+    Cada site pide skip_count + max_items resultados para que la página mezclada sea exacta.
+    """
+    sem = asyncio.Semaphore(max(1, concurrency))
+    window = skip_count + max_items
+
+    async def one(site_id: str) -> Tuple[str, Dict[str, Any], List[Dict[str, Any]], Optional[str]]:
+        body = _search_documents_body(
+            query_text, [site_id], folder_id, window, 0,
+            mime_whitelist, max_size_mb, include_snippets, exclude_system_and_generated,
+        )
+        async with sem:
+            t0 = time.perf_counter()
+            try:
+                data = await asyncio.wait_for(_post_search(body, timeout=site_timeout_s, use_cache=use_cache), site_timeout_s)
+            except asyncio.TimeoutError:
+                return site_id, {"status": "timeout", "seconds": round(time.perf_counter() - t0, 3)}, [], None
+            except Exception as e:
+                return site_id, {"status": "error", "error": str(e), "seconds": round(time.perf_counter() - t0, 3)}, [], None
+        parsed = _parse_search_documents(data, include_snippets)
+        pagination = parsed["pagination"]
+        info = {
+            "status": "ok",
+            "count": parsed["count"],
+            "totalItems": pagination.get("totalItems"),
+            "hasMoreItems": bool(pagination.get("hasMoreItems")),
+            "seconds": round(time.perf_counter() - t0, 3),
+        }
+        return site_id, info, parsed["entries"], search_cache_status.get()
+
+    outcomes = await asyncio.gather(*[one(sid) for sid in dict.fromkeys(site_ids or [])])
+
+    merged: List[Dict[str, Any]] = []
+    sites: Dict[str, Dict[str, Any]] = {}
+    cache_states = set()
+    for site_id, info, entries, cache_state in outcomes:
+        sites[site_id] = info
+        if cache_state:
+            info["cache"] = cache_state
+            cache_states.add(cache_state)
+        for e in entries:
+            merged.append({**e, "siteId": site_id})
+    # Los scores vienen del mismo índice y la misma cláusula de relevancia, así que son comparables
+    merged.sort(key=lambda e: e.get("score") or 0.0, reverse=True)
+    page = merged[skip_count:window]
+
+    # Estado agregado para X-Cache: el de todos los sites si coincide, PARTIAL si no
+    search_cache_status.set(cache_states.pop() if len(cache_states) == 1 else ("PARTIAL" if cache_states else "BYPASS"))
+    ok = [i for i in sites.values() if i["status"] == "ok"]
+    return {
+        "count": len(page),
+        "entries": page,
+        "pagination": {
+            "count": len(page),
+            "skipCount": skip_count,
+            "maxItems": max_items,
+            "hasMoreItems": len(merged) > window or any(i["hasMoreItems"] for i in ok),
+            "totalItems": sum(i.get("totalItems") or 0 for i in ok),
+        },
+        "strategy": "fanout",
+        "partial": len(ok) < len(sites),
+        "sites": sites,
+    }
+
+async def iter_search_pages(cursor: SearchCursor, prefetch: bool = True) -> AsyncIterator[Dict[str, Any]]:
+    """Como list_docs.iter_search_pages: la página siguiente se pide mientras se consume la actual."""
+    pending: Optional[asyncio.Task] = asyncio.create_task(_post_search(cursor.body()))
+    try:
+        while pending is not None:
+            data = await pending
+            more = cursor.advance(data)
+            pending = asyncio.create_task(_post_search(cursor.body())) if more and prefetch else None
+            yield data
+            if more and not prefetch:
+                pending = asyncio.create_task(_post_search(cursor.body()))
+    finally:
+        # El consumidor dejó de iterar (p.ej. cliente desconectado): no dejamos la petición colgando
+        if pending is not None and not pending.done():
+            pending.cancel()
+
+async def iter_folder_children(
+    folder_id: str,
+    item_type: Literal["files", "folders", "all"] = "all",
+    page_size: int = DEFAULT_PAGE_SIZE,
+    exclude_system_and_generated: bool = True,
+    prefetch: bool = True,
+) -> AsyncIterator[Dict[str, Any]]:
+    cursor = SearchCursor(
+        lambda n, skip: _folder_children_body(folder_id, item_type, n, skip, exclude_system_and_generated),
+        page_size,
+    )
+    async for data in iter_search_pages(cursor, prefetch):
+        for entry in _parse_folder_children(data)["entries"]:
+            yield entry
+
+async def iter_search_documents(
+    query_text: str = "",
+    site_ids: Optional[List[str]] = None,
+    folder_id: Optional[str] = None,
+    page_size: int = DEFAULT_PAGE_SIZE,
+    mime_whitelist: Optional[List[str]] = None,
+    max_size_mb: Optional[float] = None,
+    include_snippets: bool = False,
+    exclude_system_and_generated: bool = True,
+    prefetch: bool = True,
+) -> AsyncIterator[Dict[str, Any]]:
+    cursor = SearchCursor(
+        lambda n, skip: _search_documents_body(
+            query_text, site_ids, folder_id, n, skip,
+            mime_whitelist, max_size_mb, include_snippets, exclude_system_and_generated,
+        ),
+        page_size,
+        keyset=not query_text.strip(),
+    )
+    async for data in iter_search_pages(cursor, prefetch):
+        for entry in _parse_search_documents(data, include_snippets)["entries"]:
+            yield entry
+
+async def get_node_metadata(node_id: str, include: str = NODE_METADATA_INCLUDE, fields: Optional[List[str]] = None) -> Dict[str, Any]:
+    url = f"{NODES_BASE}/{node_id}"
+    r = await get_async_client().get(url, endpoint="metadata", params=_node_metadata_params(include, fields))
+    r.raise_for_status()
+    data = await r.json(loads=fast_json.loads, content_type=None)
+    return data.get("entry", data)
+
+async def _stream_content(node_id: str, max_bytes: int, expected_size: Optional[int] = None,
+                          buf: Optional[ContentBuffer] = None, transfer: Optional[ContentTransfer] = None,
+                          on_chunk: Optional[Callable[[bytes], None]] = None,
+                          ) -> Tuple[ContentBuffer, Optional[str]]:
+    """
+    Igual que list_docs._stream_content: descarga hasta max_bytes (continuando desde
+    len(buf) si se pasa) a un ContentBuffer que el llamador cierra, y reanuda con Range
+    desde el último byte recibido si la conexión se corta a mitad del cuerpo.
+    """
+    url = f"{NODES_BASE}/{node_id}/content"
+    params = {"attachment": "false"}
+    client = get_async_client()
+    buf = ContentBuffer() if buf is None else buf
+    transfer = ContentTransfer() if transfer is None else transfer
+    mime: Optional[str] = None
+    resumes_left = CONTENT_RESUME_ATTEMPTS
+
+    while len(buf) < max_bytes:
+        start = len(buf)
+        transfer.requests += 1
+        try:
+            r = await client.get(url, endpoint="content", headers=_content_range_header(start, max_bytes - 1, expected_size),
+                                 params=params, stream=True)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            if not len(buf):
+                buf.close()
+                raise AlfrescoSearchError(f"Content request failed: {e}") from e
+            transfer.interrupted = True
+            break
+        try:
+            if r.status == 416:
+                break
+            if r.status >= 400:
+                if not len(buf):
+                    buf.close()
+                    raise AlfrescoSearchError(f"Content request failed: HTTP {r.status}")
+                transfer.interrupted = True
+                break
+            mime = mime or r.headers.get("Content-Type")
+            transfer.observe_response(r.headers.get("Content-Range"))
+            # Un servidor que ignora Range responde 200 con el cuerpo entero: se salta lo ya leído
+            skip = start if r.status == 200 else 0
+            try:
+                async for chunk in r.content.iter_chunked(64 * 1024):
+                    if not chunk:
+                        break
+                    transfer.bytes_transferred += len(chunk)
+                    if skip:
+                        dropped = min(skip, len(chunk))
+                        chunk, skip = chunk[dropped:], skip - dropped
+                    room = max_bytes - len(buf)
+                    buf.write(chunk[:room])
+                    if on_chunk is not None:
+                        on_chunk(chunk[:room])
+                    if len(chunk) >= room:
+                        break
+            except (aiohttp.ClientError, asyncio.TimeoutError, OSError):
+                # Los intentos se reponen mientras cada conexión avance; se agotan si se corta sin aportar bytes
+                resumes_left = CONTENT_RESUME_ATTEMPTS if len(buf) > start else resumes_left - 1
+                if resumes_left < 0 or CONTENT_RESUME_ATTEMPTS <= 0:
+                    transfer.interrupted = True
+                    break
+                transfer.resumes += 1
+                continue
+            break
+        finally:
+            r.release()
+    return buf, mime
+
+async def _download_and_extract(node_id: str, mime: str, size_bytes: int, max_chars: int) -> Tuple[Dict[str, Any], ContentTransfer]:
+    max_download_bytes = int(MAX_DOWNLOAD_MB * 1024 * 1024)
+    expected_size = size_bytes if size_bytes > 0 else None
+    budget = _initial_byte_budget(mime, max_chars, max_download_bytes)
+    transfer = ContentTransfer()
+    # Texto plano: se decodifica en el event loop a medida que llega (UTF-8 en C es barato;
+    # chardet solo corre una vez, sobre una muestra acotada, si el texto no es UTF-8)
+    decoder = IncrementalTextDecoder() if _mime_kind(mime) == "text" else None
+    on_chunk = decoder.feed if decoder is not None else None
+    with stage("download", DOWNLOAD_SECONDS):
+        raw, resp_mime = await _stream_content(node_id, budget, expected_size, transfer=transfer, on_chunk=on_chunk)
+
+    # Extracción CPU-bound fuera del event loop
+    with raw:
+        final = _reached_end(len(raw), budget, transfer.total_size or expected_size, transfer)
+        payload = await asyncio.to_thread(_extract_payload, raw, mime, resp_mime, size_bytes or transfer.total_size or 0, max_chars, decoder, final)
+        while not transfer.interrupted:
+            budget = _next_byte_budget(payload, max_chars, budget, max_download_bytes, transfer.total_size or expected_size)
+            if budget is None:
+                break
+            transfer.extensions += 1
+            with stage("download", DOWNLOAD_SECONDS):
+                await _stream_content(node_id, budget, expected_size, buf=raw, transfer=transfer, on_chunk=on_chunk)
+            final = _reached_end(len(raw), budget, transfer.total_size or expected_size, transfer)
+            payload = await asyncio.to_thread(_extract_payload, raw, mime, resp_mime, size_bytes or transfer.total_size or 0, max_chars, decoder, final)
+    if decoder is not None:
+        EXTRACTION_SECONDS.observe(decoder.seconds, mime=payload["mime"], mode="stream")
+    DOWNLOAD_BYTES.observe(payload["bytesRead"])
+    transfer.record()
+    if transfer.interrupted:
+        payload["note"] = (payload["note"] + " " + INTERRUPTED_NOTE).strip()
+    return payload, transfer
+
+async def get_document_with_content(node_id: str, max_chars: int = MAX_CHARS_DEFAULT, meta: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    if meta is None:
+        meta = await get_node_metadata(node_id)
+    combined = _content_result_base(meta, max_chars)
+    if not _needs_download(combined):
+        return combined
+
+    # SQLite y descompresión fuera del event loop
+    cache = get_text_cache()
+    version = content_version(meta)
+    if cache is not None:
+        payload, status = await asyncio.to_thread(cache.get, node_id, version, max_chars)
+        combined["contentCache"] = status
+        if payload is not None:
+            return _apply_payload(combined, payload, max_chars)
+
+    try:
+        payload, transfer = await _download_and_extract(node_id, combined["contentMimeDetected"], combined["contentTotalSizeInBytes"], max_chars)
+    except AlfrescoSearchError as e:
+        combined["contentNote"] = f"{DOWNLOAD_FAILED_NOTE}: {e}"
+        return combined
+    if cache is not None and not transfer.interrupted and not payload.get("failed"):
+        await asyncio.to_thread(cache.put, node_id, version, payload)
+    combined["contentBytesTransferred"] = transfer.bytes_transferred
+    combined["contentTransfer"] = transfer.as_dict()
+    return _apply_payload(combined, payload, max_chars)
+
+async def get_text_window(node_id: str, offset: int = 0, length: int = TEXT_WINDOW_DEFAULT_CHARS, page_from: Optional[int] = None,
+                          page_to: Optional[int] = None, meta: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    if meta is None:
+        meta = await get_node_metadata(node_id)
+    mime = (meta.get("content") or {}).get("mimeType") or ""
+    page_from, page_to = _validate_window(mime, offset, length, page_from, page_to)
+    result = _window_base(node_id, meta, offset, page_from, page_to)
+    content_info = meta.get("content") or {}
+    if not (mime or content_info.get("sizeInBytes")):
+        return result
+
+    # SQLite y descompresión de fragmentos fuera del event loop
+    cache = get_text_cache()
+    version = content_version(meta)
+    info = await asyncio.to_thread(cache.index_info, node_id, version) if cache is not None else None
+    if cache is not None:
+        result["index"] = "hit"
+    payload = None
+    interrupted = False
+    for _ in range(TEXT_WINDOW_ROUNDS):
+        bounds = _window_bounds(info, offset, length, page_from, page_to) if info is not None else None
+        if bounds is not None:
+            if payload is not None:
+                return _window_result(result, info, bounds, payload["text"][bounds[0]:bounds[1]], 0)
+            read = await asyncio.to_thread(cache.read_window, node_id, version, bounds[0], bounds[1] - bounds[0])
+            if read is not None:
+                return _window_result(result, info, bounds, read["text"], read["chunksRead"])
+        if interrupted or (info is not None and (info["complete"] or info["chars"] >= TEXT_INDEX_MAX_CHARS)):
+            break
+        needed = _window_chars_needed(info, offset, length, page_from, page_to)
+        if cache is not None:
+            result["index"] = "miss" if info is None else "extended"
+        payload, transfer = await _download_and_extract(node_id, result["mime"], int(content_info.get("sizeInBytes") or 0), needed)
+        result["bytesTransferred"] += transfer.bytes_transferred
+        result["mime"] = payload["mime"]
+        result["note"] = payload["note"]
+        if payload.get("failed"):
+            break
+        if cache is not None and not transfer.interrupted:
+            await asyncio.to_thread(cache.put, node_id, version, payload)
+        info = _payload_index_info(payload)
+        interrupted = transfer.interrupted
+    return _window_not_covered(result)
@@ -0,0 +1,253 @@
+"""
+Instrumentación: histogramas y contadores por etapa (HTTP hacia Alfresco, descarga,
+extracción, LLM) en formato de exposición de Prometheus, más el desglose por petición
+en la cabecera Server-Timing (visible en las devtools del navegador).
+
+Sin dependencias: el registro es mínimo y thread-safe; /metrics devuelve render().
+"""
+import os
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Any, Optional, Tuple, List, Callable, Iterator
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING_ENABLED", "true").lower() in ("1", "true", "yes")
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+BYTES_BUCKETS = (1024, 16 * 1024, 64 * 1024, 256 * 1024, 1024 ** 2, 4 * 1024 ** 2, 16 * 1024 ** 2, 64 * 1024 ** 2)
+CHARS_BUCKETS = (100, 1000, 5000, 20000, 50000, 100000, 200000, 500000)
+LAG_BUCKETS = (0.1, 0.5, 1.0, 5.0, 15.0, 60.0, 300.0, 900.0, 3600.0, 14400.0)
+TOKENS_BUCKETS = (256, 512, 1024, 2048, 4096, 8192, 16384, 32768, 65536, 131072)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return self.header() + [f"{self.name}{_labels(self.labelnames, k)} {_fmt(v)}" for k, v in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = SECONDS_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # por serie: [conteos por bucket..., +Inf], suma
+        self._series: Dict[Tuple[str, ...], List[Any]] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][idx] += 1
+            series[1] += value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = [(k, list(s[0]), s[1]) for k, s in self._series.items()]
+        lines = self.header()
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                le = 'le="%g"' % bound
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            cumulative += counts[-1]
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_fmt(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class GaugeCallback(_Metric):
+    """Gauge cuyo valor se lee al exponer (p.ej. contadores de las cachés existentes)."""
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, fn: Callable[[], Dict[Tuple[str, ...], float]], labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, help_text, labelnames)
+        self.fn = fn
+
+    def render(self) -> List[str]:
+        try:
+            values = self.fn()
+        except Exception:
+            return []
+        return self.header() + [f"{self.name}{_labels(self.labelnames, k)} {_fmt(v)}" for k, v in values.items()]
+
+
+REGISTRY: List[_Metric] = []
+
+
+def render() -> str:
+    lines: List[str] = []
+    for metric in REGISTRY:
+        lines += metric.render()
+    return "\n".join(lines) + "\n"
+
+
+# --- Métricas por etapa --------------------------------------------------------------
+
+UPSTREAM_SECONDS = Histogram(
+    "alfresco_upstream_request_seconds", "Duración de las llamadas HTTP a Alfresco (incluye reintentos)", ("endpoint", "client"),
+)
+UPSTREAM_ERRORS = Counter("alfresco_upstream_errors_total", "Llamadas a Alfresco fallidas o con estado >= 400", ("endpoint", "client"))
+UPSTREAM_RETRIES = Counter("alfresco_upstream_retries_total", "Reintentos de llamadas idempotentes a Alfresco", ("endpoint", "client"))
+DOWNLOAD_BYTES = Histogram("alfresco_download_bytes", "Bytes descargados por documento", (), BYTES_BUCKETS)
+DOWNLOAD_TRANSFERRED_BYTES = Counter("alfresco_download_transferred_bytes_total", "Bytes recibidos de Alfresco en descargas de contenido (incluye ampliaciones y reanudaciones)")
+DOWNLOAD_RANGE_REQUESTS = Counter("alfresco_download_range_requests_total", "Peticiones de contenido adicionales con Range, por motivo (extend|resume)", ("reason",))
+DOWNLOAD_INTERRUPTED = Counter("alfresco_download_interrupted_total", "Descargas que quedaron incompletas tras agotar las reanudaciones")
+DOWNLOAD_SECONDS = Histogram("alfresco_download_seconds", "Duración de la descarga del binario (cabeceras + cuerpo)", ())
+EXTRACTION_SECONDS = Histogram("extraction_seconds", "Duración de la extracción de texto por tipo MIME", ("mime", "mode"))
+EXTRACTION_CHARS = Histogram("extraction_chars", "Caracteres producidos por extracción", ("mime",), CHARS_BUCKETS)
+HTTP_SECONDS = Histogram("http_request_seconds", "Duración de las peticiones a la API", ("method", "route", "status"))
+LLM_SECONDS = Histogram("llm_request_seconds", "Latencia de las llamadas al LLM", ("operation", "model"))
+LLM_TTFT = Histogram("llm_time_to_first_token_seconds", "Tiempo hasta el primer token del LLM", ("operation", "model"))
+LLM_PROMPT_TOKENS = Histogram(
+    "llm_prompt_tokens", "Tokens del prompt sin empaquetar (raw) y tras el empaquetado por presupuesto (packed)",
+    ("operation", "packing"), TOKENS_BUCKETS,
+)
+LLM_TOKENS = Counter("llm_tokens_total", "Tokens consumidos por el LLM", ("operation", "kind"))
+CONTEXT_DOCS = Counter("chat_context_documents_total", "Documentos fijados usados como contexto, por origen", ("source",))
+CONTEXT_BYTES_SAVED = Histogram("chat_context_bytes_saved", "Bytes de contexto reutilizados por turno sin volver a descargarlos", (), BYTES_BUCKETS)
+CONTEXT_REQUESTS_SAVED = Counter("chat_context_requests_saved_total", "Descargas de documentos evitadas al reutilizar el contexto del hilo")
+INGEST_EVENTS = Counter("ingest_events_total", "Eventos procesados por el worker de ingesta, por resultado", ("outcome",))
+INGEST_LAG_SECONDS = Histogram(
+    "ingest_lag_seconds", "Desde que el evento entra en la cola hasta que el texto queda en la caché", (), LAG_BUCKETS,
+)
+INGEST_SECONDS = Histogram("ingest_processing_seconds", "Duración del procesamiento de un evento de ingesta (metadatos + descarga + extracción)")
+
+
+# --- Server-Timing ---------------------------------------------------------------------
+
+# Acumulador por petición: etapa -> [ms totales, llamadas]. Se muta en sitio, así que los
+# hilos de asyncio.to_thread (que copian el contexto) suman sobre el mismo dict.
+_request_stages: ContextVar[Optional[Dict[str, List[float]]]] = ContextVar("request_stages", default=None)
+_stages_lock = threading.Lock()
+
+
+def record_stage(stage: str, seconds: float) -> None:
+    stages = _request_stages.get()
+    if stages is None:
+        return
+    with _stages_lock:
+        entry = stages.setdefault(stage, [0.0, 0])
+        entry[0] += seconds * 1000.0
+        entry[1] += 1
+
+
+@contextmanager
+def stage(name: str, histogram: Optional[Histogram] = None, **labels: Any) -> Iterator[None]:
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - t0
+        record_stage(name, elapsed)
+        if histogram is not None:
+            histogram.observe(elapsed, **labels)
+
+
+def server_timing_header(stages: Dict[str, List[float]], total_ms: float) -> str:
+    parts = []
+    for name, (ms, calls) in stages.items():
+        part = f"{name};dur={ms:.1f}"
+        if calls > 1:
+            part += f';desc="{int(calls)} llamadas"'
+        parts.append(part)
+    parts.append(f"total;dur={total_ms:.1f}")
+    return ", ".join(parts)
+
+
+class ServerTimingMiddleware:
+    """
+    Middleware ASGI: mide cada petición (http_request_seconds por ruta) y añade la
+    cabecera Server-Timing con el desglose por etapa acumulado durante la petición.
+    En respuestas en streaming el desglose cubre hasta el envío de las cabeceras.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        stages: Dict[str, List[float]] = {}
+        token = _request_stages.set(stages)
+        t0 = time.perf_counter()
+        status_holder = {"status": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_holder["status"] = message["status"]
+                if SERVER_TIMING_ENABLED:
+                    header = server_timing_header(stages, (time.perf_counter() - t0) * 1000.0)
+                    message.setdefault("headers", [])
+                    message["headers"] = list(message["headers"]) + [(b"server-timing", header.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request_stages.reset(token)
+            route = scope.get("route")
+            HTTP_SECONDS.observe(
+                time.perf_counter() - t0,
+                method=scope.get("method", ""),
+                route=getattr(route, "path", "sin-ruta"),
+                status=status_holder["status"],
+            )
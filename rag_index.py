@@ -0,0 +1,401 @@
+"""
+Índice local (BM25 + embeddings por hashing con NumPy) del contenido de Alfresco para
+recuperar fragmentos relevantes en el chat, en lugar de meter documentos completos al prompt.
+
+Uso:
+  python rag_index.py build [--sites site1 site2] [--max-docs N]
+  python rag_index.py query "texto a buscar" [--k 8]
+"""
+import os
+import re
+import json
+import math
+import zlib
+import argparse
+import threading
+import unicodedata
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Any, Iterator, Iterable, Tuple
+
+try:
+    import numpy as np
+except Exception:
+    np = None
+
+RAG_INDEX_DIR = os.getenv("RAG_INDEX_DIR", os.path.join(".cache", "rag_index"))
+RAG_EMBED_DIM = int(os.getenv("RAG_EMBED_DIM", "256"))
+RAG_CHUNK_CHARS = int(os.getenv("RAG_CHUNK_CHARS", "800"))
+RAG_CHUNK_OVERLAP = int(os.getenv("RAG_CHUNK_OVERLAP", "120"))
+# Caracteres máximos a indexar por documento
+RAG_MAX_CHARS_PER_DOC = int(os.getenv("RAG_MAX_CHARS_PER_DOC", "200000"))
+# Peso de BM25 frente a la similitud de embeddings en el ranking híbrido
+RAG_BM25_WEIGHT = float(os.getenv("RAG_BM25_WEIGHT", "0.6"))
+
+# Las filas borradas quedan como lápidas; se compacta cuando superan a las vivas (y a este mínimo)
+RAG_COMPACT_MIN_ROWS = int(os.getenv("RAG_COMPACT_MIN_ROWS", "1024"))
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+_STOPWORDS = frozenset(
+    "a al algo como con de del el ella ellos en era es esa ese eso esta este esto fue ha han hay la las le "
+    "lo los mas me mi muy no o para pero por que se sin sobre su sus también te tu un una uno y ya "
+    "the and of to in is for on that with as are be this it by or".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    # Minúsculas y sin acentos: "Capítulo" y "capitulo" cuentan como el mismo término
+    norm = unicodedata.normalize("NFKD", text.lower())
+    norm = "".join(ch for ch in norm if not unicodedata.combining(ch))
+    return [t for t in _TOKEN_RE.findall(norm) if len(t) > 1 and t not in _STOPWORDS]
+
+
+def chunk_text(text: str, size: int = RAG_CHUNK_CHARS, overlap: int = RAG_CHUNK_OVERLAP) -> List[Tuple[int, int]]:
+    """
+    Divide el texto en ventanas de ~size caracteres con solape, cortando preferentemente en
+    fin de párrafo o de oración. Devuelve pares (inicio, fin) sobre el texto original.
+    """
+    spans: List[Tuple[int, int]] = []
+    n = len(text)
+    start = 0
+    while start < n:
+        end = min(n, start + size)
+        if end < n:
+            window = text[start:end]
+            cut = max(window.rfind("\n\n"), window.rfind(". "), window.rfind("\n"))
+            if cut > size // 2:
+                end = start + cut + 1
+        if text[start:end].strip():
+            spans.append((start, end))
+        if end >= n:
+            break
+        start = max(end - overlap, start + 1)
+    return spans
+
+
+def hash_embed(tokens: List[str], dim: int = RAG_EMBED_DIM) -> "np.ndarray":
+    """
+    Embedding por feature hashing (unigramas + bigramas) con signo, normalizado L2.
+    No requiere modelo: es determinista y funciona offline.
+    """
+    vec = np.zeros(dim, dtype=np.float32)
+    if not tokens:
+        return vec
+    feats = tokens + [f"{a}_{b}" for a, b in zip(tokens, tokens[1:])]
+    for feat, count in Counter(feats).items():
+        h = zlib.crc32(feat.encode("utf-8"))
+        vec[h % dim] += (1.0 + math.log(count)) * (1.0 if (h >> 31) & 1 else -1.0)
+    norm = float(np.linalg.norm(vec))
+    if norm > 0:
+        vec /= norm
+    return vec
+
+
+class RagIndex:
+    """
+    Índice de fragmentos: BM25 sobre listas invertidas (término -> {fila: tf}) + similitud
+    coseno sobre embeddings por hashing. Borrar un documento deja sus filas como lápidas
+    (sin reconstruir el índice) y se compacta de vez en cuando. Se persiste en un directorio
+    (chunks.jsonl + vectors.npy + meta.json); las estadísticas BM25 se recalculan al cargar.
+    """
+
+    def __init__(self, path: str = RAG_INDEX_DIR, dim: int = RAG_EMBED_DIM):
+        if np is None:
+            raise RuntimeError("numpy no instalado: requerido para el índice local")
+        self.path = path
+        self.dim = dim
+        # Filas del índice; None marca un fragmento borrado (lápida)
+        self.chunks: List[Optional[Dict[str, Any]]] = []
+        self._vectors: List["np.ndarray"] = []
+        self._matrix: Optional["np.ndarray"] = None
+        self._tf: List[Optional[Counter]] = []
+        self._lengths: List[int] = []
+        self._postings: Dict[str, Dict[int, int]] = {}
+        self._total_len = 0
+        self._dead = 0
+        self._by_node: Dict[str, List[int]] = defaultdict(list)
+        # Vistas NumPy de _lengths y de las filas vivas; se recalculan tras cada cambio
+        self._length_array: Optional["np.ndarray"] = None
+        self._live_rows: Optional["np.ndarray"] = None
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self.chunks) - self._dead
+
+    def __contains__(self, node_id: str) -> bool:
+        return node_id in self._by_node
+
+    # --- Construcción ------------------------------------------------------------
+
+    def _append_chunk(self, chunk: Dict[str, Any], vector: Optional["np.ndarray"] = None) -> None:
+        tokens = tokenize(chunk["text"])
+        tf = Counter(tokens)
+        idx = len(self.chunks)
+        self.chunks.append(chunk)
+        self._tf.append(tf)
+        self._lengths.append(len(tokens))
+        for term, count in tf.items():
+            self._postings.setdefault(term, {})[idx] = count
+        self._total_len += len(tokens)
+        self._vectors.append(vector if vector is not None else hash_embed(tokens, self.dim))
+        self._by_node[chunk["nodeId"]].append(idx)
+        self._matrix = None
+        self._length_array = None
+        self._live_rows = None
+
+    def _drop_row(self, idx: int) -> None:
+        # Quita la fila de las listas invertidas; su vector queda en la matriz hasta compactar
+        for term in self._tf[idx]:
+            postings = self._postings[term]
+            del postings[idx]
+            if not postings:
+                del self._postings[term]
+        self._total_len -= self._lengths[idx]
+        self.chunks[idx] = None
+        self._tf[idx] = None
+        self._dead += 1
+
+    def _compact(self) -> None:
+        keep = [(c, v) for c, v in zip(self.chunks, self._vectors) if c is not None]
+        self.chunks, self._vectors, self._tf, self._lengths = [], [], [], []
+        self._postings, self._total_len, self._dead, self._by_node = {}, 0, 0, defaultdict(list)
+        self._matrix = None
+        for c, v in keep:
+            self._append_chunk(c, v)
+
+    def add_document(self, node_id: str, text: str, meta: Optional[Dict[str, Any]] = None) -> int:
+        """Indexa (o reindexa) un documento. Devuelve el número de fragmentos."""
+        meta = meta or {}
+        with self._lock:
+            if node_id in self._by_node:
+                self.remove_documents([node_id])
+            text = text[:RAG_MAX_CHARS_PER_DOC]
+            spans = chunk_text(text)
+            for seq, (start, end) in enumerate(spans):
+                self._append_chunk({
+                    "nodeId": node_id,
+                    "name": meta.get("name"),
+                    "title": meta.get("title"),
+                    "modifiedAt": meta.get("modifiedAt"),
+                    "seq": seq,
+                    "charStart": start,
+                    "charEnd": end,
+                    "text": text[start:end],
+                })
+            return len(spans)
+
+    def remove_documents(self, node_ids: Iterable[str]) -> int:
+        """Elimina documentos del índice: sus filas quedan como lápidas hasta la próxima compactación."""
+        removed = 0
+        with self._lock:
+            for node_id in set(node_ids):
+                for idx in self._by_node.pop(node_id, []):
+                    self._drop_row(idx)
+                    removed += 1
+            if removed:
+                self._live_rows = None
+                if self._dead > max(RAG_COMPACT_MIN_ROWS, len(self)):
+                    self._compact()
+            return removed
+
+    def node_ids(self) -> List[str]:
+        return list(self._by_node)
+
+    # --- Búsqueda ----------------------------------------------------------------
+
+    def _bm25_scores(self, q_tokens: List[str], candidates: "np.ndarray") -> "np.ndarray":
+        # Solo se recorren las listas invertidas de los términos de la consulta
+        n = len(self)
+        avg_len = (self._total_len / n) if n else 0.0
+        if self._length_array is None:
+            self._length_array = np.asarray(self._lengths, dtype=np.float32)
+        scores = np.zeros(len(self.chunks), dtype=np.float32)
+        for term in set(q_tokens):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            df = len(postings)
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+            rows = np.fromiter(postings.keys(), dtype=np.int64, count=df)
+            tf = np.fromiter(postings.values(), dtype=np.float32, count=df)
+            dl = self._length_array[rows]
+            scores[rows] += idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * dl / (avg_len or 1)))
+        return scores[candidates]
+
+    def search(self, query: str, k: int = 8, node_ids: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """
+        Top-k fragmentos por ranking híbrido (BM25 normalizado + coseno), opcionalmente
+        restringidos a ciertos documentos.
+        """
+        q_tokens = tokenize(query)
+        with self._lock:
+            if not len(self):
+                return []
+            if node_ids:
+                candidates = np.asarray([i for nid in node_ids for i in self._by_node.get(nid, [])], dtype=np.int64)
+            else:
+                if self._live_rows is None:
+                    self._live_rows = np.asarray([i for i, c in enumerate(self.chunks) if c is not None], dtype=np.int64)
+                candidates = self._live_rows
+            if not len(candidates):
+                return []
+            if self._matrix is None:
+                self._matrix = np.vstack(self._vectors)
+
+            bm25 = self._bm25_scores(q_tokens, candidates)
+            cos = self._matrix[candidates] @ hash_embed(q_tokens, self.dim)
+            if bm25.max() > 0:
+                bm25 = bm25 / bm25.max()
+            cos = np.clip(cos, 0, None)
+            score = RAG_BM25_WEIGHT * bm25 + (1 - RAG_BM25_WEIGHT) * cos
+
+            top = np.argsort(-score)[:k]
+            return [
+                {**self.chunks[candidates[j]], "score": round(float(score[j]), 4)}
+                for j in top if score[j] > 0 or not q_tokens
+            ]
+
+    # --- Persistencia ------------------------------------------------------------
+
+    def save(self) -> None:
+        with self._lock:
+            if self._dead:
+                self._compact()
+            os.makedirs(self.path, exist_ok=True)
+            tmp = os.path.join(self.path, "chunks.jsonl.tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                for c in self.chunks:
+                    f.write(json.dumps(c, ensure_ascii=False) + "\n")
+            os.replace(tmp, os.path.join(self.path, "chunks.jsonl"))
+            matrix = np.vstack(self._vectors) if self._vectors else np.zeros((0, self.dim), dtype=np.float32)
+            np.save(os.path.join(self.path, "vectors.npy"), matrix)
+            with open(os.path.join(self.path, "meta.json"), "w", encoding="utf-8") as f:
+                json.dump({"dim": self.dim, "chunks": len(self), "documents": len(self._by_node)}, f)
+
+    @classmethod
+    def load(cls, path: str = RAG_INDEX_DIR) -> "RagIndex":
+        meta_path = os.path.join(path, "meta.json")
+        if not os.path.exists(meta_path):
+            return cls(path)
+        with open(meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+        index = cls(path, dim=int(meta.get("dim", RAG_EMBED_DIM)))
+        matrix = np.load(os.path.join(path, "vectors.npy"))
+        with open(os.path.join(path, "chunks.jsonl"), encoding="utf-8") as f:
+            for i, line in enumerate(f):
+                index._append_chunk(json.loads(line), matrix[i])
+        return index
+
+    def stats(self) -> Dict[str, Any]:
+        return {"path": self.path, "dim": self.dim, "chunks": len(self), "documents": len(self._by_node),
+                "terms": len(self._postings), "tombstones": self._dead}
+
+
+# --- Ingesta desde Alfresco ---------------------------------------------------------
+
+def _walk_folder(folder_id: str, page_size: int = 100) -> Iterator[Dict[str, Any]]:
+    from list_docs import iter_folder_children
+
+    pending = [folder_id]
+    while pending:
+        for e in iter_folder_children(pending.pop(), item_type="all", page_size=page_size):
+            if e["isFolder"]:
+                pending.append(e["id"])
+            else:
+                yield e
+
+
+def iter_site_documents(site_ids: Optional[List[str]] = None, page_size: int = 100) -> Iterator[Dict[str, Any]]:
+    """Recorre los sites (todos o los indicados) y su documentLibrary, carpeta por carpeta."""
+    from list_docs import list_sites, get_document_library_folder
+
+    if not site_ids:
+        site_ids = []
+        skip = 0
+        while True:
+            page = list_sites(max_items=page_size, skip_count=skip)
+            site_ids += [s["id"] for s in page["entries"] if s.get("id")]
+            if not page.get("pagination", {}).get("hasMoreItems"):
+                break
+            skip += page_size
+    for site_id in site_ids:
+        dl = get_document_library_folder(site_id)
+        if dl:
+            yield from _walk_folder(dl["id"], page_size)
+
+
+def ingest(site_ids: Optional[List[str]] = None, max_docs: Optional[int] = None,
+           index: Optional[RagIndex] = None, verbose: bool = True) -> RagIndex:
+    """Extrae el texto de los documentos con los extractores existentes y lo indexa."""
+    from list_docs import get_document_with_content, content_fetch_failed, DEFAULT_MIME_WHITELIST
+
+    index = index or RagIndex()
+    done = 0
+    for entry in iter_site_documents(site_ids):
+        if entry.get("mimeType") not in DEFAULT_MIME_WHITELIST:
+            continue
+        try:
+            doc = get_document_with_content(entry["id"], max_chars=RAG_MAX_CHARS_PER_DOC)
+        except Exception as e:
+            if verbose:
+                print(f"Omitido {entry.get('name')}: {e}")
+            continue
+        # Descarga o extracción fallida: no se indexa (ni reemplaza una versión buena ya indexada)
+        if content_fetch_failed(doc):
+            if verbose:
+                print(f"Omitido {entry.get('name')}: {doc.get('contentNote')}")
+            continue
+        props = doc.get("properties") or {}
+        n = index.add_document(entry["id"], doc.get("contentText") or "", {
+            "name": doc.get("name"),
+            "title": props.get("cm:title"),
+            "modifiedAt": doc.get("modifiedAt"),
+        })
+        done += 1
+        if verbose:
+            print(f"Indexado: {doc.get('name')} ({n} fragmentos)")
+        if max_docs and done >= max_docs:
+            break
+    index.save()
+    return index
+
+
+_index: Optional[RagIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_rag_index(reload: bool = False) -> RagIndex:
+    """Índice del proceso, cargado desde RAG_INDEX_DIR la primera vez (o al recargar)."""
+    global _index
+    with _index_lock:
+        if _index is None or reload:
+            _index = RagIndex.load(RAG_INDEX_DIR)
+        return _index
+
+
+def main():
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Índice local BM25 + embeddings del contenido de Alfresco")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build", help="Recorre los sites y construye el índice")
+    b.add_argument("--sites", nargs="*", default=None, help="Site IDs (por defecto, todos)")
+    b.add_argument("--max-docs", type=int, default=None)
+    q = sub.add_parser("query", help="Consulta el índice")
+    q.add_argument("text")
+    q.add_argument("--k", type=int, default=8)
+    args = parser.parse_args()
+
+    if args.cmd == "build":
+        index = ingest(site_ids=args.sites, max_docs=args.max_docs)
+        print(json.dumps(index.stats(), ensure_ascii=False))
+    else:
+        for hit in get_rag_index().search(args.text, k=args.k):
+            print(f"{hit['score']:.3f}  {hit['name']} #{hit['seq']}: {hit['text'][:120]!r}")
+
+
+if __name__ == "__main__":
+    main()
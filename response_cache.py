@@ -0,0 +1,108 @@
+import os
+import json
+import time
+import asyncio
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Dict, Any, Optional, Tuple, Callable, Awaitable
+
+SEARCH_CACHE_ENABLED = os.getenv("SEARCH_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+SEARCH_CACHE_TTL_S = float(os.getenv("SEARCH_CACHE_TTL_S", "30"))
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "512"))
+
+# Estado de caché de la última búsqueda hecha en la tarea actual (para la cabecera X-Cache)
+search_cache_status: ContextVar[Optional[str]] = ContextVar("search_cache_status", default=None)
+
+
+def normalize_key(body: Dict[str, Any]) -> str:
+    # Mismo cuerpo AFTS => misma clave, sin importar el orden de las claves
+    return json.dumps(body, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+
+
+def _retrieve_exception(task: "asyncio.Task[Any]") -> None:
+    # Marca el error como recuperado aunque todos los que esperaban se hayan cancelado
+    if not task.cancelled():
+        task.exception()
+
+
+class SearchResponseCache:
+    """
+    Caché de respuestas de la Search API con TTL y LRU acotado por número de entradas,
+    más coalescencia single-flight: N peticiones concurrentes con la misma clave
+    producen una sola llamada a Alfresco y comparten el resultado (o el error).
+    Pensada para usarse desde un único event loop.
+    """
+
+    def __init__(self, ttl_s: float = SEARCH_CACHE_TTL_S, max_entries: int = SEARCH_CACHE_MAX_ENTRIES):
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._inflight: Dict[str, "asyncio.Task[Any]"] = {}
+        self._counters: Dict[str, int] = {"hits": 0, "misses": 0, "coalesced": 0, "expired": 0, "evictions": 0, "errors": 0}
+
+    async def get_or_fetch(self, key: str, fetch: Callable[[], Awaitable[Any]]) -> Tuple[Any, str]:
+        """Devuelve (valor, estado) con estado en HIT | MISS | COALESCED."""
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is not None:
+            if now - entry[0] < self.ttl_s:
+                self._entries.move_to_end(key)
+                self._counters["hits"] += 1
+                return entry[1], "HIT"
+            del self._entries[key]
+            self._counters["expired"] += 1
+
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self._counters["coalesced"] += 1
+            return await asyncio.shield(pending), "COALESCED"
+
+        # La consulta corre en su propia tarea: si el llamador que la inició se cancela
+        # (p.ej. wait_for por timeout), solo deja de esperar y los demás reciben el resultado
+        task = asyncio.ensure_future(self._fetch_and_store(key, fetch))
+        task.add_done_callback(_retrieve_exception)
+        self._inflight[key] = task
+        self._counters["misses"] += 1
+        return await asyncio.shield(task), "MISS"
+
+    async def _fetch_and_store(self, key: str, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        try:
+            value = await fetch()
+        except Exception:
+            self._counters["errors"] += 1
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+        self._entries[key] = (time.monotonic(), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._counters["evictions"] += 1
+        return value
+
+    def clear(self) -> int:
+        n = len(self._entries)
+        self._entries.clear()
+        return n
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._counters,
+            "entries": len(self._entries),
+            "inflight": len(self._inflight),
+            "maxEntries": self.max_entries,
+            "ttlSeconds": self.ttl_s,
+        }
+
+
+_search_cache: Optional[SearchResponseCache] = None
+
+
+def get_search_cache() -> Optional[SearchResponseCache]:
+    global _search_cache
+    if not SEARCH_CACHE_ENABLED:
+        return None
+    if _search_cache is None:
+        _search_cache = SearchResponseCache()
+    return _search_cache
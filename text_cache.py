@@ -0,0 +1,349 @@
+import os
+import sys
+import json
+import time
+import zlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+
+TEXT_CACHE_ENABLED = os.getenv("TEXT_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+TEXT_CACHE_MEMORY_MB = float(os.getenv("TEXT_CACHE_MEMORY_MB", "64"))
+TEXT_CACHE_DB = os.getenv("TEXT_CACHE_DB", os.path.join(".cache", "extracted_text.sqlite3"))
+TEXT_CACHE_DISK_MAX_MB = float(os.getenv("TEXT_CACHE_DISK_MAX_MB", "1024"))
+# Máximo de caracteres que se guardan por documento (coincide con el máximo de maxChars de la API)
+TEXT_CACHE_MAX_CHARS = int(os.getenv("TEXT_CACHE_MAX_CHARS", "500000"))
+# Índice por fragmentos para leer ventanas (offset/longitud o páginas) sin cargar el texto
+# entero: tamaño de cada fragmento y máximo de caracteres indexados por documento
+TEXT_CHUNK_CHARS = int(os.getenv("TEXT_CHUNK_CHARS", "16384"))
+TEXT_INDEX_MAX_CHARS = int(os.getenv("TEXT_INDEX_MAX_CHARS", "5000000"))
+
+
+def content_version(meta: Dict[str, Any]) -> str:
+    """
+    Versión del contenido a partir de los metadatos del nodo (una llamada barata):
+    modifiedAt + versionLabel + tamaño. Si cambia cualquiera, el texto en caché ya no vale.
+    """
+    props = meta.get("properties") or {}
+    content = meta.get("content") or {}
+    return "|".join([
+        str(meta.get("modifiedAt") or ""),
+        str(props.get("cm:versionLabel") or ""),
+        str(content.get("sizeInBytes") or 0),
+    ])
+
+
+class ExtractedTextCache:
+    """
+    Caché de texto extraído en dos niveles: LRU en memoria con presupuesto en bytes
+    y almacén SQLite en disco. Una entrada por nodeId; la versión guardada se compara
+    con content_version() para decidir si sigue vigente.
+
+    El payload es el resultado de la extracción antes de truncar a max_chars:
+    {"text", "note", "mime", "bytesRead", "downloadTruncated", "textComplete", "charsBudget", "extent"}.
+    Si la extracción se detuvo antes del final (textComplete=False), charsBudget indica
+    cuántos caracteres cubre y solo sirve para peticiones de hasta ese tamaño.
+
+    Además del texto entero (hasta max_chars), en disco se guarda el texto partido en
+    fragmentos de TEXT_CHUNK_CHARS con su rango de caracteres (hasta TEXT_INDEX_MAX_CHARS):
+    read_window() descomprime solo los fragmentos que tocan la ventana pedida.
+    """
+
+    def __init__(
+        self,
+        db_path: Optional[str] = TEXT_CACHE_DB,
+        memory_budget_bytes: int = int(TEXT_CACHE_MEMORY_MB * 1024 * 1024),
+        disk_budget_bytes: int = int(TEXT_CACHE_DISK_MAX_MB * 1024 * 1024),
+        max_chars: int = TEXT_CACHE_MAX_CHARS,
+        index_max_chars: int = TEXT_INDEX_MAX_CHARS,
+        chunk_chars: int = TEXT_CHUNK_CHARS,
+    ):
+        self.memory_budget_bytes = memory_budget_bytes
+        self.disk_budget_bytes = disk_budget_bytes
+        self.max_chars = max_chars
+        self.index_max_chars = index_max_chars
+        self.chunk_chars = max(1, chunk_chars)
+        self._lock = threading.Lock()
+        self._mem: "OrderedDict[str, Tuple[str, Dict[str, Any], int]]" = OrderedDict()
+        self._mem_bytes = 0
+        self._counters: Dict[str, int] = {
+            "memoryHits": 0, "diskHits": 0, "misses": 0, "stale": 0,
+            "puts": 0, "memoryEvictions": 0, "diskEvictions": 0, "invalidations": 0,
+            "windowReads": 0, "windowMisses": 0, "chunksRead": 0,
+        }
+        self._db: Optional[sqlite3.Connection] = None
+        if db_path:
+            parent = os.path.dirname(db_path)
+            if parent:
+                os.makedirs(parent, exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                """CREATE TABLE IF NOT EXISTS extracted_text (
+                    node_id TEXT PRIMARY KEY,
+                    version TEXT NOT NULL,
+                    mime TEXT,
+                    note TEXT,
+                    bytes_read INTEGER,
+                    download_truncated INTEGER,
+                    text_complete INTEGER,
+                    text_z BLOB,
+                    stored_bytes INTEGER,
+                    created_at REAL,
+                    accessed_at REAL,
+                    chars_budget INTEGER,
+                    extent TEXT
+                )"""
+            )
+            self._db.execute(
+                """CREATE TABLE IF NOT EXISTS text_chunks (
+                    node_id TEXT NOT NULL,
+                    seq INTEGER NOT NULL,
+                    char_start INTEGER NOT NULL,
+                    char_end INTEGER NOT NULL,
+                    text_z BLOB NOT NULL,
+                    PRIMARY KEY (node_id, seq)
+                )"""
+            )
+            columns = {row[1] for row in self._db.execute("PRAGMA table_info(extracted_text)")}
+            for col, ddl in (("chars_budget", "INTEGER"), ("extent", "TEXT"), ("indexed_chars", "INTEGER"), ("indexed_complete", "INTEGER")):
+                if col not in columns:
+                    self._db.execute(f"ALTER TABLE extracted_text ADD COLUMN {col} {ddl}")
+            self._db.execute("CREATE INDEX IF NOT EXISTS ix_extracted_text_accessed ON extracted_text(accessed_at)")
+
+    # --- Memoria -----------------------------------------------------------------
+
+    def _mem_put(self, node_id: str, version: str, payload: Dict[str, Any]) -> None:
+        size = sys.getsizeof(payload["text"]) + sys.getsizeof(payload.get("note") or "")
+        if size > self.memory_budget_bytes:
+            return
+        old = self._mem.pop(node_id, None)
+        if old:
+            self._mem_bytes -= old[2]
+        self._mem[node_id] = (version, payload, size)
+        self._mem_bytes += size
+        while self._mem_bytes > self.memory_budget_bytes and self._mem:
+            _, (_, _, evicted_size) = self._mem.popitem(last=False)
+            self._mem_bytes -= evicted_size
+            self._counters["memoryEvictions"] += 1
+
+    def _mem_drop(self, node_id: str) -> None:
+        old = self._mem.pop(node_id, None)
+        if old:
+            self._mem_bytes -= old[2]
+
+    # --- API ---------------------------------------------------------------------
+
+    def _usable(self, payload: Dict[str, Any], max_chars: int) -> bool:
+        # Un texto parcial solo sirve si su extracción cubrió los caracteres pedidos
+        return bool(payload.get("textComplete")) or (payload.get("charsBudget") or 0) >= max_chars
+
+    def get(self, node_id: str, version: str, max_chars: int) -> Tuple[Optional[Dict[str, Any]], str]:
+        """Devuelve (payload, estado) con estado en hit-memory | hit-disk | stale | miss."""
+        with self._lock:
+            hit = self._mem.get(node_id)
+            if hit is not None:
+                if hit[0] == version and self._usable(hit[1], max_chars):
+                    self._mem.move_to_end(node_id)
+                    self._counters["memoryHits"] += 1
+                    return hit[1], "hit-memory"
+                if hit[0] != version:
+                    self._mem_drop(node_id)
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT version, mime, note, bytes_read, download_truncated, text_complete, text_z, chars_budget, extent "
+                    "FROM extracted_text WHERE node_id = ?",
+                    (node_id,),
+                ).fetchone()
+                if row is not None:
+                    if row[0] != version:
+                        self._db_delete(node_id)
+                        self._counters["stale"] += 1
+                        return None, "stale"
+                    payload = {
+                        "text": zlib.decompress(row[6]).decode("utf-8"),
+                        "mime": row[1] or "",
+                        "note": row[2] or "",
+                        "bytesRead": row[3] or 0,
+                        "downloadTruncated": bool(row[4]),
+                        "textComplete": bool(row[5]),
+                        "charsBudget": row[7],
+                        "extent": json.loads(row[8]) if row[8] else None,
+                    }
+                    if self._usable(payload, max_chars):
+                        self._db.execute("UPDATE extracted_text SET accessed_at = ? WHERE node_id = ?", (time.time(), node_id))
+                        self._mem_put(node_id, version, payload)
+                        self._counters["diskHits"] += 1
+                        return payload, "hit-disk"
+
+            self._counters["misses"] += 1
+            return None, "miss"
+
+    def has(self, node_id: str, version: str) -> bool:
+        """Si hay texto guardado para esta versión del nodo (sin tocar contadores ni LRU)."""
+        with self._lock:
+            hit = self._mem.get(node_id)
+            if hit is not None and hit[0] == version:
+                return True
+            if self._db is None:
+                return False
+            row = self._db.execute("SELECT version FROM extracted_text WHERE node_id = ?", (node_id,)).fetchone()
+            return row is not None and row[0] == version
+
+    def put(self, node_id: str, version: str, payload: Dict[str, Any]) -> None:
+        text = payload.get("text") or ""
+        complete = bool(payload.get("textComplete", True)) and len(text) <= self.max_chars
+        budget = None if complete else min(payload.get("charsBudget") or self.max_chars, self.max_chars)
+        stored = dict(payload, text=text[: self.max_chars], textComplete=complete, charsBudget=budget)
+        # El índice por fragmentos cubre más que el texto entero (hasta index_max_chars)
+        indexed = text[: self.index_max_chars]
+        indexed_complete = bool(payload.get("textComplete", True)) and len(text) <= self.index_max_chars
+        chunks = [
+            (node_id, seq, start, start + len(piece), zlib.compress(piece.encode("utf-8"), 6))
+            for seq, (start, piece) in enumerate(
+                (i, indexed[i:i + self.chunk_chars]) for i in range(0, len(indexed), self.chunk_chars)
+            )
+        ]
+        with self._lock:
+            self._counters["puts"] += 1
+            self._mem_put(node_id, version, stored)
+            if self._db is None:
+                return
+            blob = zlib.compress(stored["text"].encode("utf-8"), 6)
+            stored_bytes = len(blob) + sum(len(c[4]) for c in chunks)
+            now = time.time()
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.execute("DELETE FROM text_chunks WHERE node_id = ?", (node_id,))
+                self._db.execute(
+                    "INSERT OR REPLACE INTO extracted_text "
+                    "(node_id, version, mime, note, bytes_read, download_truncated, text_complete, text_z, stored_bytes, "
+                    "created_at, accessed_at, chars_budget, extent, indexed_chars, indexed_complete) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (node_id, version, stored.get("mime") or "", stored.get("note") or "", int(stored.get("bytesRead") or 0),
+                     int(bool(stored.get("downloadTruncated"))), int(complete), blob, stored_bytes, now, now,
+                     budget, json.dumps(stored["extent"]) if stored.get("extent") else None,
+                     len(indexed), int(indexed_complete)),
+                )
+                self._db.executemany(
+                    "INSERT INTO text_chunks (node_id, seq, char_start, char_end, text_z) VALUES (?, ?, ?, ?, ?)", chunks,
+                )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+            self._enforce_disk_budget()
+
+    def index_info(self, node_id: str, version: str) -> Optional[Dict[str, Any]]:
+        """Cobertura del índice por fragmentos para esta versión: {"chars", "complete", "extent"} o None."""
+        if self._db is None:
+            return None
+        with self._lock:
+            row = self._db.execute(
+                "SELECT version, indexed_chars, indexed_complete, extent FROM extracted_text WHERE node_id = ?", (node_id,),
+            ).fetchone()
+        if row is None or row[0] != version or row[1] is None:
+            return None
+        return {"chars": row[1], "complete": bool(row[2]), "extent": json.loads(row[3]) if row[3] else None}
+
+    def read_window(self, node_id: str, version: str, start: int, length: int) -> Optional[Dict[str, Any]]:
+        """
+        Texto [start, start + length) leído solo de los fragmentos que se solapan con la
+        ventana. None si el índice no existe, es de otra versión o no llega hasta el final
+        de la ventana (y el documento sigue más allá).
+        """
+        if self._db is None:
+            return None
+        end = start + max(0, length)
+        with self._lock:
+            row = self._db.execute(
+                "SELECT version, indexed_chars, indexed_complete FROM extracted_text WHERE node_id = ?", (node_id,),
+            ).fetchone()
+            if row is None or row[0] != version or row[1] is None or (not row[2] and row[1] < end):
+                self._counters["windowMisses"] += 1
+                return None
+            rows = self._db.execute(
+                "SELECT char_start, text_z FROM text_chunks WHERE node_id = ? AND char_end > ? AND char_start < ? ORDER BY seq",
+                (node_id, start, end),
+            ).fetchall()
+            self._db.execute("UPDATE extracted_text SET accessed_at = ? WHERE node_id = ?", (time.time(), node_id))
+            self._counters["windowReads"] += 1
+            self._counters["chunksRead"] += len(rows)
+        pieces = [zlib.decompress(blob).decode("utf-8") for _, blob in rows]
+        first = rows[0][0] if rows else start
+        text = "".join(pieces)[start - first: end - first] if rows else ""
+        return {"text": text, "indexedChars": row[1], "complete": bool(row[2]), "chunksRead": len(rows)}
+
+    def _enforce_disk_budget(self) -> None:
+        total = self._db.execute("SELECT COALESCE(SUM(stored_bytes), 0) FROM extracted_text").fetchone()[0]
+        while total > self.disk_budget_bytes:
+            row = self._db.execute("SELECT node_id, stored_bytes FROM extracted_text ORDER BY accessed_at ASC LIMIT 1").fetchone()
+            if row is None:
+                break
+            self._db_delete(row[0])
+            total -= row[1] or 0
+            self._counters["diskEvictions"] += 1
+
+    def _db_delete(self, node_id: Optional[str] = None) -> int:
+        if node_id is None:
+            self._db.execute("DELETE FROM text_chunks")
+            return self._db.execute("DELETE FROM extracted_text").rowcount
+        self._db.execute("DELETE FROM text_chunks WHERE node_id = ?", (node_id,))
+        return self._db.execute("DELETE FROM extracted_text WHERE node_id = ?", (node_id,)).rowcount
+
+    def invalidate(self, node_id: Optional[str] = None) -> int:
+        """Invalida un nodo (o toda la caché si node_id es None). Devuelve entradas eliminadas."""
+        with self._lock:
+            if node_id is None:
+                removed = len(self._mem)
+                self._mem.clear()
+                self._mem_bytes = 0
+                if self._db is not None:
+                    removed = max(removed, self._db_delete())
+            else:
+                removed = 1 if node_id in self._mem else 0
+                self._mem_drop(node_id)
+                if self._db is not None:
+                    removed = max(removed, self._db_delete(node_id))
+            self._counters["invalidations"] += removed
+            return removed
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            disk_entries, disk_bytes, chunks = 0, 0, 0
+            if self._db is not None:
+                disk_entries, disk_bytes = self._db.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(stored_bytes), 0) FROM extracted_text"
+                ).fetchone()
+                chunks = self._db.execute("SELECT COUNT(*) FROM text_chunks").fetchone()[0]
+            return {
+                **self._counters,
+                "memoryEntries": len(self._mem),
+                "memoryBytes": self._mem_bytes,
+                "memoryBudgetBytes": self.memory_budget_bytes,
+                "diskEntries": disk_entries,
+                "diskBytes": disk_bytes,
+                "diskBudgetBytes": self.disk_budget_bytes,
+                "indexChunks": chunks,
+                "chunkChars": self.chunk_chars,
+                "indexMaxChars": self.index_max_chars,
+            }
+
+
+_cache: Optional[ExtractedTextCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_text_cache() -> Optional[ExtractedTextCache]:
+    """Caché compartida del proceso; None si TEXT_CACHE_ENABLED=false."""
+    global _cache
+    if not TEXT_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ExtractedTextCache()
+    return _cache
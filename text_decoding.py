@@ -0,0 +1,200 @@
+"""
+Decodificación de texto por niveles, de más barato a más caro:
+  1. BOM (UTF-8/16/32): la codificación es segura y no hace falta detectar nada.
+  2. UTF-8 estricto: se decodifica en C sin adivinar; casi todo el texto actual es UTF-8.
+  3. Detección con chardet sobre una muestra acotada (el inicio más una ventana alrededor
+     del primer byte inválido), nunca sobre el buffer entero.
+  4. Sin chardet, o con muy pocos bytes no ASCII en la muestra: cp1252 (superconjunto
+     imprimible de latin-1).
+
+IncrementalTextDecoder aplica lo mismo a trozos que llegan por la red, así la
+decodificación se solapa con la descarga.
+"""
+import os
+import time
+import codecs
+from typing import Any, List, Optional, Tuple
+
+try:
+    import chardet
+except Exception:
+    chardet = None
+
+# Bytes que se pasan a chardet como máximo cuando el texto no es UTF-8 válido
+DECODE_SAMPLE_BYTES = int(os.getenv("DECODE_SAMPLE_BYTES", str(64 * 1024)))
+DECODE_FALLBACK_ENCODING = os.getenv("DECODE_FALLBACK_ENCODING", "cp1252")
+# Con menos bytes no ASCII que estos en la muestra chardet adivina al azar (p.ej. cp850
+# por una sola "ó"): se usa la codificación de respaldo
+DECODE_MIN_HIGH_BYTES = int(os.getenv("DECODE_MIN_HIGH_BYTES", "16"))
+
+# UTF-32 antes que UTF-16: el BOM de UTF-32-LE empieza igual que el de UTF-16-LE
+_BOMS = (
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+)
+_MAX_BOM = 4
+_HIGH_BYTES = bytes(range(0x80, 0x100))
+
+# Lo que chardet devuelve para texto europeo occidental se decodifica como cp1252, que
+# además cubre comillas tipográficas y € (0x80-0x9F) que latin-1 dejaría como controles
+_ENCODING_ALIASES = {"ascii": DECODE_FALLBACK_ENCODING, "iso-8859-1": "cp1252", "latin-1": "cp1252"}
+# Páginas de códigos DOS/Mac: chardet las propone con texto occidental corto, pero en
+# documentos de un gestor documental son casi inexistentes
+_UNLIKELY_ENCODINGS = {
+    "cp437", "cp737", "cp775", "cp850", "cp852", "cp855", "cp857", "cp858", "cp860", "cp861",
+    "cp862", "cp863", "cp864", "cp865", "cp866", "cp869", "mac-roman", "mac-latin2",
+    "mac-cyrillic", "mac-greek", "mac-iceland", "mac-turkish",
+}
+
+
+def sniff_bom(head: bytes) -> Optional[str]:
+    for bom, encoding in _BOMS:
+        if head.startswith(bom):
+            return encoding
+    return None
+
+
+def _sample(data: Any, bad_pos: int) -> bytes:
+    # Inicio del texto + ventana centrada en el primer byte que no es UTF-8
+    half = DECODE_SAMPLE_BYTES // 2
+    head = bytes(data[:half])
+    if bad_pos < half:
+        return bytes(data[:DECODE_SAMPLE_BYTES])
+    start = max(half, bad_pos - half // 2)
+    return head + bytes(data[start:start + half])
+
+
+def detect_sample(sample: bytes) -> str:
+    """Codificación (no UTF-8) de una muestra, con chardet si está instalado."""
+    high_bytes = len(sample) - len(sample.translate(None, _HIGH_BYTES))
+    if chardet is not None and high_bytes >= DECODE_MIN_HIGH_BYTES:
+        try:
+            det = chardet.detect(sample)
+        except Exception:
+            det = None
+        if det and det.get("encoding"):
+            encoding = det["encoding"].lower()
+            if encoding.replace("_", "-") not in ("utf-8", "utf8"):
+                try:
+                    name = codecs.lookup(_ENCODING_ALIASES.get(encoding, encoding)).name
+                except LookupError:
+                    name = None
+                if name and name not in _UNLIKELY_ENCODINGS:
+                    return name
+    return DECODE_FALLBACK_ENCODING
+
+
+def decode_text(data: Any, final: bool = True) -> Tuple[str, str]:
+    """
+    Decodifica bytes (o un buffer: bytearray/mmap/memoryview) por niveles. Devuelve
+    (texto, codificación). Con final=False se acepta una secuencia multibyte cortada al
+    final (p.ej. al descargar con Range) y se descarta en lugar de sustituirla.
+    """
+    if not data:
+        return "", "utf-8"
+    # La vista se libera al salir: un mmap con vistas vivas no se puede cerrar
+    with memoryview(data) as view:
+        encoding = sniff_bom(bytes(view[:_MAX_BOM]))
+        if encoding is None:
+            try:
+                decoder = codecs.getincrementaldecoder("utf-8")("strict")
+                return decoder.decode(view, final=final), "utf-8"
+            except UnicodeDecodeError as e:
+                encoding = detect_sample(_sample(view, e.start))
+        decoder = codecs.getincrementaldecoder(encoding)("replace")
+        return decoder.decode(view, final=final), encoding
+
+
+class IncrementalTextDecoder:
+    """
+    Decodificador para trozos que llegan en orden. Mientras todo sea UTF-8 válido decodifica
+    cada trozo en cuanto llega; ante el primer byte inválido detecta la codificación sobre
+    la muestra (inicio retenido + trozo actual) y sigue con ella. Lo ya decodificado hasta
+    ese punto se conserva: en la práctica es ASCII, igual en ambas codificaciones.
+    """
+
+    def __init__(self):
+        self.encoding: Optional[str] = None
+        self.method = ""
+        self.seconds = 0.0
+        self.bytes_in = 0
+        self._decoder = None
+        self._pending = b""
+        self._head = bytearray()
+        self._parts: List[str] = []
+        self._chars = 0
+
+    def __len__(self) -> int:
+        return self._chars
+
+    def _emit(self, text: str) -> None:
+        if text:
+            self._parts.append(text)
+            self._chars += len(text)
+
+    def _start(self, encoding: str, method: str) -> None:
+        self.encoding = encoding
+        self.method = method
+        self._decoder = codecs.getincrementaldecoder(encoding)("strict" if method == "utf-8" else "replace")
+
+    def _select(self, head: bytes) -> None:
+        bom = sniff_bom(head[:_MAX_BOM])
+        if bom:
+            self._start(bom, "bom")
+        else:
+            self._start("utf-8", "utf-8")
+
+    def feed(self, chunk: bytes) -> None:
+        if not chunk:
+            return
+        t0 = time.perf_counter()
+        self.bytes_in += len(chunk)
+        if len(self._head) < DECODE_SAMPLE_BYTES // 2:
+            self._head += chunk[: DECODE_SAMPLE_BYTES // 2 - len(self._head)]
+        if self._decoder is None:
+            # Hasta tener 4 bytes no se puede descartar un BOM
+            self._pending += chunk
+            if len(self._pending) < _MAX_BOM:
+                self.seconds += time.perf_counter() - t0
+                return
+            chunk, self._pending = self._pending, b""
+            self._select(chunk)
+        self._decode(chunk, final=False)
+        self.seconds += time.perf_counter() - t0
+
+    def _decode(self, chunk: bytes, final: bool) -> None:
+        try:
+            self._emit(self._decoder.decode(chunk, final=final))
+        except UnicodeDecodeError as e:
+            if self.method != "utf-8":
+                raise
+            # Los bytes que el decodificador UTF-8 tenía a medias van delante del trozo
+            buffered = self._decoder.getstate()[0]
+            data = buffered + chunk
+            bad = max(0, e.start)
+            # Lo anterior al byte inválido (dentro de este trozo) sí era UTF-8 válido
+            good, _ = decode_text(data[:bad], final=True)
+            self._emit(good)
+            sample = bytes(self._head) + data[max(0, bad - DECODE_SAMPLE_BYTES // 4): bad + DECODE_SAMPLE_BYTES // 4]
+            self._start(detect_sample(sample), "detected")
+            self._emit(self._decoder.decode(data[bad:], final=final))
+
+    def finish(self) -> str:
+        t0 = time.perf_counter()
+        if self._decoder is None and self._pending:
+            chunk, self._pending = self._pending, b""
+            self._select(chunk)
+            self._decode(chunk, final=True)
+        elif self._decoder is not None:
+            self._decode(b"", final=True)
+        self.seconds += time.perf_counter() - t0
+        return self.text()
+
+    def text(self) -> str:
+        """Texto decodificado hasta ahora (sin la posible secuencia cortada del final)."""
+        if len(self._parts) > 1:
+            self._parts = ["".join(self._parts)]
+        return self._parts[0] if self._parts else ""